@@ -1,3 +1,26 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
 
-from automagica.activities import *
+import importlib
+
+
+def __getattr__(name):
+    """
+    Activities are imported on first use (`from automagica import *` or
+    `automagica.print_console`), so importing fe. the CLI stays fast
+    """
+    if name.startswith("__") and name != "__all__":
+        raise AttributeError(
+            "module {!r} has no attribute {!r}".format(__name__, name)
+        )
+
+    activities = importlib.import_module("automagica.activities")
+
+    if name == "__all__":
+        return activities.__all__ + list(activities._LAZY_ACTIVITIES)
+
+    # `from automagica import *` gets a proxy for the lazy activities (fe.
+    # Chrome), which imports them when they are used
+    if name in activities._LAZY_ACTIVITIES and name not in vars(activities):
+        return activities._LazyActivity(name)
+
+    return getattr(activities, name)
@@ -1,9 +1,61 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
 
-from .utilities import activity, only_supported_for, interpret_path
-import selenium.webdriver
+import importlib
 import logging
 
+from .utilities import activity, only_supported_for, interpret_path
+
+# Activities living in their own module because of expensive imports,
+# these are imported on first use (see __getattr__)
+_LAZY_ACTIVITIES = {"Chrome": "automagica.browser"}
+
+
+class _LazyActivity:
+    """
+    Stands in for a lazily loaded activity in `from automagica import *`,
+    imports it on first use
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def _load(self):
+        return getattr(importlib.import_module(__name__), self._name)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return "<lazy activity {}>".format(self._name)
+
+
+def __getattr__(name):
+    """
+    Import lazily loaded activities on first use
+    """
+    if name == "__all__":
+        # Lazy activities are also in globals() once imported, but are left
+        # out so a wildcard import does not import them
+        return [
+            key
+            for key in list(globals())
+            if not key.startswith("_") and key not in _LAZY_ACTIVITIES
+        ]
+
+    if name in _LAZY_ACTIVITIES:
+        module = importlib.import_module(_LAZY_ACTIVITIES[name])
+        globals()[name] = getattr(module, name)
+
+        return globals()[name]
+
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
 """
 Cryptography
 Icon: las la-shield-alt
@@ -1078,712 +1130,6 @@ def print_console(data="Example print"):
     print(data)
 
 
-"""
-Browser
-Icon: lab la-chrome
-"""
-
-
-class Chrome(selenium.webdriver.Chrome):
-    @activity
-    def __init__(
-        self,
-        load_images=True,
-        headless=False,
-        incognito=False,
-        disable_extension=False,
-        maximize_window=True,
-        focus_window=True,
-        auto_update_chromedriver=True,
-    ):
-        """Open Chrome Browser
-
-        Open the Chrome Browser with the Selenium webdriver. Can be used to automate manipulations in the browser.
-        Different elements can be found as:
-
-        -   Xpath: e.g. browser.find_element_by_xpath() or browser.xpath()
-        One can easily find an xpath by right clicking an element -> inspect. Look for the element in the menu and right click -> copy -> xpath
-        find_element_by_id
-        -   Name: find_element_by_name
-        -   Link text: find_element_by_link_text
-        -   Partial link text: find_element_by_partial_link_text
-        -   Tag name: find_element_by_tag_name
-        -   Class name: find_element_by_class_name
-        -   Css selector: find_element_by_css_selector
-
-        Elements can be manipulated by:
-
-        - Clicking: e.g. element.click()
-        - Typing: e.g. element.send_keys()
-
-        :parameter load_images: Do not load images (bool). This could speed up loading pages
-        :type load_images: bool, optional
-        :parameter headless: Run headless, this means running without a visible window (bool)
-        :type headless: bool, optional
-        :parameter incognito: Run in incognito mode
-        :type incognito: bool, optional
-        :parameter disable_extension: Disable extensions
-        :type disable_extension: bool, optional
-        :parameter auto_update_chromedriver: Automatically update Chromedriver
-        :type auto_update_chromedriver: bool, optional
-        :parameter maximize_window: Maximize window
-        :type maximize_window: bool, optional
-        :parameter focus_window: Focus window
-        :type focus_window: bool, optional
-
-        :return: webdriver: Selenium Webdriver
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://automagica.com')
-        >>> # Close browser
-        >>> browser.quit()
-
-        Keywords
-            chrome, browsing, browser, internet, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            lab la-chrome
-
-        """
-        import platform
-        import os
-
-        # Check what OS we are on
-        if platform.system() == "Linux":
-            chromedriver_path = "bin/linux64/chromedriver"
-
-        elif platform.system() == "Windows":
-            chromedriver_path = "\\bin\\win32\\chromedriver.exe"
-
-            if auto_update_chromedriver:
-                self.download_latest_driver(chromedriver_path)
-        else:
-            chromedriver_path = "bin/mac64/chromedriver"
-
-        chrome_options = selenium.webdriver.ChromeOptions()
-
-        if incognito:
-            chrome_options.add_argument("--incognito")
-
-        if disable_extension:
-            # To disable the error message popup: "Loading of unpacked extensions is disabled by the administrator"
-            chrome_options.add_experimental_option(
-                "useAutomationExtension", False
-            )
-        if headless:
-            chrome_options.add_argument("--headless")
-
-        if not load_images:
-            prefs = {"profile.managed_default_content_settings.images": 2}
-            chrome_options.add_experimental_option("prefs", prefs)
-
-        chrome_options.add_experimental_option(
-            "excludeSwitches", ["enable-logging"]
-        )
-
-        selenium.webdriver.Chrome.__init__(
-            self,
-            os.path.abspath(__file__).replace(
-                os.path.basename(os.path.realpath(__file__)), ""
-            )
-            + chromedriver_path,
-            chrome_options=chrome_options,
-        )
-
-        if maximize_window:
-            self.maximize_window()
-
-        if focus_window:
-            self.switch_to.window(self.current_window_handle)
-
-    def download_latest_driver(self, chromedriver_path):
-        """ Downloads latest Chrome driver on Windows """
-        import subprocess  # nosec
-        from automagica.httpclient import http_client
-        import os
-        from io import BytesIO
-        import zipfile
-        import shutil
-
-        from packaging import version
-
-        # Retrieve CHrome version
-        process = subprocess.Popen(
-            [
-                "reg",
-                "query",
-                "HKEY_CURRENT_USER\\Software\\Google\\Chrome\\BLBeacon",
-                "/v",
-                "version",
-            ],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-            stdin=subprocess.DEVNULL,
-        )
-        chrome_version = (
-            process.communicate()[0].decode("UTF-8").strip().split()[-1]
-        )
-
-        # Extract Chrome major version (f.e. for 85.1.33.122 it's 85)
-        chrome_major = int(chrome_version.split(".")[0])
-
-        # Chromedriver absolute path
-        driver_path = (
-            os.path.abspath(__file__).replace(
-                os.path.basename(os.path.realpath(__file__)), ""
-            )
-            + chromedriver_path
-        )
-
-        download = False
-
-        # Driver exists
-        if os.path.exists(driver_path):
-            # Get Chromedriver version
-            chromedriver_version = str(
-                subprocess.check_output(
-                    ["cmd.exe", "/c", str(driver_path + " --v")]
-                )
-            )
-
-            # Is this the appropriate webdriver version for this Chrome major version?
-            if str(chrome_major) not in chromedriver_version.split(".")[0]:
-                download = True
-
-        # Driver does not exist
-        else:
-            download = True
-
-        if download:
-            # Retrieve latest release for the webdriver for this Chrome major version
-            latest_version = http_client.get(
-                f"https://chromedriver.storage.googleapis.com/LATEST_RELEASE_{chrome_major}"
-            ).text
-
-            request = http_client.get(
-                f"https://chromedriver.storage.googleapis.com/{latest_version}/chromedriver_win32.zip"
-            )
-
-            # Convert request content data to Zipfile object
-            file = zipfile.ZipFile(BytesIO(request.content))
-
-            driver_folder_path = os.path.dirname(driver_path)
-
-            # Forcefully remove the directory containing the webdriver
-            if os.path.exists(driver_folder_path):
-                shutil.rmtree(driver_folder_path)
-
-            # Create directory
-            os.makedirs(driver_folder_path, exist_ok=True)
-
-            # Extract to the webdriver location
-            file.extractall(driver_folder_path)
-
-    @activity
-    def save_all_images(self, output_path=None):
-        """Save all images
-
-        Save all images on current page in the Browser
-
-        :parameter output_path: Path where images can be saved. Default value is home directory.
-        :type output_path: output_dir, optional
-
-        :return: List with paths to images
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://www.nytimes.com/')
-        >>> # Save all images
-        >>> browser.save_all_images()
-        >>> browser.quit()
-        ['C:\\Users\\<username>\\image1.png', 'C:\\Users\\<username>\\image2.jpg', 'C:\\Users\\<username>\\image4.gif']
-
-        Keywords
-            image scraping, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-images
-
-        """
-        from automagica.httpclient import http_client
-        import os
-        from urllib.parse import urlparse
-
-        output_path = interpret_path(output_path)
-
-        paths = []
-
-        images = self.find_elements_by_tag_name("img")
-
-        for image in images:
-            url = image.get_attribute("src")
-            a = urlparse(url)
-            filename = os.path.basename(a.path)
-
-            if filename:
-                with open(os.path.join(output_path, filename), "wb") as f:
-                    try:
-                        r = http_client.get(url)
-                        f.write(r.content)
-                        paths.append(os.path.join(output_path, filename))
-                    except Exception:
-                        logging.exception()
-
-        return paths
-
-    @activity
-    def browse_to(self, url):
-        """Browse to URL
-
-        Browse to URL.
-
-        :parameter url: Url to browser to
-        :type url: string
-
-        :return: Webpage
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.browse_to('https://nytimes.com')
-
-        Keywords
-            chrome, element, browse to, browse, surf, surf to, go to, get, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            lab la-chrome
-
-        """
-        return self.get(url)
-
-    @activity
-    def find_elements_by_text(self, text):
-        """Find elements by text
-
-        Find all elements by their text. Text does not need to match exactly, part of text is enough.
-
-        :parameter text: Text to find elements by
-        :type text: string
-
-        :return: Elements that matched with text
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://nytimes.com')
-        >>> # Find elements by text
-        >>> browser.find_elements_by_text('world')
-        [webelement1, webelement2 , .. ]
-
-        Keywords
-            element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-align-center
-
-        """
-        return self.find_elements_by_xpath(
-            "//*[contains(text(), '"
-            + text.lower()
-            + "')] | //*[@value='"
-            + text.lower()
-            + "']"
-        )
-
-    @activity
-    def find_all_links(self, contains=""):
-        """Find all links
-
-        Find all links on a webpage in the browser
-
-        :parameter contains: Criteria of substring that url must contain to be included
-        :type contains: string, optional
-
-        :return: Links
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://nytimes.com')
-        >>> # Find elements by text
-        >>> browser.find_all_links()
-        [webelement1, webelement2 , .. ]
-
-        Keywords
-            random, element,link, links element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-window-restore
-        """
-        links = []
-        for element in self.find_elements_by_xpath("//a[@href]"):
-            try:
-                href_el = element.get_attribute("href")
-                if contains:
-                    if contains in element.get_attribute("href"):
-                        links.append(element.get_attribute("href"))
-                else:
-                    links.append(href_el)
-            except:
-                pass
-
-        if links:
-            return links
-
-    @activity
-    def find_first_link(self, contains=None):
-        """Find first link on a webpage
-
-        Find first link on a webpage
-
-        :parameter contains: Criteria of substring that url must contain to be included
-        :type contains: string, optional
-
-        :return: First link
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://nytimes.com')
-        >>> # Find elements by text
-        >>> browser.find_first_link()
-
-
-        Keywords
-            random, link, links, element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-window-restore
-        """
-        for element in self.find_elements_by_xpath("//a[@href]"):
-            try:
-                href_el = element.get_attribute("href")
-                if contains:
-                    if contains in href_el:
-                        return href_el
-                else:
-                    return href_el
-            except:
-                pass
-
-    @activity
-    def get_text_on_webpage(self):
-        """Get all text on webpage
-
-        Get all the raw body text from current webpage
-
-        :return: Text
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://nytimes.com')
-        >>> # Get text from page
-        >>> browser.get_text_on_webpage()
-
-        Keywords
-            random, link, links, element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-window-restore
-        """
-
-        return self.find_element_by_tag_name("body").text
-
-    @activity
-    def highlight(self, element):
-        """Highlight element
-
-        Highlight elements in yellow in the browser
-
-        :parameter element: Element to highlight
-        :type element: selenium.webdriver.remote.webelement.WebElement
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://wikipedia.org')
-        >>> # Find first link on page
-        >>> first_link = browser.find_elements_by_xpath("//a[@href]")[0]
-        >>> # Highlight first link
-        >>> browser.highlight(first_link)
-
-        Keywords
-            element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-highlighter
-
-        """
-        driver = element._parent
-
-        def apply_style(s):
-            driver.execute_script(
-                "arguments[0].setAttribute('style', arguments[1]);", element, s
-            )
-
-        apply_style("background: yellow; border: 2px solid red;")
-
-    @activity
-    def exit(self):
-        """Exit the browser
-
-        Quit the browser by exiting gracefully. One can also use the native 'quit' function
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://automagica.com')
-        >>> # Close browser
-        >>> browser.exit()
-
-
-        Keywords
-            quit, exit, close, element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-window-close
-
-        """
-        self.quit()
-
-    @activity
-    def by_xpaths(self, element):
-        """Find all XPaths
-
-        Find all elements with specified xpath on a webpage in the the browser. Can also use native 'find_elements_by_xpath'
-
-        :parameter element: Xpath of element
-        :type element: string, optional
-
-        :return: Element by xpaths
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://wikipedia.org')
-        >>> # Find elements by xpaths
-        >>> browser.by_xpaths('//*[@id=\'js-link-box-en\']')
-        [webelement1, webelement2 , .. ]
-
-        Keywords
-            random, element, xpath, xml, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-times
-
-        """
-        return self.find_elements_by_xpath(element)
-
-    @activity
-    def by_xpath(self, element):
-        """Find XPath in browser
-
-        Find all element with specified xpath on a webpage in the the browser. Can also use native 'find_elements_by_xpath'
-
-        :parameter element: Xpath of element
-        :type element: string, optional
-
-        :return: Element by xpath
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://wikipedia.org')
-        >>> # Find element by xpath
-        >>> element = browser.by_xpath('//*[@id=\'js-link-box-en\']')
-        >>> # We can now use this element, for example to click on
-        >>> element.click()
-
-        Keywords
-            random, xpath, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-times
-
-        """
-        return self.find_element_by_xpath(element)
-
-    @activity
-    def by_class(self, element):
-        """Find class in browser
-
-        Find element with specified class on a webpage in the the browser. Can also use native 'find_element_by_class_name'
-
-        :parameter element: Class of element
-        :type element: string, optional
-
-        :return: Element by class
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://wikipedia.org')
-        >>> # Find element by class
-        >>> element = browser.by_class('search-input')
-        >>> # We can now use this element, for example to click on
-        >>> element.click()
-
-        Keywords
-            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-times
-
-        """
-        return self.find_element_by_class_name(element)
-
-    @activity
-    def by_classes(self, element):
-        """Find class in browser
-
-        Find all elements with specified class on a webpage in the the browser. Can also use native 'find_elements_by_class_name' function
-
-        :parameter element: Class of element
-        :type element: string, optional
-
-        :return: Element by classes
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://wikipedia.org')
-        >>> # Find elements by class
-        >>> elements = browser.by_classes('search-input')
-
-        Keywords
-            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-times
-
-        """
-        return self.find_elements_by_class_name(element)
-
-    @activity
-    def by_class_and_by_text(self, element, text):
-        """Find element in browser based on class and text
-
-        Find all elements with specified class and text on a webpage in the the browser.
-
-        :parameter element: Class of element
-        :type element: string
-        :parameter text: Text inside the element
-        :type text: string
-
-        :return: Element by class and text
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://wikipedia.org')
-        >>> # Find elements by class and text
-        >>> element = browser.by_class_and_by_text('search-input', 'Search Wikipedia')
-        >>> # We can now use this element, for example to click on
-        >>> element.click()
-
-        Keywords
-            browser, class, text, name classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-times
-
-        """
-        for element in self.find_elements_by_class_name(element):
-            if text in element.text:
-                return element
-
-    @activity
-    def by_id(self, element):
-        """Find id in browser
-
-        Find element with specified id on a webpage in the the browser. Can also use native 'find_element_by_id' function
-
-        :parameter element: Id of element
-        :type element: string, optional
-
-        :return: Element by id
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://wikipedia.org')
-        >>> # Find element by class
-        >>> elements = browser.by_id('search-input')
-        >>> # We can now use this element, for example to click on
-        >>> element.click()
-
-        Keywords
-            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-times
-
-        """
-        return self.find_element_by_id(element)
-
-    @activity
-    def switch_to_iframe(self, name="iframe"):
-        """Switch to iframe in browser
-
-        Switch to an iframe in the browser
-
-        :parameter name: Name of the Iframe
-        :type name: string, optional
-
-            :Example:
-
-        >>> # Open the browser
-        >>> browser = Chrome()
-        >>> # Go to a website
-        >>> browser.get('https://www.w3schools.com/html/html_iframe.asp')
-        >>> # Switch to iframe
-        >>> browser.switch_to_iframe()
-
-        Keywords
-            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
-
-        Icon
-            las la-times
-
-        """
-
-        self.switch_to.frame(self.find_element_by_tag_name("iframe"))
-
-
 """
 Credential Management
 Icon: las la-key
@@ -2961,26 +2307,22 @@ def random_screen_snippet(size=100, output_path=None):
         las la-crop-alt
 
     """
-    only_supported_for("Windows", "Darwin")
-
-    import PIL.ImageGrab
-
-    img = PIL.ImageGrab.grab()
-
-    width, height = img.size
-
     import random
 
-    random_left = random.randrange(1, width, 1)
-    random_top = random.randrange(1, height, 1)
+    width, height = get_screen_dimensions()
 
-    left, top, right, bottom = (
-        random_left,
-        random_top,
-        random_left + size,
-        random_top + size,
+    # Keep the snippet on the screen
+    random_left = random.randrange(0, max(1, width - size), 1)
+    random_top = random.randrange(0, max(1, height - size), 1)
+
+    cropped = capture_screen(
+        (
+            random_left,
+            random_top,
+            min(width, random_left + size),
+            min(height, random_top + size),
+        )
     )
-    cropped = img.crop((left, top, right, bottom))
 
     if not output_path:
         output_path = interpret_path(
@@ -3019,11 +2361,7 @@ def take_screenshot(output_path=None):
         las la-expand
 
     """
-    only_supported_for("Windows", "Darwin")
-
-    import PIL.ImageGrab
-
-    img = PIL.ImageGrab.grab()
+    img = capture_screen()
 
     output_path = interpret_path(
         path=output_path, default_filename="screenshot.jpg"
@@ -8010,8 +7348,7 @@ def download_file_from_url(url, output_path=None):
     Icon
         las la-cloud-download-alt
     """
-    from automagica.httpclient import http_client
-    import re
+    from automagica.transfers import download_url
     import os
     from urllib.parse import urlparse
 
@@ -8020,16 +7357,50 @@ def download_file_from_url(url, output_path=None):
 
     output_path = interpret_path(output_path, default_filename=filename)
 
-    r = http_client.get(url, stream=True)
+    return download_url(url, output_path)
 
-    if r.status_code == 200:
-        with open(output_path, "wb") as f:
-            f.write(r.content)
 
-        return output_path
+@activity
+def download_files_from_urls(urls, output_folder=None, max_downloads=4):
+    """Download files from URLs
 
-    else:
-        raise Exception("Could not download file from {}".format(url))
+    Download multiple files from URLs at the same time
+
+    :parameter urls: List of source URLs to download files from
+    :type urls: list
+    :parameter output_folder: Target folder, defaults to homedir
+    :type output_folder: output_dir, optional
+    :parameter max_downloads: Maximum number of simultaneous downloads
+    :type max_downloads: int, optional
+
+    :return: List of target paths
+
+        :Example:
+
+    >>> # Download two pictures from the wikipedia robot page
+    >>> picture_urls = ['https://upload.wikimedia.org/wikipedia/commons/thumb/6/6c/Atlas_from_boston_dynamics.jpg/220px-Atlas_from_boston_dynamics.jpg', 'https://upload.wikimedia.org/wikipedia/commons/thumb/0/05/HONDA_ASIMO.jpg/220px-HONDA_ASIMO.jpg']
+    >>> download_files_from_urls(picture_urls)
+    ['C:\\Users\\<username>\\220px-Atlas_from_boston_dynamics.jpg', 'C:\\Users\\<username>\\220px-HONDA_ASIMO.jpg']
+
+    Keywords
+        download, download url, save, request, batch, multiple
+
+    Icon
+        las la-cloud-download-alt
+    """
+    from automagica.transfers import download_url, transfer_all
+    import os
+    from urllib.parse import urlparse
+
+    transfers = []
+
+    for url in urls:
+        filename = os.path.basename(urlparse(url).path)
+        transfers.append(
+            (url, interpret_path(output_folder, default_filename=filename))
+        )
+
+    return transfer_all(download_url, transfers, max_workers=max_downloads)
 
 
 """
@@ -9594,47 +8965,17 @@ def extract_text_ocr(file_path=None):
         lab la-readme
     """
 
-    from automagica.httpclient import http_client
-    import base64
-    import os
-    import json
+    from automagica.ocr import recognize
 
-    if not file_path:
-        file_path = interpret_path(file_path, default_filename="ocr_temp.jpg")
-        import PIL.ImageGrab
+    if file_path:
+        from PIL import Image
 
-        img = PIL.ImageGrab.grab()
-        img.save(file_path, "JPEG")
-    else:
-        file_path = interpret_path(file_path)
-
-    # Open file and encode as Base 64
-    with open(file_path, "rb") as f:
-        image_base64 = base64.b64encode(f.read()).decode("utf-8")
+        image = Image.open(interpret_path(file_path))
 
-    # Get Bot API_key
-    config_path = os.path.join(os.path.expanduser("~"), "automagica.json")
-
-    # Read JSON
-    with open(config_path) as json_file:
-        local_data = json.load(json_file)
-        api_key = str(local_data.get("bot_secret"))  # Your API key
-
-    # Prepare data for request
-    data = {"image_base64": image_base64, "api_key": api_key}
-
-    # Post request to API
-    url = (
-        os.environ.get(
-            "AUTOMAGICA_PORTAL_URL", "https://portal.automagica.com"
-        )
-        + "/api/ocr/find-text-locations"
-    )
-
-    r = http_client.post(url, json=data)
+    else:
+        image = capture_screen()
 
-    # Print results
-    return r.json()["text"]
+    return recognize(image)["text"]
 
 
 @activity
@@ -9667,50 +9008,10 @@ def find_text_on_screen_ocr(text, criteria=None):
 
     """
 
-    from automagica.httpclient import http_client
-    import base64
-    import os
-    import json
-
-    import PIL.ImageGrab
-
-    img = PIL.ImageGrab.grab()
-    path = os.path.join(os.path.expanduser("~"), "ocr_capture.jpg")
-    img.save(path, "JPEG")
-
-    # Open file and encode as Base 64
-    with open(path, "rb") as f:
-        image_base64 = base64.b64encode(f.read()).decode("utf-8")
-
-    # Get Bot API_key
-    config_path = os.path.join(os.path.expanduser("~"), "automagica.json")
-
-    # Read JSON
-    with open(config_path) as json_file:
-        local_data = json.load(json_file)
-        api_key = str(local_data.get("bot_secret"))  # Your API key
-
-    # Prepare data for request
-    data = {"image_base64": image_base64, "api_key": api_key}
-
-    # Post request to API
-    url = (
-        os.environ.get(
-            "AUTOMAGICA_PORTAL_URL", "https://portal.automagica.com"
-        )
-        + "/api/ocr/find-text-locations"
-    )
-
-    r = http_client.post(url, json=data)
-
-    # Print results
-    data = r.json()["locations"]
+    from automagica.ocr import ocr_session
 
     # Find all matches
-    matches = []
-    for item in data:
-        if item["text"].lower() == text.lower():
-            matches.append(item)
+    matches = ocr_session.find(text)
 
     if not matches:
         return None
@@ -9733,15 +9034,17 @@ def find_text_on_screen_ocr(text, criteria=None):
 
 
 @activity
-def click_on_text_ocr(text, delay=1):
+def click_on_text_ocr(text, delay=1, similarity=None):
     """Click on text with OCR
 
     This activity clicks on position (coordinates) of specified text on the current screen using OCR.
 
-    :parameter text: Text to find. Only exact matches are returned.
+    :parameter text: Text to find, case-insensitive
     :type text: string
     :parameter delay: Delay before clicking in seconds
     :type delay: int, optional
+    :parameter similarity: Also match similar texts if the text is not found exactly, from 0 to 1 (e.g. 0.8). By default only the exact text is matched.
+    :type similarity: float, optional
 
         :Example:
 
@@ -9763,8 +9066,12 @@ def click_on_text_ocr(text, delay=1):
 
         sleep(delay)
 
-    position = find_text_on_screen_ocr(text, criteria="first")
-    if position:
+    from automagica.ocr import ocr_session
+
+    matches = ocr_session.find(text, similarity=similarity)
+
+    if matches:
+        position = matches[0]
 
         x = int(position["x"] + position["w"] / 2)
         y = int(position["y"] + position["h"] / 2)
@@ -9776,15 +9083,17 @@ def click_on_text_ocr(text, delay=1):
 
 
 @activity
-def double_click_on_text_ocr(text, delay=1):
+def double_click_on_text_ocr(text, delay=1, similarity=None):
     """Double click on text with OCR
 
     This activity double clicks on position (coordinates) of specified text on the current screen using OCR.
 
-    :parameter text: Text to find. Only exact matches are returned.
+    :parameter text: Text to find, case-insensitive
     :type text: string
     :parameter delay: Delay before clicking in seconds
     :type delay: int, optional
+    :parameter similarity: Also match similar texts if the text is not found exactly, from 0 to 1 (e.g. 0.8). By default only the exact text is matched.
+    :type similarity: float, optional
 
         :Example:
 
@@ -9807,8 +9116,12 @@ def double_click_on_text_ocr(text, delay=1):
 
         sleep(delay)
 
-    position = find_text_on_screen_ocr(text, criteria="first")
-    if position:
+    from automagica.ocr import ocr_session
+
+    matches = ocr_session.find(text, similarity=similarity)
+
+    if matches:
+        position = matches[0]
 
         x = int(position["x"] + position["w"] / 2)
         y = int(position["y"] + position["h"] / 2)
@@ -9820,15 +9133,17 @@ def double_click_on_text_ocr(text, delay=1):
 
 
 @activity
-def right_click_on_text_ocr(text, delay=1):
+def right_click_on_text_ocr(text, delay=1, similarity=None):
     """Right click on text with OCR
 
     This activity Right clicks on position (coordinates) of specified text on the current screen using OCR.
 
-    :parameter text: Text to find. Only exact matches are returned.
+    :parameter text: Text to find, case-insensitive
     :type text: string
     :parameter delay: Delay before clicking in seconds
     :type delay: int, optional
+    :parameter similarity: Also match similar texts if the text is not found exactly, from 0 to 1 (e.g. 0.8). By default only the exact text is matched.
+    :type similarity: float, optional
 
         :Example:
 
@@ -9851,8 +9166,12 @@ def right_click_on_text_ocr(text, delay=1):
 
         sleep(delay)
 
-    position = find_text_on_screen_ocr(text, criteria="first")
-    if position:
+    from automagica.ocr import ocr_session
+
+    matches = ocr_session.find(text, similarity=similarity)
+
+    if matches:
+        position = matches[0]
 
         x = int(position["x"] + position["w"] / 2)
         y = int(position["y"] + position["h"] / 2)
@@ -10637,37 +9956,19 @@ def get_screen_dimensions():
     """
     Returns primary screen width and height in pixels
     """
-    import mss
+    from automagica.screen import get_grabber
 
-    with mss.mss() as sct:
+    return get_grabber().size
 
-        # Find primary monitor
-        for monitor in sct.monitors:
-            if monitor["left"] == 0 and monitor["top"] == 0:
-                break
 
-    return monitor["width"], monitor["height"]
-
-
-def capture_screen():
+def capture_screen(region=None):
     """
-    Captures the screen to a Pillow Image object
+    Captures the screen or a region (left, top, right, bottom) of it to a
+    Pillow Image object
     """
-    from PIL import Image
-    import mss
+    from automagica.screen import get_grabber
 
-    with mss.mss() as sct:
-
-        # Find primary monitor
-        for monitor in sct.monitors:
-            if monitor["left"] == 0 and monitor["top"] == 0:
-                break
-
-        sct_img = sct.grab(monitor)
-
-    img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-
-    return img
+    return get_grabber().grab_image(region)
 
 
 def insert_cell_below(content, type_="code"):
@@ -10694,55 +9995,15 @@ def insert_cell_below(content, type_="code"):
 
 
 def detect_vision(automagica_id, detect_target=True):
-    from automagica.httpclient import http_client
-    from io import BytesIO
-    import os
-    import base64
-    import json
-
-    screenshot = capture_screen()
-
-    # Convert to base64
-    buffered = BytesIO()
-    screenshot.save(buffered, format="PNG")
-    image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-    # Get Bot API_key
-    config_path = os.path.join(os.path.expanduser("~"), "automagica.json")
-
-    # Read JSON
-    with open(config_path) as json_file:
-        local_data = json.load(json_file)
-        bot_secret = str(local_data.get("bot_secret"))
-
-    data = {
-        "bot_secret": bot_secret,  # Automagica Bot Secret
-        "automagica_id": automagica_id,
-        "image_base64": image_base64,  # Screenshot of the example screen
-        "detect_target": detect_target,
-    }
-
-    portal_url = local_data.get("portal_url")
-
-    if not portal_url:
-        portal_url = "https://portal.automagica.com"
-
-    url = portal_url + "/api/wand/detect"
-
-    r = http_client.post(url, json=data)
-
-    try:
-        data = r.json()
-
-    except Exception:
-        raise Exception(
-            "An unknown error occurred accessing the Automagica Portal API. Please try again later."
-        )
-
-    if data.get("error"):
-        raise Exception(data["error"])
+    """
+    Returns the location of an element on the screen, detected locally
+    from the stored Wand templates or by the Automagica Portal
+    """
+    from automagica.vision import detect_element
 
-    return data["location"]
+    return detect_element(
+        automagica_id, capture_screen(), detect_target=detect_target
+    )
 
 
 def get_center_of_rectangle(rectangle):
@@ -10825,24 +10086,11 @@ def wait_appear(automagica_id, delay=1, timeout=30):
         las la-eye
     """
     from time import sleep
+    from automagica.vision import wait_element
 
     sleep(delay)  # Default delay
 
-    increment = 5
-
-    for _ in range(int(timeout / increment)):
-        try:
-            _ = detect_vision(automagica_id)
-            break
-        except Exception:
-            logging.exception()
-
-        sleep(increment)
-
-    else:
-        raise Exception(
-            "Element did not appear within {} seconds".format(timeout)
-        )
+    wait_element(automagica_id, timeout=timeout)
 
 
 @activity
@@ -10874,23 +10122,11 @@ def wait_vanish(automagica_id, delay=1, timeout=30):
         las la-eye
     """
     from time import sleep
+    from automagica.vision import wait_element
 
     sleep(delay)  # Default delay
 
-    increment = 5
-
-    for _ in range(int(timeout / increment)):
-        try:
-            _ = detect_vision(automagica_id)
-        except Exception:
-            break
-
-        sleep(increment)
-
-    else:
-        raise Exception(
-            "Element did not disappear within {} seconds".format(timeout)
-        )
+    wait_element(automagica_id, vanish=True, timeout=timeout)
 
 
 @activity
@@ -10921,46 +10157,11 @@ def read_text(automagica_id, delay=1):
     Icon
         las la-eye
     """
-    from io import BytesIO
-    from automagica.httpclient import http_client
-    import base64
-    import os
-    import json
-
     from time import sleep
+    from automagica.ocr import recognize
 
     sleep(delay)  # Default delay
 
     location = detect_vision(automagica_id, detect_target=False)
 
-    screenshot = capture_screen()
-
-    image = screenshot.crop(location)
-
-    buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-    # Get Bot API_key
-    config_path = os.path.join(os.path.expanduser("~"), "automagica.json")
-
-    # Read JSON
-    with open(config_path) as json_file:
-        local_data = json.load(json_file)
-        api_key = str(local_data.get("bot_secret"))  # Your API key
-
-    # Prepare data for request
-    data = {"image_base64": image_base64, "api_key": api_key}
-
-    # Post request to API
-    url = (
-        os.environ.get(
-            "AUTOMAGICA_PORTAL_URL", "https://portal.automagica.com"
-        )
-        + "/api/ocr/find-text-locations"
-    )
-
-    r = http_client.post(url, json=data)
-
-    # Print results
-    return r.json()["text"]
+    return recognize(capture_screen(location))["text"]
@@ -1,13 +1,23 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
+
 import code
+import itertools
 import logging
+import multiprocessing
 import os
 import queue
 import sys
-from io import StringIO
-from queue import Empty
-from threading import Thread
-from time import sleep
+from threading import Event, Lock, Thread, get_ident
+
+# Put on the command queue to stop the bot thread
+_STOP = object()
+
+# Output routes (stdout, stderr) by thread identifier
+_ROUTES = {}
+
+# Threads passing on routed output, what they write meanwhile (e.g. a log
+# handler printing) is not routed again
+_EMITTING = set()
 
 
 class ConsoleHandler(logging.Handler):
@@ -61,6 +71,108 @@ class ModifiedInterpreter(code.InteractiveInterpreter):
         return False
 
 
+class OutputRoute:
+    """
+    Collects the output a thread writes and passes it on line by line. Lines
+    longer than max_buffer characters are passed on in parts.
+    """
+
+    def __init__(self, emit, max_buffer=8192):
+        self.emit = emit
+        self.max_buffer = max_buffer
+        self.buffer = []
+        self.size = 0
+
+    def write(self, text):
+        if "\n" in text:
+            lines, _, rest = text.rpartition("\n")
+            self.buffer.append(lines)
+            self.flush()
+
+            text = rest
+
+        if text:
+            self.buffer.append(text)
+            self.size += len(text)
+
+            if self.size >= self.max_buffer:
+                self.flush()
+
+    def flush(self):
+        if self.buffer:
+            text = "".join(self.buffer)
+            self.buffer.clear()
+            self.size = 0
+
+            _EMITTING.add(get_ident())
+
+            try:
+                self.emit(text)
+            finally:
+                _EMITTING.discard(get_ident())
+
+
+class OutputMultiplexer:
+    """
+    Replaces sys.stdout or sys.stderr, sending what routed threads write to
+    their OutputRoute and everything else to the original stream
+    """
+
+    def __init__(self, stream, index):
+        self.stream = stream
+        self.index = index  # 0 for stdout, 1 for stderr
+
+    def write(self, text):
+        routes = _ROUTES.get(get_ident())
+
+        if routes is not None and get_ident() not in _EMITTING:
+            routes[self.index].write(text)
+            return len(text)
+
+        if self.stream is None:
+            return len(text)
+
+        return self.stream.write(text)
+
+    def flush(self):
+        routes = _ROUTES.get(get_ident())
+
+        if routes is not None and get_ident() not in _EMITTING:
+            routes[self.index].flush()
+
+        elif self.stream is not None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def route_output(stdout, stderr):
+    """
+    Route the output of the current thread, returns the previous routes to
+    restore with restore_output
+    """
+    for index, name in enumerate(("stdout", "stderr")):
+        if not isinstance(getattr(sys, name), OutputMultiplexer):
+            setattr(sys, name, OutputMultiplexer(getattr(sys, name), index))
+
+    previous = _ROUTES.get(get_ident())
+    _ROUTES[get_ident()] = (stdout, stderr)
+
+    return previous
+
+
+def restore_output(previous):
+    """
+    Restore the output routes of the current thread
+    """
+    if previous is None:
+        _ROUTES.pop(get_ident(), None)
+
+    else:
+        _ROUTES[get_ident()] = previous
+
+
 class Bot:
     """
     Main Bot class reference implementation
@@ -97,18 +209,27 @@ class ThreadedBot(Bot):
         """
         super().__init__(*args, **kwargs)
 
-        self.interpreter = ModifiedInterpreter(locals=self.locals_)
+        self.interpreter = self._create_interpreter()
+
+        # Output of the commands, streamed to the log
+        self.stdout = OutputRoute(self.logger.info)
+        self.stderr = OutputRoute(self.logger.error)
 
         self._running = True
 
         self.command_queue = queue.Queue()
 
-        t = Thread(target=self.bot_thread, args=(self.command_queue,))
-        t.start()
+        self.thread = Thread(
+            target=self.bot_thread, args=(self.command_queue,)
+        )
+        self.thread.start()
+
+    def _create_interpreter(self):
+        return ModifiedInterpreter(locals=self.locals_)
 
     def bot_thread(self, queue):
         """
-        Bot thread main loop
+        Bot thread main loop, runs batches of commands until stopped
         """
         try:
             import pythoncom
@@ -119,47 +240,48 @@ class ThreadedBot(Bot):
         except:
             pass
 
-        while self._running:
-            try:
-                command, on_done, on_fail = queue.get(timeout=1)
+        while True:
+            batch = queue.get()
+
+            if batch is _STOP or not self._running:
+                break
+
+            commands, on_done, on_fail = batch
 
-            except Empty:
-                command = None
-                on_done = None
-                on_fail = None
+            for i, command in enumerate(commands):
+                if not self._running:
+                    return
 
-            if command:
-                self._run_command(command, on_done=on_done, on_fail=on_fail)
+                if not self._run_command(command):
+                    if on_fail:
+                        on_fail(i)
+
+                    break
 
             else:
-                sleep(0.1)
+                if on_done:
+                    on_done()
 
     def _run_command(
         self, command, on_done=None, on_fail=None,
     ):
         """
-        Run a single command
+        Run a single command, returns whether it ran succesfully
         """
         succesful = False
 
-        with StringIO() as temp:
-            old_stdout = sys.stdout  # Keep reference to old stdout
-
-            sys.stdout = temp  # Redirect stdout to temp
-
-            try:
-                succesful = self.interpreter.runcode(command)
-            except:
-                self.logger.error("Unknown error occured.")
-
-            sys.stdout = old_stdout  # Redirect to old stdout
-
-            temp.seek(0)  # Go back to start
+        # Capture the output of this thread only
+        routes = route_output(self.stdout, self.stderr)
 
-            stdout = temp.read().strip()
+        try:
+            succesful = self.interpreter.runcode(command)
+        except:
+            self.logger.error("Unknown error occured.")
 
-            if stdout:
-                self.logger.info(stdout)
+        finally:
+            self.stdout.flush()
+            self.stderr.flush()
+            restore_output(routes)
 
         if succesful:
             if on_done:
@@ -168,6 +290,8 @@ class ThreadedBot(Bot):
             if on_fail:
                 on_fail()
 
+        return succesful
+
     def reset(self):
         """
         Reset bots memory (stored local interpreter variables)
@@ -178,17 +302,373 @@ class ThreadedBot(Bot):
         """
         Run method
         """
-        self.logger.info(
-            "\n".join(
-                [">>> " + line for line in command.split("\n") if line.strip()]
-            )
+        self.run_many(
+            [command],
+            on_done=on_done,
+            on_fail=(lambda i: on_fail()) if on_fail else None,
         )
 
-        # Add the command to the queue
-        self.command_queue.put((command, on_done, on_fail))
+    def run_many(self, commands, on_done=None, on_fail=None):
+        """
+        Run consecutive commands in one go. Stops at the first command that
+        fails and calls on_fail with its index, otherwise on_done is called
+        when all commands ran.
+        """
+        if self.logger.isEnabledFor(logging.INFO):
+            for command in commands:
+                self.logger.info(
+                    "\n".join(
+                        [
+                            ">>> " + line
+                            for line in command.split("\n")
+                            if line.strip()
+                        ]
+                    )
+                )
+
+        # Add the commands to the queue
+        self.command_queue.put((list(commands), on_done, on_fail))
 
     def stop(self):
         """
-        Stop the bot
+        Stop the bot, commands that did not start yet are not run
         """
         self._running = False
+        self.command_queue.put(_STOP)
+
+
+class RemoteObject:
+    """
+    Stands in for a variable of a ProcessBot that can not be transferred
+    """
+
+    def __init__(self, type_name, representation):
+        self.type_name = type_name
+        self.representation = representation
+
+    def __repr__(self):
+        return self.representation
+
+
+def _variables(locals_, names=None):
+    """
+    Variables that can be sent to the parent process, others are replaced
+    by a RemoteObject. Modules, functions and classes are left out.
+    """
+    import pickle  # nosec
+    from types import FunctionType, ModuleType
+
+    variables = {}
+
+    for name, value in list(locals_.items()):
+        if names is not None:
+            if name not in names:
+                continue
+
+        elif name.startswith("__") or isinstance(
+            value, (ModuleType, FunctionType, type)
+        ):
+            continue
+
+        try:
+            pickle.dumps(value)
+            variables[name] = value
+
+        except Exception:
+            variables[name] = RemoteObject(type(value).__name__, repr(value))
+
+    return variables
+
+
+def _process_bot_main(connection, locals_):
+    """
+    ProcessBot child process: runs the commands received over the pipe,
+    sending back the output, log records and results
+    """
+    send_lock = Lock()
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    interpreter = ModifiedInterpreter(locals=locals_)
+
+    logger = logging.getLogger("automagica.bot")
+    logger.propagate = False
+    logger.addHandler(
+        ConsoleHandler(
+            lambda record: send(("log", record.levelno, record.getMessage()))
+        )
+    )
+
+    stdout = OutputRoute(lambda text: send(("output", text)))
+    stderr = OutputRoute(lambda text: send(("log", logging.ERROR, text)))
+    route_output(stdout, stderr)
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+
+        kind, request_id, argument = message
+
+        if kind == "stop":
+            break
+
+        try:
+            if kind == "run":
+                result = interpreter.runcode(argument)
+                stdout.flush()
+                stderr.flush()
+
+            elif kind == "get":
+                result = _variables(interpreter.locals, argument)
+
+            elif kind == "set":
+                interpreter.locals.update(argument)
+                result = None
+
+            elif kind == "pop":
+                result = _variables(interpreter.locals, [argument])
+                interpreter.locals.pop(argument, None)
+
+            elif kind == "reset":
+                interpreter.locals = {
+                    "__name__": "__console__",
+                    "__doc__": None,
+                }
+                result = None
+
+            send(("result", request_id, True, result))
+
+        except Exception as e:
+            send(
+                (
+                    "result",
+                    request_id,
+                    False,
+                    "{}: {}".format(type(e).__name__, e),
+                )
+            )
+
+
+class RemoteLocals:
+    """
+    Variables of a ProcessBot, transferred from the child process on access
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+
+    def _get(self, names=None):
+        return self.bot._request("get", names)
+
+    def __getitem__(self, name):
+        return self._get([name])[name]
+
+    def __setitem__(self, name, value):
+        self.bot._request("set", {name: value})
+
+    def __contains__(self, name):
+        return name in self._get([name])
+
+    def get(self, name, default=None):
+        return self._get([name]).get(name, default)
+
+    def pop(self, name, default=None):
+        return self.bot._request("pop", name).get(name, default)
+
+    def update(self, variables):
+        self.bot._request("set", dict(variables))
+
+    def keys(self):
+        return self._get().keys()
+
+    def items(self):
+        return self._get().items()
+
+
+class RemoteInterpreter:
+    """
+    Interpreter of a ProcessBot, only gives access to its variables
+    """
+
+    def __init__(self, bot):
+        self.locals = RemoteLocals(bot)
+
+
+class ProcessBot(ThreadedBot):
+    """
+    Bot implementation running the interpreter in a child process, so
+    commands do not hold the GIL of the GUI and hung steps can be killed.
+    Output is streamed back over a pipe and variables are transferred
+    (pickled) when they are accessed through interpreter.locals.
+    """
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        """
+        Create a process bot, steps running longer than timeout seconds are
+        stopped by restarting the process (losing its variables)
+        """
+        self.timeout = timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.request_ids = itertools.count()
+        self.send_lock = Lock()
+
+        super().__init__(*args, **kwargs)
+
+    def _create_interpreter(self):
+        self._start_process()
+
+        return RemoteInterpreter(self)
+
+    def _start_process(self):
+        connection, child_connection = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_process_bot_main,
+            args=(child_connection, self.locals_),
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+        # Every process has its own pending requests, so the reader of a
+        # stopped process only fails the requests sent to it
+        requests = {}
+        self.channel = (connection, requests)
+
+        Thread(
+            target=self._read, args=(connection, requests), daemon=True
+        ).start()
+
+    def _stop_process(self, timeout=5):
+        connection, _ = self.channel
+
+        try:
+            with self.send_lock:
+                connection.send(("stop", None, None))
+        except OSError:
+            pass
+
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+        connection.close()
+
+    def _read(self, connection, requests):
+        """
+        Receive output, log records and results from the child process
+        """
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == "output":
+                self.logger.info(message[1])
+
+            elif message[0] == "log":
+                self.logger.log(message[1], message[2])
+
+            elif message[0] == "result":
+                request = requests.pop(message[1], None)
+
+                if request:
+                    request[1] = message[2:]
+                    request[0].set()
+
+        # The process exited, requests waiting for it fail
+        for request_id in list(requests):
+            request = requests.pop(request_id, None)
+
+            if request:
+                request[0].set()
+
+    def _request(self, kind, argument=None, timeout=None):
+        """
+        Send a request to the child process and wait for its result
+        """
+        connection, requests = self.channel
+        request_id = next(self.request_ids)
+        request = requests[request_id] = [Event(), None]
+
+        try:
+            with self.send_lock:
+                connection.send((kind, request_id, argument))
+
+        except OSError:
+            requests.pop(request_id, None)
+            raise Exception("The bot process is not running")
+
+        except Exception:
+            # E.g. a variable that can not be pickled
+            requests.pop(request_id, None)
+            raise
+
+        if not request[0].wait(timeout):
+            requests.pop(request_id, None)
+            raise TimeoutError
+
+        if request[1] is None:
+            raise Exception("The bot process exited")
+
+        successful, result = request[1]
+
+        if not successful:
+            raise Exception(result)
+
+        return result
+
+    def _run_command(
+        self, command, on_done=None, on_fail=None,
+    ):
+        """
+        Run a single command, returns whether it ran succesfully
+        """
+        succesful = False
+
+        try:
+            succesful = self._request("run", command, timeout=self.timeout)
+
+        except TimeoutError:
+            self.logger.error(
+                "Step did not finish within {} seconds and was stopped, the bot was restarted.".format(
+                    self.timeout
+                )
+            )
+            self._stop_process(timeout=0)
+            self._start_process()
+
+        except Exception as e:
+            self.logger.error(str(e))
+
+            if self._running and not self.process.is_alive():
+                self._stop_process(timeout=0)
+                self._start_process()
+
+        if succesful:
+            if on_done:
+                on_done()
+        else:
+            if on_fail:
+                on_fail()
+
+        return succesful
+
+    def reset(self):
+        """
+        Reset bots memory (stored local interpreter variables)
+        """
+        self._request("reset")
+
+    def stop(self):
+        """
+        Stop the bot and its process
+        """
+        super().stop()
+        self._stop_process()
@@ -0,0 +1,721 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import logging
+
+import selenium.webdriver
+
+from .utilities import activity, interpret_path
+
+"""
+Browser
+Icon: lab la-chrome
+"""
+
+
+class Chrome(selenium.webdriver.Chrome):
+    @activity
+    def __init__(
+        self,
+        load_images=True,
+        headless=False,
+        incognito=False,
+        disable_extension=False,
+        maximize_window=True,
+        focus_window=True,
+        auto_update_chromedriver=True,
+    ):
+        """Open Chrome Browser
+
+        Open the Chrome Browser with the Selenium webdriver. Can be used to automate manipulations in the browser.
+        Different elements can be found as:
+
+        -   Xpath: e.g. browser.find_element_by_xpath() or browser.xpath()
+        One can easily find an xpath by right clicking an element -> inspect. Look for the element in the menu and right click -> copy -> xpath
+        find_element_by_id
+        -   Name: find_element_by_name
+        -   Link text: find_element_by_link_text
+        -   Partial link text: find_element_by_partial_link_text
+        -   Tag name: find_element_by_tag_name
+        -   Class name: find_element_by_class_name
+        -   Css selector: find_element_by_css_selector
+
+        Elements can be manipulated by:
+
+        - Clicking: e.g. element.click()
+        - Typing: e.g. element.send_keys()
+
+        :parameter load_images: Do not load images (bool). This could speed up loading pages
+        :type load_images: bool, optional
+        :parameter headless: Run headless, this means running without a visible window (bool)
+        :type headless: bool, optional
+        :parameter incognito: Run in incognito mode
+        :type incognito: bool, optional
+        :parameter disable_extension: Disable extensions
+        :type disable_extension: bool, optional
+        :parameter auto_update_chromedriver: Automatically update Chromedriver
+        :type auto_update_chromedriver: bool, optional
+        :parameter maximize_window: Maximize window
+        :type maximize_window: bool, optional
+        :parameter focus_window: Focus window
+        :type focus_window: bool, optional
+
+        :return: webdriver: Selenium Webdriver
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://automagica.com')
+        >>> # Close browser
+        >>> browser.quit()
+
+        Keywords
+            chrome, browsing, browser, internet, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            lab la-chrome
+
+        """
+        import platform
+        import os
+
+        # Check what OS we are on
+        if platform.system() == "Linux":
+            chromedriver_path = "bin/linux64/chromedriver"
+
+        elif platform.system() == "Windows":
+            chromedriver_path = "\\bin\\win32\\chromedriver.exe"
+
+            if auto_update_chromedriver:
+                self.download_latest_driver(chromedriver_path)
+        else:
+            chromedriver_path = "bin/mac64/chromedriver"
+
+        chrome_options = selenium.webdriver.ChromeOptions()
+
+        if incognito:
+            chrome_options.add_argument("--incognito")
+
+        if disable_extension:
+            # To disable the error message popup: "Loading of unpacked extensions is disabled by the administrator"
+            chrome_options.add_experimental_option(
+                "useAutomationExtension", False
+            )
+        if headless:
+            chrome_options.add_argument("--headless")
+
+        if not load_images:
+            prefs = {"profile.managed_default_content_settings.images": 2}
+            chrome_options.add_experimental_option("prefs", prefs)
+
+        chrome_options.add_experimental_option(
+            "excludeSwitches", ["enable-logging"]
+        )
+
+        selenium.webdriver.Chrome.__init__(
+            self,
+            os.path.abspath(__file__).replace(
+                os.path.basename(os.path.realpath(__file__)), ""
+            )
+            + chromedriver_path,
+            chrome_options=chrome_options,
+        )
+
+        if maximize_window:
+            self.maximize_window()
+
+        if focus_window:
+            self.switch_to.window(self.current_window_handle)
+
+    def download_latest_driver(self, chromedriver_path):
+        """ Downloads latest Chrome driver on Windows """
+        import subprocess  # nosec
+        from automagica.httpclient import http_client
+        import os
+        from io import BytesIO
+        import zipfile
+        import shutil
+
+        from packaging import version
+
+        # Retrieve CHrome version
+        process = subprocess.Popen(
+            [
+                "reg",
+                "query",
+                "HKEY_CURRENT_USER\\Software\\Google\\Chrome\\BLBeacon",
+                "/v",
+                "version",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            stdin=subprocess.DEVNULL,
+        )
+        chrome_version = (
+            process.communicate()[0].decode("UTF-8").strip().split()[-1]
+        )
+
+        # Extract Chrome major version (f.e. for 85.1.33.122 it's 85)
+        chrome_major = int(chrome_version.split(".")[0])
+
+        # Chromedriver absolute path
+        driver_path = (
+            os.path.abspath(__file__).replace(
+                os.path.basename(os.path.realpath(__file__)), ""
+            )
+            + chromedriver_path
+        )
+
+        download = False
+
+        # Driver exists
+        if os.path.exists(driver_path):
+            # Get Chromedriver version
+            chromedriver_version = str(
+                subprocess.check_output(
+                    ["cmd.exe", "/c", str(driver_path + " --v")]
+                )
+            )
+
+            # Is this the appropriate webdriver version for this Chrome major version?
+            if str(chrome_major) not in chromedriver_version.split(".")[0]:
+                download = True
+
+        # Driver does not exist
+        else:
+            download = True
+
+        if download:
+            # Retrieve latest release for the webdriver for this Chrome major version
+            latest_version = http_client.get(
+                f"https://chromedriver.storage.googleapis.com/LATEST_RELEASE_{chrome_major}"
+            ).text
+
+            request = http_client.get(
+                f"https://chromedriver.storage.googleapis.com/{latest_version}/chromedriver_win32.zip"
+            )
+
+            # Convert request content data to Zipfile object
+            file = zipfile.ZipFile(BytesIO(request.content))
+
+            driver_folder_path = os.path.dirname(driver_path)
+
+            # Forcefully remove the directory containing the webdriver
+            if os.path.exists(driver_folder_path):
+                shutil.rmtree(driver_folder_path)
+
+            # Create directory
+            os.makedirs(driver_folder_path, exist_ok=True)
+
+            # Extract to the webdriver location
+            file.extractall(driver_folder_path)
+
+    @activity
+    def save_all_images(self, output_path=None):
+        """Save all images
+
+        Save all images on current page in the Browser
+
+        :parameter output_path: Path where images can be saved. Default value is home directory.
+        :type output_path: output_dir, optional
+
+        :return: List with paths to images
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://www.nytimes.com/')
+        >>> # Save all images
+        >>> browser.save_all_images()
+        >>> browser.quit()
+        ['C:\\Users\\<username>\\image1.png', 'C:\\Users\\<username>\\image2.jpg', 'C:\\Users\\<username>\\image4.gif']
+
+        Keywords
+            image scraping, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-images
+
+        """
+        from automagica.httpclient import http_client
+        import os
+        from urllib.parse import urlparse
+
+        output_path = interpret_path(output_path)
+
+        paths = []
+
+        images = self.find_elements_by_tag_name("img")
+
+        for image in images:
+            url = image.get_attribute("src")
+            a = urlparse(url)
+            filename = os.path.basename(a.path)
+
+            if filename:
+                with open(os.path.join(output_path, filename), "wb") as f:
+                    try:
+                        r = http_client.get(url)
+                        f.write(r.content)
+                        paths.append(os.path.join(output_path, filename))
+                    except Exception:
+                        logging.exception()
+
+        return paths
+
+    @activity
+    def browse_to(self, url):
+        """Browse to URL
+
+        Browse to URL.
+
+        :parameter url: Url to browser to
+        :type url: string
+
+        :return: Webpage
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.browse_to('https://nytimes.com')
+
+        Keywords
+            chrome, element, browse to, browse, surf, surf to, go to, get, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            lab la-chrome
+
+        """
+        return self.get(url)
+
+    @activity
+    def find_elements_by_text(self, text):
+        """Find elements by text
+
+        Find all elements by their text. Text does not need to match exactly, part of text is enough.
+
+        :parameter text: Text to find elements by
+        :type text: string
+
+        :return: Elements that matched with text
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://nytimes.com')
+        >>> # Find elements by text
+        >>> browser.find_elements_by_text('world')
+        [webelement1, webelement2 , .. ]
+
+        Keywords
+            element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-align-center
+
+        """
+        return self.find_elements_by_xpath(
+            "//*[contains(text(), '"
+            + text.lower()
+            + "')] | //*[@value='"
+            + text.lower()
+            + "']"
+        )
+
+    @activity
+    def find_all_links(self, contains=""):
+        """Find all links
+
+        Find all links on a webpage in the browser
+
+        :parameter contains: Criteria of substring that url must contain to be included
+        :type contains: string, optional
+
+        :return: Links
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://nytimes.com')
+        >>> # Find elements by text
+        >>> browser.find_all_links()
+        [webelement1, webelement2 , .. ]
+
+        Keywords
+            random, element,link, links element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-window-restore
+        """
+        links = []
+        for element in self.find_elements_by_xpath("//a[@href]"):
+            try:
+                href_el = element.get_attribute("href")
+                if contains:
+                    if contains in element.get_attribute("href"):
+                        links.append(element.get_attribute("href"))
+                else:
+                    links.append(href_el)
+            except:
+                pass
+
+        if links:
+            return links
+
+    @activity
+    def find_first_link(self, contains=None):
+        """Find first link on a webpage
+
+        Find first link on a webpage
+
+        :parameter contains: Criteria of substring that url must contain to be included
+        :type contains: string, optional
+
+        :return: First link
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://nytimes.com')
+        >>> # Find elements by text
+        >>> browser.find_first_link()
+
+
+        Keywords
+            random, link, links, element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-window-restore
+        """
+        for element in self.find_elements_by_xpath("//a[@href]"):
+            try:
+                href_el = element.get_attribute("href")
+                if contains:
+                    if contains in href_el:
+                        return href_el
+                else:
+                    return href_el
+            except:
+                pass
+
+    @activity
+    def get_text_on_webpage(self):
+        """Get all text on webpage
+
+        Get all the raw body text from current webpage
+
+        :return: Text
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://nytimes.com')
+        >>> # Get text from page
+        >>> browser.get_text_on_webpage()
+
+        Keywords
+            random, link, links, element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-window-restore
+        """
+
+        return self.find_element_by_tag_name("body").text
+
+    @activity
+    def highlight(self, element):
+        """Highlight element
+
+        Highlight elements in yellow in the browser
+
+        :parameter element: Element to highlight
+        :type element: selenium.webdriver.remote.webelement.WebElement
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://wikipedia.org')
+        >>> # Find first link on page
+        >>> first_link = browser.find_elements_by_xpath("//a[@href]")[0]
+        >>> # Highlight first link
+        >>> browser.highlight(first_link)
+
+        Keywords
+            element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-highlighter
+
+        """
+        driver = element._parent
+
+        def apply_style(s):
+            driver.execute_script(
+                "arguments[0].setAttribute('style', arguments[1]);", element, s
+            )
+
+        apply_style("background: yellow; border: 2px solid red;")
+
+    @activity
+    def exit(self):
+        """Exit the browser
+
+        Quit the browser by exiting gracefully. One can also use the native 'quit' function
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://automagica.com')
+        >>> # Close browser
+        >>> browser.exit()
+
+
+        Keywords
+            quit, exit, close, element, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-window-close
+
+        """
+        self.quit()
+
+    @activity
+    def by_xpaths(self, element):
+        """Find all XPaths
+
+        Find all elements with specified xpath on a webpage in the the browser. Can also use native 'find_elements_by_xpath'
+
+        :parameter element: Xpath of element
+        :type element: string, optional
+
+        :return: Element by xpaths
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://wikipedia.org')
+        >>> # Find elements by xpaths
+        >>> browser.by_xpaths('//*[@id=\'js-link-box-en\']')
+        [webelement1, webelement2 , .. ]
+
+        Keywords
+            random, element, xpath, xml, element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-times
+
+        """
+        return self.find_elements_by_xpath(element)
+
+    @activity
+    def by_xpath(self, element):
+        """Find XPath in browser
+
+        Find all element with specified xpath on a webpage in the the browser. Can also use native 'find_elements_by_xpath'
+
+        :parameter element: Xpath of element
+        :type element: string, optional
+
+        :return: Element by xpath
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://wikipedia.org')
+        >>> # Find element by xpath
+        >>> element = browser.by_xpath('//*[@id=\'js-link-box-en\']')
+        >>> # We can now use this element, for example to click on
+        >>> element.click()
+
+        Keywords
+            random, xpath, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-times
+
+        """
+        return self.find_element_by_xpath(element)
+
+    @activity
+    def by_class(self, element):
+        """Find class in browser
+
+        Find element with specified class on a webpage in the the browser. Can also use native 'find_element_by_class_name'
+
+        :parameter element: Class of element
+        :type element: string, optional
+
+        :return: Element by class
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://wikipedia.org')
+        >>> # Find element by class
+        >>> element = browser.by_class('search-input')
+        >>> # We can now use this element, for example to click on
+        >>> element.click()
+
+        Keywords
+            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-times
+
+        """
+        return self.find_element_by_class_name(element)
+
+    @activity
+    def by_classes(self, element):
+        """Find class in browser
+
+        Find all elements with specified class on a webpage in the the browser. Can also use native 'find_elements_by_class_name' function
+
+        :parameter element: Class of element
+        :type element: string, optional
+
+        :return: Element by classes
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://wikipedia.org')
+        >>> # Find elements by class
+        >>> elements = browser.by_classes('search-input')
+
+        Keywords
+            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-times
+
+        """
+        return self.find_elements_by_class_name(element)
+
+    @activity
+    def by_class_and_by_text(self, element, text):
+        """Find element in browser based on class and text
+
+        Find all elements with specified class and text on a webpage in the the browser.
+
+        :parameter element: Class of element
+        :type element: string
+        :parameter text: Text inside the element
+        :type text: string
+
+        :return: Element by class and text
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://wikipedia.org')
+        >>> # Find elements by class and text
+        >>> element = browser.by_class_and_by_text('search-input', 'Search Wikipedia')
+        >>> # We can now use this element, for example to click on
+        >>> element.click()
+
+        Keywords
+            browser, class, text, name classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-times
+
+        """
+        for element in self.find_elements_by_class_name(element):
+            if text in element.text:
+                return element
+
+    @activity
+    def by_id(self, element):
+        """Find id in browser
+
+        Find element with specified id on a webpage in the the browser. Can also use native 'find_element_by_id' function
+
+        :parameter element: Id of element
+        :type element: string, optional
+
+        :return: Element by id
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://wikipedia.org')
+        >>> # Find element by class
+        >>> elements = browser.by_id('search-input')
+        >>> # We can now use this element, for example to click on
+        >>> element.click()
+
+        Keywords
+            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-times
+
+        """
+        return self.find_element_by_id(element)
+
+    @activity
+    def switch_to_iframe(self, name="iframe"):
+        """Switch to iframe in browser
+
+        Switch to an iframe in the browser
+
+        :parameter name: Name of the Iframe
+        :type name: string, optional
+
+            :Example:
+
+        >>> # Open the browser
+        >>> browser = Chrome()
+        >>> # Go to a website
+        >>> browser.get('https://www.w3schools.com/html/html_iframe.asp')
+        >>> # Switch to iframe
+        >>> browser.switch_to_iframe()
+
+        Keywords
+            browser, class, classes, element, xml element by text, chrome, internet, browsing, browser, surfing, web, webscraping, www, selenium, crawling, webtesting, mozilla, firefox, internet explorer
+
+        Icon
+            las la-times
+
+        """
+
+        self.switch_to.frame(self.find_element_by_tag_name("iframe"))
+
+
+# Flows and scripts refer to these activities as automagica.activities.Chrome,
+# which imports this module on first use
+Chrome.__module__ = "automagica.activities"
+
+for method in vars(Chrome).values():
+    if hasattr(method, "__wrapped__"):
+        method.__module__ = method.__wrapped__.__module__ = Chrome.__module__
@@ -1,20 +1,11 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
 
 import os
+import sys
 
 import click
-import tkinter as tk
 
 from automagica.config import Config, _
-from automagica.gui.apps import (
-    AutomagicaTk,
-    BotApp,
-    FlowApp,
-    LabApp,
-    ScriptApp,
-    TraceApp,
-    WandApp,
-)
 
 __version__ = "3.2.2"
 
@@ -41,6 +32,8 @@ def bot():
     """
     'automagica bot' launches the Automagica Bot
     """
+    from automagica.gui.apps import AutomagicaTk, BotApp
+
     root = AutomagicaTk()
     app = BotApp(root)
     app.run()
@@ -53,6 +46,7 @@ def wand(delay=0):
     """
     `automagica wand` launches the Automagica Wand
     """
+    from automagica.gui.apps import AutomagicaTk, WandApp
 
     def on_finish(automagica_id):
         """
@@ -79,6 +73,8 @@ def flow_new():
     """
     `automagica flow new` creates a new Automagica Flow
     """
+    from automagica.gui.apps import AutomagicaTk, FlowApp
+
     root = AutomagicaTk()
     _ = FlowApp(root)
     root.mainloop()
@@ -90,6 +86,8 @@ def flow_edit(file_path):
     """
     `automagica flow edit <filename>` opens an existing Automagica Flow for editing
     """
+    from automagica.gui.apps import AutomagicaTk, FlowApp
+
     root = AutomagicaTk()
     _ = FlowApp(root, file_path=file_path)
     root.mainloop()
@@ -105,12 +103,52 @@ def flow_edit(file_path):
 @click.option(
     "--step-by-step/--autoplay",
     default=False,
-    help=_("Run Flow headless (without GUI)"),
+    help=_("Run Flow step by step"),
 )
-def flow_run(filename, headless, step_by_step):
+@click.option(
+    "--profile",
+    "profile_path",
+    default=None,
+    metavar="OUT.JSON",
+    help=_(
+        "Profile the Flow (runs headless) and save a Chrome trace to OUT.JSON"
+    ),
+)
+def flow_run(filename, headless, step_by_step, profile_path):
     """
     `automagica flow run <filename>` opens an existing Automagica Flow and executes it
     """
+    if headless or profile_path:
+        from automagica.runner import run_flow_file
+
+        Config()
+
+        profiler = None
+
+        if profile_path:
+            from automagica.profiler import Profiler
+
+            profiler = Profiler()
+            profiler.start()
+
+        try:
+            succesful = run_flow_file(
+                filename, step_by_step=step_by_step, profiler=profiler
+            )
+
+        finally:
+            if profiler:
+                profiler.stop()
+                profiler.save(profile_path)
+
+                click.echo(profiler.format_summary())
+                click.echo(_("Trace saved to {}").format(profile_path))
+
+        # Regular exit, so atexit handlers (e.g. telemetry) still run
+        sys.exit(0 if succesful else 1)
+
+    from automagica.gui.apps import AutomagicaTk, FlowApp
+
     root = AutomagicaTk()
 
     # Run FLow
@@ -138,6 +176,8 @@ def lab_new():
     """
     `automagica lab new` creates a new Automagica Lab notebook
     """
+    from automagica.gui.apps import LabApp
+
     app = LabApp()
     app.new()
 
@@ -148,6 +188,8 @@ def lab_edit(file_path):
     """
     `automagica lab edit <filename>` opens an existing Automagica Lab notebook (.ipynb) for editing
     """
+    from automagica.gui.apps import LabApp
+
     app = LabApp()
     app.edit(notebook_path=file_path)
 
@@ -155,6 +197,8 @@ def lab_edit(file_path):
 @lab.command("run", help=_("Run Lab notebook"))
 @click.argument("file_path")
 def lab_run(file_path):
+    from automagica.gui.apps import LabApp
+
     app = LabApp()
     app.run(file_path)
 
@@ -166,6 +210,8 @@ def trace():
 
 @trace.command("record", help=_("Record a new Trace"))
 def trace_record():
+    from automagica.gui.apps import AutomagicaTk, TraceApp
+
     root = AutomagicaTk()
     _ = TraceApp(root)
     root.mainloop()
@@ -179,6 +225,8 @@ def script():
 @script.command("run", help=_("Run Script"))
 @click.argument("file_path")
 def script_run(file_path):
+    from automagica.gui.apps import ScriptApp
+
     app = ScriptApp()
     app.run(file_path)
     app.quit_()
@@ -186,5 +234,3 @@ def script_run(file_path):
 
 if __name__ == "__main__":
     cli(None)  # TODO: add comment, why None?
-else:
-    from automagica.activities import *  # TODO: add comment, why wildcard import? (*)
@@ -5,18 +5,31 @@ from gettext import gettext, translation
 import logging
 
 import sys
-import pyglet
 import json
 
 from automagica.utilities import all_activities
-from PIL import ImageTk, Image
 
 
-ACTIVITIES = all_activities()
+def __getattr__(name):
+    """
+    Load the activities (ACTIVITIES) only when they are first used
+    """
+    if name == "ACTIVITIES":
+        globals()["ACTIVITIES"] = all_activities()
+        return globals()["ACTIVITIES"]
+
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
 
 
 class IconGraph:
-    def __init__(self, icon_size=20, color="#2196f3"):
+    """
+    Icons of the GUI in the theme color. Recolored icons are generated when
+    they are first used and cached on disk per color.
+    """
+
+    def __init__(self, icon_size=20, color="#2196f3", cache_path=None):
         icons_path = os.path.join(
             os.path.dirname(
                 os.path.dirname(
@@ -30,48 +43,101 @@ class IconGraph:
             "icons",
         )
 
+        self.icons_path = icons_path
         self.icon_names = os.listdir(icons_path)
 
         self.icon_paths = [
             os.path.join(icons_path, fn) for fn in self.icon_names
         ]
 
-        self.icons_pil = []
-        self.icons_tk = []
+        self.icons_tk = {}
 
         self.color = tuple(
             int(color.lstrip("#")[i : i + 2], 16) for i in (0, 2, 4)
         )
 
+        self.cache_path = cache_path or os.path.join(
+            os.path.expanduser("~"),
+            ".automagica",
+            "cache",
+            "icons",
+            color.lstrip("#").lower(),
+        )
+
+    def recolor(self, img):
+        """
+        Returns a copy of the icon with its black pixels in the theme color
+        """
+        import numpy as np
+        from PIL import Image
+
+        data = np.array(img)
+
+        if data.ndim == 3 and data.shape[2] in (3, 4):
+            black = np.all(data[:, :, :3] == 0, axis=2)
+            data[black, :3] = self.color
+
+        return Image.fromarray(data, img.mode)
+
+    def icon(self, icon_name):
+        """
+        Returns the recolored icon as a Pillow image, from the cache if
+        it is up to date
+        """
+        from PIL import Image
+
+        path = os.path.join(self.icons_path, icon_name)
+        cached_path = os.path.join(self.cache_path, icon_name)
+
+        try:
+            if os.path.getmtime(cached_path) >= os.path.getmtime(path):
+                img = Image.open(cached_path)
+                img.load()
+
+                return img
+
+        except OSError:
+            pass
+
+        img = Image.open(path)
+
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA")
+
+        img = self.recolor(img)
+
+        try:
+            import tempfile
+
+            os.makedirs(self.cache_path, exist_ok=True)
+
+            # Write to a temporary file first, other processes may read
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_path)
+
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, "PNG")
+
+            os.replace(temp_path, cached_path)
+
+        except OSError:
+            logging.debug("Could not cache icon {}".format(icon_name))
+
+        return img
+
     def generate_icons(self):
-        for path in self.icon_paths:
-            img = Image.open(path)
-
-            data = img.load()
-
-            if data:
-                for x in range(img.size[0]):
-                    for y in range(img.size[1]):
-                        if (
-                            data[x, y][0]
-                            == data[x, y][1]
-                            == data[x, y][2]
-                            == 0
-                        ):
-                            data[x, y] = (
-                                self.color[0],
-                                self.color[1],
-                                self.color[2],
-                                data[x, y][3],
-                            )
-
-            self.icons_pil.append(img)
-            self.icons_tk.append(ImageTk.PhotoImage(img))
+        """
+        Generate all icons, icons are otherwise generated on first use
+        """
+        for icon_name in self.icon_names:
+            self.tkinter(icon_name)
 
     def tkinter(self, icon_name):
-        index = self.icon_names.index(icon_name)
+        from PIL import ImageTk
+
+        if icon_name not in self.icons_tk:
+            self.icons_tk[icon_name] = ImageTk.PhotoImage(self.icon(icon_name))
 
-        return self.icons_tk[index]
+        return self.icons_tk[icon_name]
 
 
 ICONS = IconGraph()
@@ -120,9 +186,17 @@ fontdir = os.path.join(
     "fonts",
 )
 
-# Add font files
-pyglet.font.add_file(os.path.join(fontdir, "roboto.ttf"))
-pyglet.font.add_file(os.path.join(fontdir, "roboto-mono.ttf"))
+
+def register_fonts():
+    """
+    Add font files, this requires a display so it is only done when a GUI
+    application starts
+    """
+    import pyglet
+
+    pyglet.font.add_file(os.path.join(fontdir, "roboto.ttf"))
+    pyglet.font.add_file(os.path.join(fontdir, "roboto-mono.ttf"))
+
 
 FONT = "Roboto"
 FONT_MONO = "Roboto Mono"
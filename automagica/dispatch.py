@@ -0,0 +1,110 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import random
+import time
+
+from automagica.httpclient import http_client
+
+
+class DispatchClient:
+    """
+    Client for receiving jobs from the Automagica Portal. Jobs are requested
+    with long-polling: the Portal holds /api/job/next open for up to `wait`
+    seconds and answers as soon as a job is available. While long-polling
+    works, these requests double as heartbeats so no separate alive
+    requests are needed. Portals that answer immediately are polled as
+    before.
+    """
+
+    def __init__(
+        self,
+        portal_url,
+        bot_secret,
+        wait=30,
+        min_backoff=1,
+        max_backoff=5 * 60,
+        heartbeat_interval=30,
+    ):
+        """
+        Initialize the dispatch client
+        """
+        self.portal_url = portal_url
+        self.headers = {"bot_secret": bot_secret}
+        self.wait = wait
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.heartbeat_interval = heartbeat_interval
+
+        self.long_polling = False
+        self.polling = False
+        self.failures = 0
+        self.last_contact = 0
+
+    def next_job(self):
+        """
+        Wait for the next job, returns None if no job arrived in time
+        """
+        start = time.monotonic()
+        self.polling = True
+
+        try:
+            r = http_client.get(
+                self.portal_url + "/api/job/next?wait={}".format(self.wait),
+                headers=self.headers,
+                timeout=self.wait + 15,
+            )
+
+        finally:
+            self.polling = False
+
+        if r.status_code >= 400:
+            raise Exception(
+                "Automagica Portal returned HTTP {}".format(r.status_code)
+            )
+
+        job = r.json() if r.content.strip() else None
+
+        if not job:
+            # A Portal without long-polling answers right away
+            self.long_polling = time.monotonic() - start >= self.wait / 2
+
+        self.failures = 0
+        self.last_contact = time.monotonic()
+
+        return job or None
+
+    def heartbeat(self):
+        """
+        Send an alive message, unless a long-poll request recently reached
+        the Portal. Returns True if a message was sent.
+        """
+        if self.long_polling and (
+            self.polling
+            or time.monotonic() - self.last_contact < self.heartbeat_interval
+        ):
+            return False
+
+        r = http_client.post(
+            self.portal_url + "/api/bot/alive", headers=self.headers
+        )
+
+        if r.status_code >= 400:
+            raise Exception(
+                "Automagica Portal returned HTTP {}".format(r.status_code)
+            )
+
+        return True
+
+    def backoff(self):
+        """
+        Register a failed request, returns the number of seconds to wait
+        before retrying (exponential backoff with full jitter)
+        """
+        self.failures += 1
+        self.long_polling = False
+
+        delay = min(
+            self.max_backoff, self.min_backoff * 2 ** (self.failures - 1)
+        )
+
+        return random.uniform(0, delay)  # nosec
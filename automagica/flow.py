@@ -1,8 +1,13 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
 
+import ast
+import hashlib
+import importlib.util
 import json
 import logging
+import marshal
 import os
+import tempfile
 
 from .nodes import (
     ActivityNode,
@@ -17,11 +22,42 @@ from .nodes import (
 from automagica.config import _
 
 
+# Node attributes that hold a connection to another node
+CONNECTION_ATTRIBUTES = (
+    "next_node",
+    "else_node",
+    "loop_node",
+    "on_exception_node",
+)
+
+# Bump this when the compiled module layout changes to invalidate caches
+COMPILE_VERSION = 2
+
+# Compiled Flows are cached here by the hash of their contents, keeping
+# the FLOW_CACHE_SIZE most recently used
+FLOW_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".automagica", "cache", "flows"
+)
+FLOW_CACHE_SIZE = 64
+
+# Expression used to jump to the end of a branch: back to the loop node
+# being iterated, or the end of the Flow
+END_OF_BRANCH = "(AUTOMAGICA_LOOPS[-1] if AUTOMAGICA_LOOPS else None)"
+
+
 class Flow:
-    def __init__(self, file_path=None, nodes=[], name=None):
+    def __init__(self, file_path=None, nodes=None, name=None):
         self.file_path = file_path
+
+        if nodes is None:
+            nodes = []
+
         self.nodes = nodes
 
+        # Indices for constant time look-ups, see reindex()
+        self.nodes_by_uid = {}
+        self.predecessors = {}
+
         if not name:
             name = _("Unnamed Flow")
 
@@ -34,6 +70,8 @@ class Flow:
             node = StartNode(x=100, y=100)
             self.nodes.append(node)
 
+        self.reindex()
+
     def load(self, file_path):
         self.file_path = file_path
 
@@ -143,10 +181,49 @@ class Flow:
 
             self.nodes.append(node)
 
-    def get_node_by_uid(self, uid):
+        self.reindex()
+
+    def reindex(self):
+        """
+        Rebuild the uid and predecessor indices. Adding, removing and
+        connecting nodes through the Flow keeps these up-to-date, call this
+        after changing the nodes or their connections directly.
+        """
+        self.nodes_by_uid = {node.uid: node for node in self.nodes}
+        self.predecessors = {node.uid: [] for node in self.nodes}
+
         for node in self.nodes:
-            if node.uid == uid:
-                return node
+            self._index_connections(node)
+
+    def _index_connections(self, node):
+        for attr in CONNECTION_ATTRIBUTES:
+            uid = getattr(node, attr, None)
+
+            if uid:
+                self.predecessors.setdefault(uid, []).append(node)
+
+    def get_node_by_uid(self, uid):
+        return self.nodes_by_uid.get(uid)
+
+    def get_predecessors(self, uid):
+        """
+        Get the nodes connecting to the node with this uid
+        """
+        return list(self.predecessors.get(uid, []))
+
+    def get_connections(self, node):
+        """
+        Get (attribute, node) pairs for the outgoing connections of a node
+        """
+        connections = []
+
+        for attr in CONNECTION_ATTRIBUTES:
+            uid = getattr(node, attr, None)
+
+            if uid:
+                connections.append((attr, self.get_node_by_uid(uid)))
+
+        return connections
 
     def validate(self):
         # Validation rules
@@ -185,28 +262,62 @@ class Flow:
         node = ActivityNode(activity, x=x, y=y, args_=args_)
 
         if previous_node:
-            previous_node.next_node = node.uid
-
             node.x = previous_node.x + 175
             node.y = previous_node.y
 
-        self.nodes.append(node)
+        self._add(node, previous_node)
 
         return node
 
     def add_node(self, node_type):
         node = eval("{}Node()".format(node_type))  # nosec
 
+        previous_node = None
+
         if self.nodes and node_type not in ("Start", "Comment"):
             previous_node = self.nodes[-1]
-            previous_node.next_node = node.uid
 
             node.x = previous_node.x + 175
             node.y = previous_node.y
 
-        self.nodes.append(node)
+        self._add(node, previous_node)
+
         return node
 
+    def _add(self, node, previous_node=None):
+        """
+        Append a node, connect the previous node to it and update the indices
+        """
+        self.nodes.append(node)
+        self.nodes_by_uid[node.uid] = node
+        self.predecessors.setdefault(node.uid, [])
+
+        self._index_connections(node)
+
+        if previous_node:
+            old_predecessors = self.predecessors.get(previous_node.next_node)
+
+            if old_predecessors and previous_node in old_predecessors:
+                old_predecessors.remove(previous_node)
+
+            previous_node.next_node = node.uid
+            self.predecessors[node.uid].append(previous_node)
+
+    def connect(self, node, attr, uid):
+        """
+        Set a connection (one of CONNECTION_ATTRIBUTES) of a node to the
+        node with this uid, or remove it with None
+        """
+        setattr(node, attr, uid)
+        self.reindex()
+
+    def remove_node(self, node):
+        """
+        Remove a node and the connections to it
+        """
+        self.nodes.remove(node)
+        self.remove_dead_ends()
+
     def get_start_nodes(self):
         nodes = []
         for node in self.nodes:
@@ -215,7 +326,7 @@ class Flow:
         return nodes
 
     def remove_dead_ends(self):
-        uids = [node.uid for node in self.nodes]
+        uids = {node.uid for node in self.nodes}
 
         for node in self.nodes:
             if hasattr(node, "next_node"):
@@ -233,3 +344,282 @@ class Flow:
             if hasattr(node, "loop_node"):
                 if node.loop_node not in uids:
                     node.loop_node = None
+
+        self.reindex()
+
+    def compile(self):
+        """
+        Compile the Flow into a single Python code object. The nodes become
+        a state machine keyed by uid. If the Flow has a file path, the code
+        object is cached in FLOW_CACHE_PATH by the contents of the Flow file
+        and re-used by every Flow file with the same contents, so save the
+        Flow before compiling changes made to it.
+        """
+        cache_path = None
+
+        if self.file_path:
+            try:
+                digest = self._content_hash()
+
+            except OSError:
+                digest = None
+
+            if digest:
+                cache_path = os.path.join(
+                    FLOW_CACHE_PATH, digest.hex() + ".pyc"
+                )
+                code = _read_compiled(cache_path, digest)
+
+                if code:
+                    return code
+
+        code = compile(  # nosec
+            self._build_module(), str(self.file_path or "<flow>"), "exec"
+        )
+
+        if cache_path:
+            _write_compiled(cache_path, digest, code)
+
+        return code
+
+    def _content_hash(self):
+        """
+        Hash of everything the compiled Flow depends on: the bytes of the
+        Flow file and of the .py files it runs
+        """
+        h = hashlib.sha256()
+        h.update(str(COMPILE_VERSION).encode("utf-8"))
+
+        with open(self.file_path, "rb") as f:
+            h.update(f.read())
+
+        for node in self.nodes:
+            if isinstance(node, DotPyFileNode):
+                try:
+                    h.update(node.get_command().encode("utf-8"))
+                except (OSError, AttributeError):
+                    pass
+
+        return h.digest()
+
+    def _goto(self, uid):
+        """
+        Expression for the uid of the next node in the compiled Flow
+        """
+        node = self.get_node_by_uid(uid) if uid else None
+
+        if not node or isinstance(node, CommentNode):
+            return END_OF_BRANCH
+
+        return repr(uid)
+
+    def _compile_node(self, node):
+        """
+        Statements for a single node in the compiled Flow
+        """
+        if isinstance(node, StartNode):
+            source = "AUTOMAGICA_NODE = {}".format(self._goto(node.next_node))
+
+        elif isinstance(node, IfElseNode):
+            source = "AUTOMAGICA_NODE = {} if ({}) else {}".format(
+                self._goto(node.next_node),
+                node.condition,
+                self._goto(node.else_node),
+            )
+
+        elif isinstance(node, LoopNode):
+            source = (
+                "if not AUTOMAGICA_LOOPS or AUTOMAGICA_LOOPS[-1] != {uid}:\n"
+                "    AUTOMAGICA_ITERATORS[{uid}] = iter({iterable})\n"
+                "    AUTOMAGICA_LOOPS.append({uid})\n"
+                "try:\n"
+                "    {variable} = next(AUTOMAGICA_ITERATORS[{uid}])\n"
+                "except StopIteration:\n"
+                "    AUTOMAGICA_LOOPS.pop()\n"
+                "    AUTOMAGICA_NODE = {next_node}\n"
+                "else:\n"
+                "    AUTOMAGICA_NODE = {loop_node}\n"
+            ).format(
+                uid=repr(node.uid),
+                iterable=node.iterable
+                or "range({})".format(node.repeat_n_times),
+                variable=node.loop_variable or "AUTOMAGICA_VALUE",
+                next_node=self._goto(node.next_node),
+                loop_node=self._goto(node.loop_node),
+            )
+
+        else:
+            return self._compile_code_node(node)
+
+        try:
+            return ast.parse(source).body
+
+        except SyntaxError:
+            # Raise the error when the node is reached, like the Flow Player
+            return ast.parse("exec({!r})".format(source)).body
+
+    def _compile_code_node(self, node):
+        """
+        Statements for a node that runs code (activities, Python code,
+        .py-files and sub-flows)
+        """
+        if isinstance(node, ActivityNode):
+            # Imported in the node, so a failing import is handled by its
+            # on exception node like any other error
+            source = node.get_import() + "\n" + node.get_call()
+
+        elif isinstance(node, SubFlowNode):
+            source = (
+                "from automagica.flow import compile_flow "
+                "as AUTOMAGICA_COMPILE_FLOW\n"
+                "AUTOMAGICA_FRAMES.append("
+                "(AUTOMAGICA_LOOPS, AUTOMAGICA_ITERATORS))\n"
+                "try:\n"
+                "    exec(AUTOMAGICA_COMPILE_FLOW({!r}))\n"
+                "finally:\n"
+                "    AUTOMAGICA_LOOPS, AUTOMAGICA_ITERATORS = "
+                "AUTOMAGICA_FRAMES.pop()\n"
+            ).format(str(node.subflow_path).replace('"', ""))
+
+        else:
+            try:
+                source = node.get_command() or "pass"
+
+            except (OSError, AttributeError):
+                source = "exec(open({!r}, encoding='utf-8').read())".format(
+                    str(node.dotpyfile_path).replace('"', "")
+                )
+
+        try:
+            body = ast.parse(source).body or ast.parse("pass").body
+
+        except SyntaxError:
+            body = ast.parse("exec({!r})".format(source)).body
+
+        if node.on_exception_node:
+            statements = ast.parse(
+                "try:\n"
+                "    pass\n"
+                "except Exception:\n"
+                "    AUTOMAGICA_LOGGER.exception({!r})\n"
+                "    AUTOMAGICA_NODE = {}\n"
+                "else:\n"
+                "    AUTOMAGICA_NODE = {}\n".format(
+                    _("Error in step: {}").format(node),
+                    self._goto(node.on_exception_node),
+                    self._goto(node.next_node),
+                )
+            ).body
+            statements[0].body = body
+
+            return statements
+
+        next_node = ast.parse(
+            "AUTOMAGICA_NODE = {}".format(self._goto(node.next_node))
+        ).body
+
+        return body + next_node
+
+    def _build_module(self):
+        """
+        Build the module AST for the compiled Flow
+        """
+        loop = ast.parse("while AUTOMAGICA_NODE is not None:\n    pass").body
+        loop[0].body = []
+
+        for node in self.nodes:
+            if isinstance(node, CommentNode):
+                continue
+
+            case = ast.parse(
+                "if AUTOMAGICA_NODE == {!r}:\n    pass".format(node.uid)
+            ).body
+            case[0].body = self._compile_node(node) + [ast.Continue()]
+
+            loop[0].body.extend(case)
+
+        loop[0].body.extend(ast.parse("AUTOMAGICA_NODE = None").body)
+
+        start_nodes = self.get_start_nodes()
+        start = self._goto(start_nodes[0].uid) if start_nodes else "None"
+
+        module = ast.parse(
+            "import logging as AUTOMAGICA_LOGGING\n"
+            "if 'AUTOMAGICA_FRAMES' not in globals():\n"
+            "    AUTOMAGICA_FRAMES = []\n"
+            "AUTOMAGICA_LOGGER = "
+            "AUTOMAGICA_LOGGING.getLogger('automagica.flow')\n"
+            "AUTOMAGICA_LOOPS = []\n"
+            "AUTOMAGICA_ITERATORS = {{}}\n"
+            "AUTOMAGICA_NODE = {}\n".format(start)
+        )
+        module.body.extend(loop)
+
+        return ast.fix_missing_locations(module)
+
+
+def compile_flow(file_path):
+    """
+    Compile the Flow at this path, re-using the cached code object if the
+    Flow did not change
+    """
+    return Flow(file_path).compile()
+
+
+def _read_compiled(cache_path, digest):
+    """
+    Read a cached code object, returns None if missing or outdated
+    """
+    header = importlib.util.MAGIC_NUMBER + digest
+
+    try:
+        with open(cache_path, "rb") as f:
+            data = f.read()
+
+        # Mark as recently used
+        os.utime(cache_path)
+
+    except OSError:
+        return None
+
+    if not data.startswith(header):
+        return None
+
+    try:
+        return marshal.loads(data[len(header) :])
+
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def _write_compiled(cache_path, digest, code):
+    """
+    Cache a code object and remove the least recently used ones beyond
+    FLOW_CACHE_SIZE, failing to do so is not an error
+    """
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(
+            suffix=".tmp", dir=os.path.dirname(cache_path)
+        )
+
+        with open(fd, "wb") as f:
+            f.write(importlib.util.MAGIC_NUMBER + digest)
+            f.write(marshal.dumps(code))
+
+        os.replace(temp_path, cache_path)
+
+        entries = sorted(
+            (entry.stat().st_mtime, entry.path)
+            for entry in os.scandir(os.path.dirname(cache_path))
+            if entry.name.endswith(".pyc")
+        )
+
+        for mtime, path in entries[:-FLOW_CACHE_SIZE]:
+            os.remove(path)
+
+    except OSError:
+        logging.debug(
+            _("Could not cache compiled Flow at {}").format(cache_path)
+        )
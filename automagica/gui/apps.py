@@ -8,16 +8,28 @@ import re
 import subprocess  # nosec
 import sys
 import tkinter as tk
-from threading import Thread
-from time import sleep
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock, Thread
+from time import perf_counter, sleep
 
 import keyboard
 from automagica.httpclient import http_client
 from PIL import Image, ImageTk
 
-from automagica.bots import ThreadedBot
-from automagica.config import ICONS, Config
+from automagica.bots import ProcessBot, ThreadedBot
+from automagica.config import Config, register_fonts
+from automagica.dispatch import DispatchClient
 from automagica.flow import Flow
+from automagica.metrics import (
+    JOB_DURATION,
+    JOBS_COMPLETED,
+    JOBS_FAILED,
+    JOBS_QUEUED,
+    JOBS_RUNNING,
+    JOBS_STARTED,
+    WORKERS_IDLE,
+    start_metrics_server,
+)
 from automagica.gui.windows import (
     BotTrayWindow,
     FlowDesignerWindow,
@@ -25,6 +37,40 @@ from automagica.gui.windows import (
     NotificationWindow,
     WandWindow,
 )
+from automagica.transfers import (
+    FileCache,
+    download_file,
+    transfer_all,
+    upload_file,
+)
+from automagica.workers import WorkerPool
+
+
+@contextmanager
+def _job_metrics(job):
+    """
+    Keep the job metrics of a job run within the block
+    """
+    JOBS_STARTED.inc()
+    JOBS_RUNNING.inc()
+    start = perf_counter()
+
+    try:
+        yield
+
+    except:
+        JOBS_FAILED.inc()
+        raise
+
+    else:
+        if job.get("status") == "completed":
+            JOBS_COMPLETED.inc()
+        else:
+            JOBS_FAILED.inc()
+
+    finally:
+        JOB_DURATION.observe(perf_counter() - start)
+        JOBS_RUNNING.dec()
 
 
 class AutomagicaTk(tk.Tk):
@@ -52,7 +98,7 @@ class App(tk.Toplevel):
         if platform.system() == "Windows":
             self._windows_set_dpi_awareness()
 
-        ICONS.generate_icons()
+        register_fonts()
 
     def _windows_set_dpi_awareness(self):
         try:
@@ -92,7 +138,12 @@ class FlowApp(App):
         super().__init__(*args, **kwargs)
 
         if not bot:
-            bot = ThreadedBot()
+            if self.config.values.get("bot_backend") == "process":
+                bot = ProcessBot(
+                    timeout=self.config.values.get("bot_step_timeout")
+                )
+            else:
+                bot = ThreadedBot()
 
         self.bot = bot
 
@@ -146,52 +197,77 @@ class BotApp(App):
         # Alive Thread (polling Automagica Portal for health status)
         self.alive_thread = Thread(target=self._alive_thread)
 
+        # Job slots for running jobs concurrently, jobs that require the
+        # desktop (mouse, keyboard, screen) hold the desktop lock
+        slots = self.config.values.get("job_slots", 1)
+        self.job_slots = BoundedSemaphore(slots)
+        self.desktop_lock = Lock()
+
+        # Job file transfers
+        self.file_cache = FileCache()
+        self.max_transfers = self.config.values.get("max_transfers", 4)
+
+        # Warm worker processes for running jobs
+        self.worker_pool = WorkerPool(
+            size=slots,
+            max_jobs=self.config.values.get("worker_max_jobs", 25),
+            max_memory=self.config.values.get("worker_max_memory_mb", 512)
+            * 1024
+            * 1024,
+            timeout=self.config.values.get("job_timeout"),
+        )
+
     def run(self):
         """Run Bot app"""
+        # Job dispatch and heartbeats
+        self.dispatch = DispatchClient(
+            self.config.values["portal_url"],
+            self.config.values["bot_secret"],
+        )
+
+        self.worker_pool.start()
         self.runner_thread.start()
         self.alive_thread.start()
 
-    def run_notebook(self, file_path, cwd):
-        """Run a notebook"""
-        process = subprocess.Popen(
-            [sys.executable, "-m", "automagica.cli", "lab", "run", file_path],
-            stdout=subprocess.PIPE,
-            cwd=cwd,
-        )
+        self._start_metrics_server()
 
-        stdout, _ = process.communicate()
+    def _start_metrics_server(self):
+        """
+        Serve the bot metrics locally if "metrics_port" is set in
+        automagica.json
+        """
+        port = os.environ.get(
+            "AUTOMAGICA_METRICS_PORT", self.config.values.get("metrics_port")
+        )
 
-        return stdout.decode("utf-8"), process.returncode
+        if not port:
+            return
 
-    def run_script(self, file_path, cwd):
-        """Run a Python script (.py)"""
-        process = subprocess.Popen(
-            [
-                sys.executable,
-                "-m",
-                "automagica.cli",
-                "script",
-                "run",
-                file_path,
-            ],
-            stdout=subprocess.PIPE,
-            cwd=cwd,
-        )
+        WORKERS_IDLE.set_function(self.worker_pool.workers.qsize)
 
-        stdout, _ = process.communicate()
+        try:
+            self.metrics_server = start_metrics_server(
+                int(port),
+                host=self.config.values.get("metrics_host", "127.0.0.1"),
+            )
+            self.config.logger.info(f"Serving metrics on port {port}.")
 
-        return stdout.decode("utf-8"), process.returncode
+        except OSError:
+            self.config.logger.exception(
+                f"Could not serve metrics on port {port}."
+            )
 
-    def run_flow(self, file_path, cwd):
-        process = subprocess.Popen(
-            [sys.executable, "-m", "automagica.cli", "flow", "run", file_path],
-            stdout=subprocess.PIPE,
-            cwd=cwd,
-        )
+    def run_notebook(self, file_path, cwd):
+        """Run a notebook"""
+        return self.worker_pool.run("notebook", file_path, cwd)
 
-        stdout, _ = process.communicate()
+    def run_script(self, file_path, cwd):
+        """Run a Python script (.py)"""
+        return self.worker_pool.run("script", file_path, cwd)
 
-        return stdout.decode("utf-8"), process.returncode
+    def run_flow(self, file_path, cwd):
+        """Run an Automagica Flow (headless)"""
+        return self.worker_pool.run("flow", file_path, cwd)
 
     def run_command(self, command, cwd):
         process = subprocess.Popen([command], stdout=subprocess.PIPE, cwd=cwd,)
@@ -201,15 +277,10 @@ class BotApp(App):
         return stdout.decode("utf-8"), process.returncode
 
     def _alive_thread(self, interval=30):
-        headers = {"bot_secret": self.config.values["bot_secret"]}
-
         while True:
             try:
-                _ = http_client.post(
-                    self.config.values["portal_url"] + "/api/bot/alive",
-                    headers=headers,
-                )
-                self.config.logger.info("Sent alive to Automagica Portal.")
+                if self.dispatch.heartbeat():
+                    self.config.logger.info("Sent alive to Automagica Portal.")
             except:
                 self.config.logger.exception(
                     "Could not reach Automagica Portal."
@@ -223,168 +294,196 @@ class BotApp(App):
         NotificationWindow(self, message="Bot started!")
 
         while True:
-            try:
-                # Get next job
-                r = http_client.get(
-                    self.config.values["portal_url"] + "/api/job/next",
-                    headers=headers,
-                )
+            # Wait for a free job slot
+            self.job_slots.acquire()
 
-                job = r.json()
+            try:
+                # Wait for the next job (long-polling)
+                job = self.dispatch.next_job()
 
-                # We got a job!
-                if job:
-                    NotificationWindow(
-                        self, message=f"Received job {job['job_id']}"
-                    )
-                    self.config.logger.info(f"Received job {job['job_id']}")
+            except:
+                self.job_slots.release()
+                delay = self.dispatch.backoff()
+                NotificationWindow(self, message="Connection error")
+                self.config.logger.exception(
+                    f"Could not reach Automagica Portal. Waiting {delay:.0f} second(s) before retrying."
+                )
+                sleep(delay)
+                continue
 
-                    # Create directory to store job-related files
-                    local_job_path = os.path.join(
-                        os.path.expanduser("~"), ".automagica", job["job_id"]
-                    )
-                    os.makedirs(local_job_path)
-                    os.makedirs(os.path.join(local_job_path, "input"))
-                    os.makedirs(os.path.join(local_job_path, "output"))
-
-                    # Download job input files
-                    for job_file in job["job_files"]:
-
-                        # Download file
-                        r = http_client.get(job_file["url"])
-
-                        # Save locally in the input folder in the job folder
-                        with open(
-                            os.path.join(
-                                local_job_path, "input", job_file["filename"]
-                            ),
-                            "wb",
-                        ) as f:
-                            f.write(r.content)
-
-                    if job.get("parameters"):
-                        with open(
-                            os.path.join(
-                                local_job_path, "input", "parameters.py"
-                            ),
-                            "w",
-                        ) as f:
-                            f.write(job["parameters"])
-
-                    entrypoint = job["job_entrypoint"]
-
-                    # IPython Notebook / Automagica Lab
-                    if entrypoint.endswith(".ipynb"):
-                        output, returncode = self.run_notebook(
-                            os.path.join(local_job_path, "input", entrypoint,),
-                            local_job_path,
-                        )
-
-                    # Python Script File
-                    elif entrypoint.endswith(".py"):
-                        output, returncode = self.run_script(
-                            os.path.join(local_job_path, "input", entrypoint),
-                            local_job_path,
-                        )
-
-                    # Automagica FLow
-                    elif entrypoint.endswith(".json"):
-                        output, returncode = self.run_flow(
-                            os.path.join(local_job_path, "input", entrypoint),
-                            local_job_path,
-                        )
-
-                    # Other command
-                    else:
-                        output, returncode = self.run_command(
-                            entrypoint, local_job_path
-                        )
-
-                    # Write console output
-                    with open(
-                        os.path.join(local_job_path, "output", "console.txt"),
-                        "w",
-                    ) as f:
-                        f.write(output)
-
-                    if returncode == 0:
-                        job["status"] = "completed"
-                        NotificationWindow(
-                            self, message=f"Completed job {job['job_id']}"
-                        )
-                        self.config.logger.info(
-                            f"Completed job {job['job_id']}"
-                        )
-
-                    else:
-                        job["status"] = "failed"
-                        NotificationWindow(
-                            self, message=f"Failed job {job['job_id']}"
-                        )
-                        self.config.logger.info(f"Failed job {job['job_id']}")
-
-                    # Make list of output files after job has ran
-                    output_files = []
-
-                    for file_path in os.listdir(
-                        os.path.join(local_job_path, "output")
-                    ):
-                        output_files.append({"filename": file_path})
-
-                    # Prepare finished job package
-                    data = {
-                        "bot_secret": self.config.values["bot_secret"],
-                        "job_id": job["job_id"],
-                        "job_status": job["status"],
-                        "job_output_files": output_files,
-                        "job_output": output,
-                    }
+            # We got a job!
+            if job:
+                Thread(
+                    target=self._job_thread, args=(job, headers), daemon=True
+                ).start()
 
-                    # Update Portal on job status and request S3 signed URLs to upload job output files
-                    r = http_client.post(
-                        self.config.values["portal_url"] + "/api/job/status",
-                        json=data,
-                        headers=headers,
-                    )
+            # We did not get a job!
+            else:
+                self.job_slots.release()
 
-                    data = r.json()
-
-                    # Upload job output files
-                    for output_file in data["output_files"]:
-                        with open(
-                            os.path.join(
-                                local_job_path,
-                                "output",
-                                output_file["filename"],
-                            ),
-                            "rb",
-                        ) as f:
-                            _ = http_client.post(
-                                output_file["payload"]["url"],
-                                data=output_file["payload"]["fields"],
-                                files={
-                                    "file": (
-                                        os.path.join(
-                                            local_job_path,
-                                            "output",
-                                            output_file["filename"],
-                                        ),
-                                        f,
-                                    )
-                                },
-                            )
-
-                # We did not get a job!
-                else:
+                # Portal does not hold the request open, poll again later
+                if not self.dispatch.long_polling:
                     sleep(interval)
+
+                if not self.desktop_lock.locked():
                     keyboard.press("f13")  # Prevent lock
 
-            except:
-                NotificationWindow(self, message="Connection error")
-                self.config.logger.exception(
-                    f"Could not reach Automagica Portal. Waiting {interval} second(s) before retrying."
+    def _job_thread(self, job, headers):
+        """
+        Run a job in its own slot. Jobs that require the desktop (the
+        default) run one at a time, other jobs run in parallel.
+        """
+        try:
+            if job.get("exclusive_desktop", True):
+                JOBS_QUEUED.inc()
+
+                try:
+                    self.desktop_lock.acquire()
+                finally:
+                    JOBS_QUEUED.dec()
+
+                try:
+                    with _job_metrics(job):
+                        self._run_job(job, headers)
+                finally:
+                    self.desktop_lock.release()
+
+            else:
+                with _job_metrics(job):
+                    self._run_job(job, headers)
+
+        except:
+            NotificationWindow(self, message=f"Failed job {job['job_id']}")
+            self.config.logger.exception(
+                f"Could not complete job {job['job_id']}."
+            )
+
+        finally:
+            self.job_slots.release()
+
+    def _run_job(self, job, headers):
+        """
+        Download the job files, run the job and report back to the Portal
+        """
+        NotificationWindow(self, message=f"Received job {job['job_id']}")
+        self.config.logger.info(f"Received job {job['job_id']}")
+
+        # Create directory to store job-related files
+        local_job_path = os.path.join(
+            os.path.expanduser("~"), ".automagica", job["job_id"]
+        )
+        os.makedirs(local_job_path)
+        os.makedirs(os.path.join(local_job_path, "input"))
+        os.makedirs(os.path.join(local_job_path, "output"))
+
+        # Download job input files in parallel, files with a checksum are
+        # verified and cached
+        transfer_all(
+            download_file,
+            [
+                (
+                    job_file["url"],
+                    os.path.join(
+                        local_job_path, "input", job_file["filename"]
+                    ),
+                    job_file.get("sha256"),
+                    self.file_cache,
+                )
+                for job_file in job["job_files"]
+            ],
+            max_workers=self.max_transfers,
+        )
+
+        if job.get("parameters"):
+            with open(
+                os.path.join(local_job_path, "input", "parameters.py"),
+                "w",
+            ) as f:
+                f.write(job["parameters"])
+
+        entrypoint = job["job_entrypoint"]
+
+        # IPython Notebook / Automagica Lab
+        if entrypoint.endswith(".ipynb"):
+            output, returncode = self.run_notebook(
+                os.path.join(local_job_path, "input", entrypoint),
+                local_job_path,
+            )
+
+        # Python Script File
+        elif entrypoint.endswith(".py"):
+            output, returncode = self.run_script(
+                os.path.join(local_job_path, "input", entrypoint),
+                local_job_path,
+            )
+
+        # Automagica FLow
+        elif entrypoint.endswith(".json"):
+            output, returncode = self.run_flow(
+                os.path.join(local_job_path, "input", entrypoint),
+                local_job_path,
+            )
+
+        # Other command
+        else:
+            output, returncode = self.run_command(entrypoint, local_job_path)
+
+        # Write console output
+        with open(
+            os.path.join(local_job_path, "output", "console.txt"),
+            "w",
+        ) as f:
+            f.write(output)
+
+        if returncode == 0:
+            job["status"] = "completed"
+            NotificationWindow(self, message=f"Completed job {job['job_id']}")
+            self.config.logger.info(f"Completed job {job['job_id']}")
+
+        else:
+            job["status"] = "failed"
+            NotificationWindow(self, message=f"Failed job {job['job_id']}")
+            self.config.logger.info(f"Failed job {job['job_id']}")
+
+        # Make list of output files after job has ran
+        output_files = []
+
+        for file_path in os.listdir(os.path.join(local_job_path, "output")):
+            output_files.append({"filename": file_path})
+
+        # Prepare finished job package
+        data = {
+            "bot_secret": self.config.values["bot_secret"],
+            "job_id": job["job_id"],
+            "job_status": job["status"],
+            "job_output_files": output_files,
+            "job_output": output,
+        }
+
+        # Update Portal on job status and request S3 signed URLs to upload job output files
+        r = http_client.post(
+            self.config.values["portal_url"] + "/api/job/status",
+            json=data,
+            headers=headers,
+        )
+
+        data = r.json()
+
+        # Upload job output files in parallel
+        transfer_all(
+            upload_file,
+            [
+                (
+                    output_file["payload"]["url"],
+                    os.path.join(
+                        local_job_path, "output", output_file["filename"]
+                    ),
+                    output_file["payload"]["fields"],
                 )
-                sleep(interval)
+                for output_file in data["output_files"]
+            ],
+            max_workers=self.max_transfers,
+        )
 
 
 class WandApp(App):
@@ -408,20 +408,19 @@ class FlowFrame(tk.Frame):
 
             self.graphs.append(graph)
 
+        # Connections may have been changed directly on the nodes
+        self.flow.reindex()
+
         for node in self.flow.nodes:
-            for attr in dir(node):
-                if attr.endswith("_node"):
-                    next_node_uid = getattr(node, attr)
-                    if next_node_uid:
-                        next_node = self.flow.get_node_by_uid(next_node_uid)
-                        if next_node:
-                            connector = ConnectorGraph(
-                                self,
-                                node.graph,
-                                next_node.graph,
-                                connector_type=attr,
-                            )
-                            self.connectors.append(connector)
+            for attr, next_node in self.flow.get_connections(node):
+                if next_node:
+                    connector = ConnectorGraph(
+                        self,
+                        node.graph,
+                        next_node.graph,
+                        connector_type=attr,
+                    )
+                    self.connectors.append(connector)
 
         self.set_canvas_layers()
 
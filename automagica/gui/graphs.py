@@ -333,8 +333,7 @@ class StartNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.rectangle)
         self.parent.canvas.delete(self.text)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
 
         self.parent.draw()
 
@@ -436,8 +435,7 @@ class ActivityNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.uid_text)
         self.parent.canvas.delete(self.icon)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
         self.parent.draw()
 
     def run_click(self, event):
@@ -563,8 +561,7 @@ class IfElseNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.label_text)
         self.parent.canvas.delete(self.uid_text)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
         self.parent.draw()
 
     def double_clicked(self, event):
@@ -670,8 +667,7 @@ class LoopNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.label_text)
         self.parent.canvas.delete(self.uid_text)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
         self.parent.draw()
 
     def double_clicked(self, event):
@@ -789,8 +785,7 @@ class DotPyFileNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.label_text)
         self.parent.canvas.delete(self.uid_text)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
         self.parent.draw()
 
     def double_clicked(self, event):
@@ -926,8 +921,7 @@ class PythonCodeNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.label_text)
         self.parent.canvas.delete(self.uid_text)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
         self.parent.draw()
 
     def double_clicked(self, event):
@@ -1038,8 +1032,7 @@ class CommentNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.label_text)
         self.parent.canvas.delete(self.uid_text)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
         self.parent.draw()
 
     def double_clicked(self, event):
@@ -1176,8 +1169,7 @@ class SubFlowNodeGraph(NodeGraph):
         self.parent.canvas.delete(self.label_text)
         self.parent.canvas.delete(self.uid_text)
 
-        self.parent.parent.master.flow.nodes.remove(self.node)
-        self.parent.parent.master.flow.remove_dead_ends()
+        self.parent.parent.master.flow.remove_node(self.node)
         self.parent.draw()
 
     def double_clicked(self, event):
@@ -1266,7 +1258,9 @@ class ConnectorGraph:
 
     def delete_clicked(self):
         # Remove connection
-        setattr(self.from_nodegraph.node, self.connector_type, None)
+        self.parent.flow.connect(
+            self.from_nodegraph.node, self.connector_type, None
+        )
 
         # Remove from canvas
         self.parent.connectors.remove(self)
@@ -10,6 +10,7 @@ from automagica import config
 from automagica.config import _, ICONS
 from automagica.gui.buttons import Button, ToolbarImageButton
 from automagica.gui.graphs import generate_icon
+from automagica.search import SearchIndex
 
 
 class KeycombinationEntry(tk.Frame):
@@ -406,6 +407,11 @@ class AutocompleteDropdown(ttk.Combobox):
         self.values = sorted(self["values"], key=str.lower)
         self["values"] = self.values
 
+        # Not self.index, which is a method of the Combobox
+        self.search_index = SearchIndex(
+            {value: [(value, 1)] for value in self.values}
+        )
+
         self.matches = []
         self.match_index = 0
         self.pos = 0
@@ -418,11 +424,7 @@ class AutocompleteDropdown(ttk.Combobox):
         else:
             self.pos = len(self.get())
 
-        matches = []
-
-        for element in self.values:
-            if element.lower().startswith(self.get().lower()):
-                matches.append(element)
+        matches = self.search_index.startswith(self.get())
 
         if matches != self.matches:
             self.match_index = 0
@@ -553,6 +555,8 @@ class SettingContextMenu(tk.Frame):
 class ActivityBlock:
     def __init__(self, canvas, activity, x, y):
         self.canvas = canvas
+        self.key = activity.get("key")
+        self.y = y
 
         if activity.get("class"):
             name = "{} - {}".format(activity["class"], activity["name"])
@@ -593,6 +597,17 @@ class ActivityBlock:
             lambda e: self.select_activity(activity.get("key")),
         )
 
+    def move(self, y):
+        """
+        Show the block at another height
+        """
+        self.canvas.itemconfigure(self.key, state=tk.NORMAL)
+        self.canvas.move(self.key, 0, y - self.y)
+        self.y = y
+
+    def hide(self):
+        self.canvas.itemconfigure(self.key, state=tk.HIDDEN)
+
     def select_activity(self, key):
         self.canvas.master.master.master.master.add_activity(key)
 
@@ -601,9 +616,21 @@ class ActivitySelectionFrame(tk.Frame):
     def __init__(self, parent, *args, **kwargs):
         super().__init__(parent, *args, **kwargs)
 
-        from automagica.utilities import all_activities
-
-        self.activities = all_activities()
+        self.activities = config.ACTIVITIES
+
+        self.index = SearchIndex(
+            {
+                key: [
+                    (activity["name"], 3),
+                    (activity.get("class") or "", 2),
+                    (" ".join(activity["keywords"]), 2),
+                    (activity["description"], 1),
+                ]
+                for key, activity in self.activities.items()
+            }
+        )
+        self.activity_blocks = {}
+        self.search_job = None
 
         self.nodes_label = tk.Label(
             self,
@@ -622,7 +649,7 @@ class ActivitySelectionFrame(tk.Frame):
             textvariable=self.query,
             placeholder=_("Search activities..."),
         )
-        self.query.trace("w", self.search_activities)
+        self.query.trace("w", self.schedule_search)
         self.search_entry.focus()
         self.search_entry.bind("<Return>", self.search_activities)
         self.search_entry.pack(fill="x")
@@ -657,42 +684,56 @@ class ActivitySelectionFrame(tk.Frame):
         self.canvas.yview_scroll(int(-1 * (event.delta / 60)), "units")
 
     def render_activity_blocks(self, activities):
-        self.activity_blocks = []
+        """
+        Show the blocks of the activities in order, blocks are only created
+        for activities that were not shown before
+        """
+        shown = set()
 
         for i, activity in enumerate(activities):
-            activity_block = ActivityBlock(
-                self.canvas, activity, 5, (22 * i) + 5
-            )
-            self.activity_blocks.append(activity_block)
+            key = activity.get("key")
+            y = (22 * i) + 5
 
-        self.canvas.config(
-            scrollregion=(0, 0, 300, 22 * len(self.activity_blocks))
-        )
+            if key in self.activity_blocks:
+                self.activity_blocks[key].move(y)
+
+            else:
+                self.activity_blocks[key] = ActivityBlock(
+                    self.canvas, activity, 5, y
+                )
+
+            shown.add(key)
+
+        for key, activity_block in self.activity_blocks.items():
+            if key not in shown:
+                activity_block.hide()
+
+        self.canvas.config(scrollregion=(0, 0, 300, 22 * len(activities)))
+
+    def schedule_search(self, *args):
+        """
+        Search once typing pauses
+        """
+        if self.search_job:
+            self.after_cancel(self.search_job)
+
+        self.search_job = self.after(150, self.search_activities)
 
     def search_activities(self, *args):
         """
         Search for activities by their keywords, name or description
         """
+        self.search_job = None
+
         query = self.search_entry.get()
 
         # Clean query
         query = query.strip()
         query = query.lower()
 
-        # Clear canvas
-        self.canvas.delete("all")
-
-        results = []
+        if query == _("Search activities...").lower():
+            query = ""
 
-        for __, val in self.activities.items():
-            if (
-                any(
-                    [query in keyword.lower() for keyword in val["keywords"]]
-                )  # Matches keywords
-                or query in val["name"].lower()  # Matches name
-                or query in val["description"].lower()  # Matches description
-                or query == "Search activities...".lower()
-            ):
-                results.append(val)
+        results = [self.activities[key] for key in self.index.search(query)]
 
         self.render_activity_blocks(results)
@@ -12,7 +12,7 @@ from automagica.httpclient import http_client
 from PIL import Image, ImageTk
 
 from automagica import config
-from automagica.bots import ThreadedBot
+from automagica.bots import RemoteObject, ThreadedBot
 from automagica.config import _
 from automagica.flow import Flow
 from automagica.gui.buttons import Button, HelpButton, LargeButton
@@ -1068,21 +1068,9 @@ class WandWindow(Window):
         Captures the screen to a Pillow Image object
         TODO: this does not work for xvfb-based systems
         """
-        from PIL import Image
-        import mss
+        from automagica.screen import get_grabber
 
-        with mss.mss() as sct:
-
-            # Find primary monitor
-            for monitor in sct.monitors:
-                if monitor["left"] == 0 and monitor["top"] == 0:
-                    break
-
-            sct_img = sct.grab(monitor)
-
-        img = Image.frombytes("RGB", sct_img.size, sct_img.bgra, "raw", "BGRX")
-
-        return img
+        return get_grabber().grab_image()
 
     def select_target(self):
         """
@@ -1388,6 +1376,16 @@ class WandWindow(Window):
             print(r.content)
 
         if data.get("automagica_id"):
+            from automagica.vision import save_element
+
+            # Keep the templates for local detection
+            save_element(
+                data["automagica_id"],
+                self.screenshot,
+                self.target,
+                self.anchors,
+            )
+
             return data["automagica_id"]
 
         else:
@@ -1900,7 +1898,10 @@ class VariableExplorerWindow(Window):
 
             if not isinstance(val, (ModuleType, FunctionType, type)):
                 self.variables.insert(tk.END, key)
-                self.types.insert(tk.END, type(val).__name__)
+                if isinstance(val, RemoteObject):
+                    self.types.insert(tk.END, val.type_name)
+                else:
+                    self.types.insert(tk.END, type(val).__name__)
 
                 if isinstance(val, (int, dict)):
                     self.values.insert(tk.END, str(val))
@@ -1979,7 +1980,9 @@ class NodePropsWindow(Window):
         # Save Node things
         self.node.label = self.label_entry.get()
 
-        self.node.next_node = self.next_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "next_node", self.next_node_menu.get()
+        )
 
         self.parent.draw()
 
@@ -2000,7 +2003,7 @@ class NodePropsWindow(Window):
         self.destroy()
 
     def remove(self):
-        self.parent.parent.master.flow.nodes.remove(self.node)
+        self.parent.parent.master.flow.remove_node(self.node)
         self._close()
 
     def create_node_frame(self):
@@ -2387,9 +2390,13 @@ class ActivityNodePropsWindow(NodePropsWindow):
         # Save Node things
         self.node.label = self.label_entry.get()
 
-        self.node.next_node = self.next_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "next_node", self.next_node_menu.get()
+        )
 
-        self.node.on_exception_node = self.on_exception_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "on_exception_node", self.on_exception_node_menu.get()
+        )
 
         self.parent.draw()
 
@@ -2552,8 +2559,12 @@ class IfElseNodePropsWindow(NodePropsWindow):
         return frame
 
     def save(self):
-        self.node.next_node = self.next_node_menu.get()
-        self.node.else_node = self.else_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "next_node", self.next_node_menu.get()
+        )
+        self.parent.flow.connect(
+            self.node, "else_node", self.else_node_menu.get()
+        )
         self.node.condition = self.condition_entry.get()
         self.node.label = self.label_entry.get()
 
@@ -2729,8 +2740,12 @@ class LoopNodePropsWindow(NodePropsWindow):
         return frame
 
     def save(self):
-        self.node.next_node = self.next_node_menu.get()
-        self.node.loop_node = self.loop_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "next_node", self.next_node_menu.get()
+        )
+        self.parent.flow.connect(
+            self.node, "loop_node", self.loop_node_menu.get()
+        )
 
         self.node.label = self.label_entry.get()
 
@@ -2845,8 +2860,12 @@ class DotPyFileNodePropsWindow(NodePropsWindow):
         return frame
 
     def save(self):
-        self.node.next_node = self.next_node_menu.get()
-        self.node.on_exception_node = self.on_exception_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "next_node", self.next_node_menu.get()
+        )
+        self.parent.flow.connect(
+            self.node, "on_exception_node", self.on_exception_node_menu.get()
+        )
         self.node.dotpyfile_path = self.dotpyfile_path_entry.get()
         self.node.label = self.label_entry.get()
 
@@ -3006,8 +3025,12 @@ class PythonCodeNodePropsWindow(NodePropsWindow):
         return frame
 
     def save(self):
-        self.node.next_node = self.next_node_menu.get()
-        self.node.on_exception_node = self.on_exception_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "next_node", self.next_node_menu.get()
+        )
+        self.parent.flow.connect(
+            self.node, "on_exception_node", self.on_exception_node_menu.get()
+        )
         self.node.code = self.code_entry.get("1.0", tk.END)
         self.node.label = self.label_entry.get()
 
@@ -3245,8 +3268,12 @@ class SubFlowNodePropsWindow(NodePropsWindow):
         """
         Save
         """
-        self.node.next_node = self.next_node_menu.get()
-        self.node.on_exception_node = self.on_exception_node_menu.get()
+        self.parent.flow.connect(
+            self.node, "next_node", self.next_node_menu.get()
+        )
+        self.parent.flow.connect(
+            self.node, "on_exception_node", self.on_exception_node_menu.get()
+        )
         self.node.subflow_path = self.subflow_path_entry.get()
         self.node.label = self.label_entry.get()
 
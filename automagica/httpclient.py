@@ -1,7 +1,33 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
 
+import gzip
+import os
 import urllib3
 import json as jsonlib
+from urllib3.fields import RequestField
+from urllib3.filepost import choose_boundary
+
+
+class PoolManager(urllib3.PoolManager):
+    """
+    urllib3 PoolManager with a connection limit per host
+    """
+
+    def __init__(self, host_limits=None, **kwargs):
+        super().__init__(**kwargs)
+        self.host_limits = host_limits or {}
+
+    def connection_from_host(
+        self, host, port=None, scheme="http", pool_kwargs=None
+    ):
+        limit = self.host_limits.get(host)
+
+        if limit:
+            pool_kwargs = dict(pool_kwargs or {}, maxsize=limit, block=True)
+
+        return super().connection_from_host(
+            host, port=port, scheme=scheme, pool_kwargs=pool_kwargs
+        )
 
 
 class HTTPClient:
@@ -9,67 +35,262 @@ class HTTPClient:
     HTTPClient interface extending urllib3
     """
 
-    def __init__(self):
-        """Create HTTP Client"""
-        self.pool = urllib3.PoolManager()
+    def __init__(
+        self,
+        retries=3,
+        backoff_factor=0.5,
+        retry_statuses=(429, 502, 503, 504),
+        maxsize=10,
+        host_limits=None,
+    ):
+        """Create HTTP Client. Idempotent requests are retried on connection
+        errors and retry_statuses with exponential backoff (backoff_factor *
+        2 ** retry seconds). maxsize is the number of connections kept per
+        host, host_limits caps the number of connections for given hosts."""
+        self.retries = urllib3.Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=retry_statuses,
+            raise_on_status=False,
+        )
+        self.pool = PoolManager(
+            host_limits=host_limits,
+            maxsize=maxsize,
+            retries=self.retries,
+            headers=urllib3.make_headers(accept_encoding=True),
+        )
+
+    def _headers(self, headers):
+        return dict(self.pool.headers, **(headers or {}))
 
     def post(
-        self, url, data=None, json=None, headers=None, timeout=30, files=None
+        self,
+        url,
+        data=None,
+        json=None,
+        headers=None,
+        timeout=30,
+        files=None,
+        compress=False,
+        retries=None,
     ):
-        """Make a POST request"""
+        """Make a POST request, with compress=True the body is sent gzipped"""
+        headers = self._headers(headers)
 
         if files:
-            for key, val in files.items():
-                temp = list(files[key])
-                temp[1] = temp[1].read()
-                files[key] = tuple(temp)
-
-            fields = files
+            # Stream the form fields and files, files go last
+            body = MultipartBody(
+                list((data or {}).items()) + list(files.items())
+            )
 
-            if data:
-                fields.update(data)
+            headers["Content-Type"] = body.content_type
+            headers["Content-Length"] = str(body.length)
 
             return HTTPResponse(
-                self.pool.request(
+                self.pool.urlopen(
                     "POST",
                     url,
-                    fields=files,
+                    body=body,
                     headers=headers,
                     timeout=timeout,
+                    retries=retries,
                 )
             )
 
         if json:
-            if not headers:
-                headers = {"Content-Type": "application/json"}
+            headers["Content-Type"] = "application/json"
+            data = jsonlib.dumps(json).encode("utf-8")
 
-            else:
-                headers["Content-Type"] = "application/json"
+        if compress and data:
+            if isinstance(data, str):
+                data = data.encode("utf-8")
 
-            encoded_data = jsonlib.dumps(json).encode("utf-8")
-            return HTTPResponse(
-                self.pool.request(
-                    "POST",
-                    url,
-                    body=encoded_data,
-                    headers=headers,
-                    timeout=timeout,
-                )
+            headers["Content-Encoding"] = "gzip"
+            data = gzip.compress(data)
+
+        return HTTPResponse(
+            self.pool.urlopen(
+                "POST",
+                url,
+                body=data,
+                headers=headers,
+                timeout=timeout,
+                retries=retries,
             )
+        )
 
+    def get(self, url, headers=None, stream=False, timeout=30, retries=None):
+        """Make a GET request, with stream=True the body is not loaded until
+        it is read with iter_content"""
         return HTTPResponse(
-            self.pool.request(
-                "POST", url, body=data, headers=headers, timeout=timeout
+            self.pool.urlopen(
+                "GET",
+                url,
+                headers=self._headers(headers),
+                timeout=timeout,
+                retries=retries,
+                preload_content=not stream,
             )
         )
 
-    def get(self, url, headers=None, stream=False, timeout=30):
-        """Make a GET request"""
+    def head(self, url, headers=None, timeout=30, retries=None):
+        """Make a HEAD request"""
         return HTTPResponse(
-            self.pool.request("GET", url, headers=headers, timeout=timeout)
+            self.pool.urlopen(
+                "HEAD",
+                url,
+                headers=self._headers(headers),
+                timeout=timeout,
+                retries=retries,
+            )
+        )
+
+
+class AsyncHTTPClient:
+    """
+    asyncio variant of HTTPClient with the same API, requests run in the
+    default executor of the running event loop so they do not block it
+    """
+
+    def __init__(self, client=None):
+        """Create asynchronous HTTP client, by default it shares the
+        connection pools of http_client"""
+        self.client = client or http_client
+
+    async def _run(self, function, *args, **kwargs):
+        import asyncio
+        import functools
+
+        loop = asyncio.get_running_loop()
+
+        return await loop.run_in_executor(
+            None, functools.partial(function, *args, **kwargs)
+        )
+
+    async def post(self, url, **kwargs):
+        """Make a POST request"""
+        return AsyncHTTPResponse(
+            await self._run(self.client.post, url, **kwargs)
+        )
+
+    async def get(self, url, **kwargs):
+        """Make a GET request"""
+        return AsyncHTTPResponse(
+            await self._run(self.client.get, url, **kwargs)
+        )
+
+    async def head(self, url, **kwargs):
+        """Make a HEAD request"""
+        return AsyncHTTPResponse(
+            await self._run(self.client.head, url, **kwargs)
         )
 
 
+class MultipartBody:
+    """File-like multipart/form-data request body that reads file fields in
+    chunks instead of loading them in memory"""
+
+    def __init__(self, fields):
+        """Create body from (name, value) or (name, (filename, file)) pairs"""
+        boundary = choose_boundary()
+
+        self.content_type = "multipart/form-data; boundary=" + boundary
+        self.parts = []
+        self.length = 0
+        self.position = 0
+
+        for name, value in fields:
+            if isinstance(value, tuple):
+                filename, data = value[:2]
+                field = RequestField.from_tuples(name, (filename, b""))
+
+            else:
+                data = value
+                field = RequestField.from_tuples(name, value)
+
+            self._add("--{}\r\n".format(boundary).encode("utf-8"))
+            self._add(field.render_headers().encode("utf-8"))
+
+            if isinstance(data, str):
+                data = data.encode("utf-8")
+
+            elif isinstance(data, int):
+                data = str(data).encode("utf-8")
+
+            self._add(data)
+            self._add(b"\r\n")
+
+        self._add("--{}--\r\n".format(boundary).encode("utf-8"))
+
+    def _add(self, part):
+        if not isinstance(part, bytes):
+            try:
+                start = part.tell()
+                size = os.fstat(part.fileno()).st_size - start
+                self.parts.append((part, start, size))
+                self.length += size
+                return
+
+            except (AttributeError, OSError):
+                # In-memory file objects
+                part = part.read()
+
+        self.parts.append((part, 0, len(part)))
+        self.length += len(part)
+
+    def tell(self):
+        """Position in the body, urllib3 uses it to rewind on retries"""
+        return self.position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        """Move to a position in the body"""
+        if whence == os.SEEK_CUR:
+            offset += self.position
+
+        elif whence == os.SEEK_END:
+            offset += self.length
+
+        self.position = max(0, offset)
+
+        return self.position
+
+    def read(self, size=-1):
+        """Read the next chunk of the body"""
+        end = self.length
+
+        if size is not None and size >= 0:
+            end = min(end, self.position + size)
+
+        chunks = []
+        offset = 0
+
+        for part, start, length in self.parts:
+            if self.position >= end:
+                break
+
+            if self.position < offset + length:
+                skip = self.position - offset
+                n = min(length - skip, end - self.position)
+
+                if isinstance(part, bytes):
+                    chunk = part[skip : skip + n]
+
+                else:
+                    part.seek(start + skip)
+                    chunk = part.read(n)
+
+                chunks.append(chunk)
+                self.position += len(chunk)
+
+                # The file is shorter than when the body was created
+                if len(chunk) < n:
+                    break
+
+            offset += length
+
+        return b"".join(chunks)
+
+
 class HTTPResponse:
     """Wrapping class for urllib3 to provide reusable
     interface"""
@@ -87,6 +308,15 @@ class HTTPResponse:
         """Returns text"""
         return self.response.data.decode("utf-8")
 
+    def iter_content(self, chunk_size=64 * 1024):
+        """Iterates over the content in chunks"""
+        try:
+            for chunk in self.response.stream(chunk_size):
+                yield chunk
+
+        finally:
+            self.response.release_conn()
+
     @property
     def content(self):
         """Returns content"""
@@ -97,10 +327,75 @@ class HTTPResponse:
         """Returns status"""
         return self.response.status
 
+    @property
+    def headers(self):
+        """Returns the response headers"""
+        return self.response.headers
+
     @property
     def url(self):
         """Returns the url"""
         return self.response.geturl()
 
 
+class AsyncHTTPResponse:
+    """Asynchronous wrapper around HTTPResponse, reading a (streamed) body
+    does not block the event loop. Unlike on HTTPResponse, text and content
+    are coroutine methods like json (await r.text())."""
+
+    def __init__(self, response):
+        """Create response class"""
+        self.response = response
+
+    async def _read(self, function, *args):
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None, function, *args
+        )
+
+    async def iter_content(self, chunk_size=64 * 1024):
+        """Iterates asynchronously over the content in chunks"""
+        chunks = self.response.iter_content(chunk_size)
+
+        try:
+            while True:
+                chunk = await self._read(next, chunks, None)
+
+                if chunk is None:
+                    break
+
+                yield chunk
+
+        finally:
+            chunks.close()
+
+    async def json(self):
+        """Returns a JSON"""
+        return await self._read(self.response.json)
+
+    async def text(self):
+        """Returns text"""
+        return await self._read(lambda: self.response.text)
+
+    async def content(self):
+        """Returns content"""
+        return await self._read(lambda: self.response.content)
+
+    @property
+    def status_code(self):
+        """Returns status"""
+        return self.response.status_code
+
+    @property
+    def headers(self):
+        """Returns the response headers"""
+        return self.response.headers
+
+    @property
+    def url(self):
+        """Returns the url"""
+        return self.response.url
+
+
 http_client = HTTPClient()
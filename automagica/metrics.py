@@ -0,0 +1,519 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import logging
+import threading
+import weakref
+from bisect import bisect_left
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Job and activity durations in seconds
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    300,
+    900,
+    3600,
+)
+
+
+class _ShardOwner:
+    """
+    Held by a thread next to its shard, to notice the thread ending
+    """
+
+
+class _Child:
+    """
+    Values of a metric for one combination of label values. Every thread
+    updates its own preallocated shard of the values, so updates need no
+    lock and do not allocate; shards are added up when the metric is
+    exported. The shard of a finished thread is added to the totals of
+    the finished threads.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.shards = {}
+        self.finished = [0] * size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self.local.shard
+
+        except AttributeError:
+            shard = self.local.shard = [0] * self.size
+
+            # The thread local values are dropped when the thread ends
+            self.local.owner = _ShardOwner()
+            finalizer = weakref.finalize(self.local.owner, self._finish, shard)
+            finalizer.atexit = False
+
+            with self.lock:
+                self.shards[id(shard)] = shard
+
+            return shard
+
+    def _finish(self, shard):
+        with self.lock:
+            del self.shards[id(shard)]
+
+            for i, value in enumerate(shard):
+                self.finished[i] += value
+
+    def values(self):
+        with self.lock:
+            totals = list(self.finished)
+            shards = list(self.shards.values())
+
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+
+        return totals
+
+    def add(self, values):
+        """
+        Add exported values (e.g. of a worker process)
+        """
+        shard = self._shard()
+
+        for i, value in enumerate(values):
+            shard[i] += value
+
+
+class _CounterChild(_Child):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        try:
+            self.local.shard[0] += amount
+        except AttributeError:
+            self._shard()[0] += amount
+
+
+class _GaugeChild(_CounterChild):
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class _HistogramChild(_Child):
+    def __init__(self, buckets):
+        # Counts per bucket, the +Inf bucket and the sum of the observations
+        super().__init__(len(buckets) + 2)
+        self.buckets = buckets
+
+    def observe(self, value):
+        try:
+            shard = self.local.shard
+        except AttributeError:
+            shard = self._shard()
+
+        shard[bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+
+class Metric:
+    """
+    Metric with optional labels, use labels() for the values of a label
+    combination. Metrics without labels can be updated directly. Values
+    kept elsewhere can be read when the metrics are collected instead (see
+    set_function).
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.function = None
+        self.lock = threading.Lock()
+
+        if not self.label_names:
+            self._default = self.labels()
+
+        if registry is None:
+            registry = REGISTRY
+
+        if registry is not False:
+            registry.register(self)
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Values of the metric for a combination of label values, look these
+        up once and keep them around on hot paths
+        """
+        values = tuple(str(value) for value in values)
+        child = self.children.get(values)
+
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(
+                    "{} expects labels {}".format(self.name, self.label_names)
+                )
+
+            with self.lock:
+                child = self.children.setdefault(values, self._child())
+
+        return child
+
+    def export(self):
+        """
+        Current values by label values, see merge()
+        """
+        return {
+            values: child.values()
+            for values, child in list(self.children.items())
+        }
+
+    def merge(self, exported):
+        """
+        Add values exported by the same metric elsewhere, e.g. in a worker
+        process
+        """
+        for values, totals in exported.items():
+            self.labels(*values).add(totals)
+
+    def _label_text(self, values, extra=()):
+        pairs = list(zip(self.label_names, values)) + list(extra)
+
+        if not pairs:
+            return ""
+
+        return "{{{}}}".format(
+            ",".join(
+                '{}="{}"'.format(
+                    name,
+                    str(value)
+                    .replace("\\", "\\\\")
+                    .replace("\n", "\\n")
+                    .replace('"', '\\"'),
+                )
+                for name, value in pairs
+            )
+        )
+
+    def set_function(self, function):
+        """
+        Read the metric from a function returning a number, or a dictionary
+        {label values: number} for metrics with labels
+        """
+        self.function = function
+
+    def samples(self):
+        """
+        (suffix, label text, value) of the exposition lines
+        """
+        if self.function is None:
+            values = {
+                values: totals[0] for values, totals in self.export().items()
+            }
+
+        else:
+            values = self.function()
+
+            if not isinstance(values, dict):
+                values = {(): values}
+
+        for label_values, value in sorted(values.items()):
+            yield "", self._label_text(label_values), value
+
+    def expose(self):
+        """
+        Metric in the Prometheus text exposition format
+        """
+        lines = [
+            "# HELP {} {}".format(self.name, self.documentation),
+            "# TYPE {} {}".format(self.name, self.kind),
+        ]
+
+        for suffix, labels, value in self.samples():
+            lines.append(
+                "{}{}{} {}".format(self.name, suffix, labels, _number(value))
+            )
+
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count
+    """
+
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+
+class Gauge(Metric):
+    """
+    Value that goes up and down
+    """
+
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeChild()
+
+    def inc(self, amount=1):
+        self._default.inc(amount)
+
+    def dec(self, amount=1):
+        self._default.dec(amount)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g. durations in seconds
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=None, **kwargs):
+        self.buckets = tuple(sorted(buckets or DEFAULT_BUCKETS))
+
+        super().__init__(name, documentation, labels, **kwargs)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def samples(self):
+        for values, totals in sorted(self.export().items()):
+            count = 0
+
+            for bound, bucket_count in zip(
+                self.buckets + ("+Inf",), totals[:-1]
+            ):
+                count += bucket_count
+                yield "_bucket", self._label_text(
+                    values, [("le", _number(bound))]
+                ), count
+
+            yield "_sum", self._label_text(values), totals[-1]
+            yield "_count", self._label_text(values), count
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+
+    return repr(value)
+
+
+class Registry:
+    """
+    Metrics exposed together
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def expose(self):
+        """
+        All metrics in the Prometheus text exposition format
+        """
+        text = []
+
+        for metric in list(self.metrics):
+            try:
+                text.append(metric.expose())
+
+            except Exception:
+                logging.getLogger("automagica.metrics").exception(
+                    "Could not collect {}".format(metric.name)
+                )
+
+        return "\n".join(text) + "\n"
+
+
+REGISTRY = Registry()
+
+JOBS_STARTED = Counter("automagica_jobs_started_total", "Jobs started.")
+JOBS_COMPLETED = Counter(
+    "automagica_jobs_completed_total", "Jobs completed succesfully."
+)
+JOBS_FAILED = Counter("automagica_jobs_failed_total", "Jobs failed.")
+JOBS_RUNNING = Gauge("automagica_jobs_running", "Jobs running.")
+JOBS_QUEUED = Gauge(
+    "automagica_jobs_queued", "Jobs received, waiting for the desktop."
+)
+JOB_DURATION = Histogram(
+    "automagica_job_duration_seconds", "Duration of jobs in seconds."
+)
+WORKERS_IDLE = Gauge("automagica_workers_idle", "Idle worker processes.")
+
+ACTIVITY_DURATION = Histogram(
+    "automagica_activity_duration_seconds",
+    "Duration of activity calls in seconds.",
+    labels=("activity",),
+)
+ACTIVITY_ERRORS = Counter(
+    "automagica_activity_errors_total",
+    "Activity calls that raised an exception.",
+    labels=("activity",),
+)
+
+# Collected in worker processes and merged into the bot's metrics
+WORKER_METRICS = (ACTIVITY_DURATION, ACTIVITY_ERRORS)
+
+HTTP_REQUESTS = Counter(
+    "automagica_http_requests_total",
+    "Requests made by the HTTP client.",
+    labels=("host",),
+)
+HTTP_CONNECTIONS = Counter(
+    "automagica_http_connections_total",
+    "Connections opened by the HTTP client.",
+    labels=("host",),
+)
+HTTP_POOL_SIZE = Gauge(
+    "automagica_http_pool_size",
+    "Connections kept per pool by the HTTP client.",
+    labels=("host",),
+)
+HTTP_POOL_AVAILABLE = Gauge(
+    "automagica_http_pool_available",
+    "Connections of the pools not in use.",
+    labels=("host",),
+)
+
+
+def _http_pools():
+    """
+    Connection pools of the shared HTTP client by host
+    """
+    from automagica.httpclient import http_client
+
+    pools = http_client.pool.pools
+    result = {}
+
+    for key in pools.keys():
+        try:
+            pool = pools[key]
+        except KeyError:
+            continue
+
+        result["{}:{}".format(pool.host, pool.port)] = pool
+
+    return result
+
+
+def _pool_stat(function):
+    return lambda: {
+        (host,): function(pool) for host, pool in _http_pools().items()
+    }
+
+
+# Pool statistics are kept by urllib3, these are read when collected
+for metric, function in [
+    (HTTP_REQUESTS, lambda pool: pool.num_requests),
+    (HTTP_CONNECTIONS, lambda pool: pool.num_connections),
+    (HTTP_POOL_SIZE, lambda pool: pool.pool.maxsize if pool.pool else 0),
+    (HTTP_POOL_AVAILABLE, lambda pool: pool.pool.qsize() if pool.pool else 0),
+]:
+    metric.set_function(_pool_stat(function))
+
+
+class WorkerMetrics:
+    """
+    Takes the increase of the worker metrics since the last take() in a
+    worker process, to merge them into the bot's metrics with merge()
+    """
+
+    def __init__(self, metrics=WORKER_METRICS):
+        self.metrics = metrics
+        self.previous = [{} for _ in metrics]
+
+    def take(self):
+        current = [metric.export() for metric in self.metrics]
+        increase = []
+
+        for exported, previous in zip(current, self.previous):
+            increase.append(
+                {
+                    values: [
+                        value - old
+                        for value, old in zip(
+                            totals, previous.get(values, [0] * len(totals))
+                        )
+                    ]
+                    for values, totals in exported.items()
+                    if totals != previous.get(values)
+                }
+            )
+
+        self.previous = current
+
+        return increase
+
+    def merge(self, increase):
+        for metric, exported in zip(self.metrics, increase):
+            metric.merge(exported)
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=None):
+    """
+    Serve the metrics at http://host:port/metrics in a daemon thread,
+    returns the server (stop it with server.shutdown())
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+
+            body = registry.expose().encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
@@ -3,7 +3,7 @@
 import random
 import string
 
-from automagica.config import ACTIVITIES
+from automagica import config
 
 
 class Node:
@@ -155,7 +155,7 @@ class ActivityNode(Node):
         if self.label:
             return self.label
         else:
-            return ACTIVITIES[self.activity]["name"]
+            return config.ACTIVITIES[self.activity]["name"]
 
     def get_next_node(self):
         """
@@ -181,9 +181,25 @@ class ActivityNode(Node):
             "on_exception_node": self.on_exception_node,
         }
 
-    def run(self, bot, on_done=None, on_fail=None):
+    def get_import(self):
         """
-        Run the Activity node
+        Build the import statement required by the Activity node
+        """
+        if self.class_:
+            # from automagica.activities import Chrome
+            return "from {} import {}".format(
+                ".".join(self.activity.split(".")[:-2]),
+                self.activity.split(".")[-2],
+            )
+
+        return "from {} import {}".format(
+            ".".join(self.activity.split(".")[:-1]),
+            self.activity.split(".")[-1],
+        )
+
+    def get_call(self):
+        """
+        Build the activity call for the Activity node
         """
         args = [
             "{}={}".format(key, val)
@@ -191,55 +207,53 @@ class ActivityNode(Node):
             if key != "self" and val != None and val != ""
         ]
 
-        command = "# {} ({})\n".format(self, self.uid)
+        function_ = self.activity.split(".")[-1]
 
         if self.class_:
-            module_ = ".".join(self.activity.split(".")[:-2])
-            function_ = self.activity.split(".")[-1]
-
-            command += "from {} import {}\n".format(
-                module_, self.activity.split(".")[-2]
-            )  # from automagica.activities import Chrome
-
             if function_ == "__init__":
-                command += "{} = {}({})\n".format(
+                return "{} = {}({})".format(
                     self.args_["self"],
                     self.activity.split(".")[-2],
                     ", ".join(args),
                 )  # chrome = Chrome()
 
-            else:
-                if self.return_:
-                    command += "{} = {}.{}({}, {})\n".format(
-                        self.return_,
-                        self.activity.split(".")[-2],
-                        function_,
-                        self.args_["self"],
-                        ", ".join(args),
-                    )  # Chrome.get(chrome, 'https://google.com")
-                else:
-                    command += "{}.{}({}, {})\n".format(
-                        self.activity.split(".")[-2],
-                        function_,
-                        self.args_["self"],
-                        ", ".join(args),
-                    )  # Chrome.get(chrome, 'https://google.com")
-
-        else:
-            module_ = ".".join(self.activity.split(".")[:-1])
-            function_ = self.activity.split(".")[-1]
+            if self.return_:
+                return "{} = {}.{}({}, {})".format(
+                    self.return_,
+                    self.activity.split(".")[-2],
+                    function_,
+                    self.args_["self"],
+                    ", ".join(args),
+                )  # Chrome.get(chrome, 'https://google.com")
+
+            return "{}.{}({}, {})".format(
+                self.activity.split(".")[-2],
+                function_,
+                self.args_["self"],
+                ", ".join(args),
+            )  # Chrome.get(chrome, 'https://google.com")
+
+        if self.return_:
+            return "{} = {}({})".format(
+                self.return_, function_, ", ".join(args)
+            )
 
-            command += "from {} import {}\n".format(module_, function_)
+        return "{}({})".format(function_, ", ".join(args))
 
-            if self.return_:
-                command += "{} = {}({})\n".format(
-                    self.return_, function_, ", ".join(args)
-                )
-            else:
-                command += "{}({})\n".format(function_, ", ".join(args))
+    def get_command(self):
+        """
+        Build the Python command for the Activity node
+        """
+        return "# {} ({})\n{}\n{}\n".format(
+            self, self.uid, self.get_import(), self.get_call()
+        )
 
+    def run(self, bot, on_done=None, on_fail=None):
+        """
+        Run the Activity node
+        """
         bot.run(
-            command,
+            self.get_command(),
             on_done=lambda: on_done(node=self.next_node),
             on_fail=on_fail,
         )
@@ -347,13 +361,16 @@ class DotPyFileNode(Node):
             "label": self.label,
         }
 
-    def run(self, bot, on_done=None, on_fail=None):
+    def get_command(self):
         with open(
             self.dotpyfile_path.replace('"', ""), "r", encoding="utf-8"
         ) as f:
-            command = f.read()
+            return f.read()
 
-        bot.run(command, on_done=lambda: on_done(node=self.next_node))
+    def run(self, bot, on_done=None, on_fail=None):
+        bot.run(
+            self.get_command(), on_done=lambda: on_done(node=self.next_node)
+        )
 
 
 class CommentNode(Node):
@@ -428,9 +445,12 @@ class PythonCodeNode(Node):
             "label": self.label,
         }
 
+    def get_command(self):
+        return self.code
+
     def run(self, bot, on_done=None, on_fail=None):
         bot.run(
-            self.code,
+            self.get_command(),
             on_done=lambda: on_done(node=self.next_node),
             on_fail=on_fail,
         )
@@ -0,0 +1,392 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import hashlib
+import os
+from collections import OrderedDict
+from threading import Lock
+
+from automagica.vision import _load_local_config
+
+
+class OCRBackend:
+    """
+    Recognizes the text on an image
+    """
+
+    def recognize(self, image):
+        """
+        Returns a dictionary with the recognized "text" and its "locations",
+        a list of dictionaries with the 'text', 'x', 'y', 'w' and 'h' of the
+        words and lines on the image
+        """
+        raise NotImplementedError
+
+
+class PortalOCRBackend(OCRBackend):
+    """
+    Recognition by the Automagica Portal API
+    """
+
+    def recognize(self, image):
+        from automagica.httpclient import http_client
+        from io import BytesIO
+        import base64
+
+        buffered = BytesIO()
+        image.save(buffered, format="PNG")
+        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+        # Get Bot API_key
+        api_key = str(_load_local_config().get("bot_secret"))
+
+        # Prepare data for request
+        data = {"image_base64": image_base64, "api_key": api_key}
+
+        # Post request to API
+        url = (
+            os.environ.get(
+                "AUTOMAGICA_PORTAL_URL", "https://portal.automagica.com"
+            )
+            + "/api/ocr/find-text-locations"
+        )
+
+        r = http_client.post(url, json=data)
+
+        data = r.json()
+
+        return {"text": data["text"], "locations": data["locations"]}
+
+
+class TesseractBackend(OCRBackend):
+    """
+    Local recognition with the Tesseract OCR engine (version 4 or later),
+    the tesseract command needs to be installed separately
+    """
+
+    def __init__(self, command=None, language=None):
+        """
+        Initialize the backend, the path to the tesseract command and the
+        language can be set with "tesseract_path" and "tesseract_language"
+        in automagica.json
+        """
+        config = _load_local_config()
+
+        self.command = command or config.get("tesseract_path", "tesseract")
+        self.language = language or config.get("tesseract_language")
+
+    def recognize(self, image):
+        from io import BytesIO
+        import subprocess  # nosec
+
+        buffered = BytesIO()
+        image.save(buffered, format="PNG")
+
+        command = [self.command, "stdin", "stdout"]
+
+        if self.language:
+            command += ["-l", self.language]
+
+        try:
+            output = subprocess.run(  # nosec
+                command + ["tsv"],
+                input=buffered.getvalue(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True,
+            ).stdout
+
+        except FileNotFoundError:
+            raise Exception(
+                "Tesseract was not found, install it or set tesseract_path in automagica.json."
+            )
+
+        return self.parse(output.decode("utf-8"))
+
+    @staticmethod
+    def parse(tsv):
+        """
+        Convert Tesseract TSV output to words and lines with their locations
+        """
+        lines = OrderedDict()
+
+        for row in tsv.splitlines()[1:]:
+            fields = row.split("\t")
+
+            # Only words (level 5) with text
+            if len(fields) < 12 or fields[0] != "5" or not fields[11].strip():
+                continue
+
+            line = tuple(fields[1:5])
+            x, y, w, h = (int(value) for value in fields[6:10])
+
+            lines.setdefault(line, []).append(
+                {"text": fields[11].strip(), "x": x, "y": y, "w": w, "h": h}
+            )
+
+        locations = []
+
+        for words in lines.values():
+            locations.extend(words)
+
+            if len(words) > 1:
+                x = min(word["x"] for word in words)
+                y = min(word["y"] for word in words)
+
+                locations.append(
+                    {
+                        "text": " ".join(word["text"] for word in words),
+                        "x": x,
+                        "y": y,
+                        "w": max(word["x"] + word["w"] for word in words) - x,
+                        "h": max(word["y"] + word["h"] for word in words) - y,
+                    }
+                )
+
+        locations.sort(key=lambda location: (location["y"], location["x"]))
+
+        return {
+            "text": "\n".join(
+                " ".join(word["text"] for word in words)
+                for words in lines.values()
+            ),
+            "locations": locations,
+        }
+
+
+OCR_BACKENDS = {"portal": PortalOCRBackend, "tesseract": TesseractBackend}
+
+_BACKENDS = {}
+
+
+def get_ocr_backend():
+    """
+    Returns the OCR backend to use, set with the AUTOMAGICA_OCR_BACKEND
+    environment variable or "ocr_backend" in automagica.json (default:
+    "portal")
+    """
+    name = os.environ.get("AUTOMAGICA_OCR_BACKEND") or (
+        _load_local_config().get("ocr_backend", "portal")
+    )
+
+    if name not in OCR_BACKENDS:
+        raise Exception(
+            "Unknown OCR backend {}, use one of: {}".format(
+                name, ", ".join(sorted(OCR_BACKENDS))
+            )
+        )
+
+    if name not in _BACKENDS:
+        _BACKENDS[name] = OCR_BACKENDS[name]()
+
+    return _BACKENDS[name]
+
+
+def image_hash(image):
+    """
+    Hash of the pixels of a Pillow image
+    """
+    return hashlib.sha1(  # nosec
+        "{}{}".format(image.mode, image.size).encode("utf-8") + image.tobytes()
+    ).hexdigest()
+
+
+class RecognitionCache:
+    """
+    Recent recognition results by backend and image hash, so an unchanged
+    screen is only recognized once
+    """
+
+    def __init__(self, max_size=32):
+        self.max_size = max_size
+        self.results = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            result = self.results.get(key)
+
+            if result is not None:
+                self.results.move_to_end(key)
+
+            return result
+
+    def add(self, key, result):
+        with self.lock:
+            self.results[key] = result
+
+            while len(self.results) > self.max_size:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+
+recognition_cache = RecognitionCache()
+
+
+def recognize(image, region=None, backend=None):
+    """
+    Recognize the text on an image, or only on a region (left, top, right,
+    bottom) of it, clipped to the image. Locations are relative to the
+    image.
+    """
+    import copy
+
+    backend = backend or get_ocr_backend()
+
+    if region:
+        left, top, right, bottom = region
+        region = (
+            max(0, left),
+            max(0, top),
+            min(image.size[0], right),
+            min(image.size[1], bottom),
+        )
+
+        if region[0] >= region[2] or region[1] >= region[3]:
+            raise ValueError(
+                "Region {} is outside of the image".format(region)
+            )
+
+        image = image.crop(region)
+
+    key = (type(backend).__name__, image_hash(image))
+    result = recognition_cache.get(key)
+
+    if result is None:
+        result = backend.recognize(image)
+        recognition_cache.add(key, result)
+
+    result = copy.deepcopy(result)
+
+    if region:
+        for location in result["locations"]:
+            location["x"] += region[0]
+            location["y"] += region[1]
+
+    return result
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+class OCRSession:
+    """
+    Recognizes the screen once and looks up words and lines in an index of
+    the result, until the screen changed. Clicking several fields on the
+    same form then only needs one recognition.
+    """
+
+    def __init__(self, grab=None, backend=None, max_changed=0.01):
+        """
+        Initialize the session, the screen is recognized again when more
+        than max_changed of it changed or when the text looked up changed
+        """
+        self.grab = grab
+        self.backend = backend
+        self.max_changed = max_changed
+        self.thumbnail = None
+        self.index = {}
+        self.lock = Lock()
+
+    def _recognize(self, screenshot, thumbnail):
+        self.index = {}
+
+        for location in recognize(screenshot, backend=self.backend)[
+            "locations"
+        ]:
+            self.index.setdefault(_normalize(location["text"]), []).append(
+                location
+            )
+
+        self.thumbnail = thumbnail
+
+    def _lookup(self, text, similarity):
+        """
+        Locations of the text, case-insensitive, ordered from the upper left
+        """
+        import difflib
+
+        text = _normalize(text)
+        matches = list(self.index.get(text, []))
+
+        if not matches and similarity:
+            for key in difflib.get_close_matches(
+                text, self.index, 3, similarity
+            ):
+                matches.extend(self.index[key])
+
+        return sorted(
+            matches, key=lambda location: (location["y"], location["x"])
+        )
+
+    def _changed(self, thumbnail, location=None):
+        """
+        Whether the screen, or the area of a location, changed since it
+        was recognized
+        """
+        import numpy as np
+
+        from automagica.vision import THUMBNAIL_FACTOR
+
+        if self.thumbnail is None or self.thumbnail.shape != thumbnail.shape:
+            return True
+
+        a, b = self.thumbnail, thumbnail
+
+        if location:
+            left = max(0, location["x"] // THUMBNAIL_FACTOR - 1)
+            top = max(0, location["y"] // THUMBNAIL_FACTOR - 1)
+            right = (location["x"] + location["w"]) // THUMBNAIL_FACTOR + 2
+            bottom = (location["y"] + location["h"]) // THUMBNAIL_FACTOR + 2
+
+            a, b = a[top:bottom, left:right], b[top:bottom, left:right]
+
+            return bool(np.any(np.abs(a - b) > 8))
+
+        return float(np.mean(np.abs(a - b) > 8)) > self.max_changed
+
+    def find(self, text, similarity=None):
+        """
+        Returns the locations of a text on the screen. With a similarity
+        (0 to 1) similar texts, with a difflib ratio of at least similarity,
+        are matched if the text is not found exactly.
+        """
+        from automagica.vision import _thumbnail
+
+        grab = self.grab
+
+        if grab is None:
+            from automagica.activities import capture_screen as grab
+
+        with self.lock:
+            screenshot = grab()
+            thumbnail = _thumbnail(screenshot)
+            recognized = False
+
+            if self._changed(thumbnail):
+                self._recognize(screenshot, thumbnail)
+                recognized = True
+
+            matches = [
+                location
+                for location in self._lookup(text, similarity)
+                if not self._changed(thumbnail, location)
+            ]
+
+            # The text may have appeared or moved since the recognition
+            if not matches and not recognized:
+                self._recognize(screenshot, thumbnail)
+                matches = self._lookup(text, similarity)
+
+            return [dict(location) for location in matches]
+
+    def clear(self):
+        with self.lock:
+            self.thumbnail = None
+            self.index = {}
+
+
+ocr_session = OCRSession()
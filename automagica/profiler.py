@@ -0,0 +1,287 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# Profiler that activities report to, set by Profiler.start()
+active = None
+
+_NULL_SPAN = nullcontext()
+
+
+class Profiler:
+    """
+    Records the wall time, CPU time, peak memory delta and exception status
+    of Flow nodes and activity calls. The results can be exported as a
+    Chrome trace (chrome://tracing or https://ui.perfetto.dev) and as a
+    summary table.
+    """
+
+    def __init__(self, trace_memory=True):
+        """
+        Initialize the profiler, with trace_memory the peak memory during
+        each span is measured with tracemalloc (slows down execution). This
+        needs tracemalloc.reset_peak (Python 3.9 and later), on older
+        versions no memory is reported.
+        """
+        self.trace_memory = trace_memory and hasattr(tracemalloc, "reset_peak")
+        self.records = []
+        self.origin = time.perf_counter()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self._started_tracemalloc = False
+
+    def start(self):
+        """
+        Start profiling, activities called from now on are recorded
+        """
+        global active
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+
+        self.origin = time.perf_counter()
+        active = self
+
+    def stop(self):
+        """
+        Stop profiling
+        """
+        global active
+
+        if active is self:
+            active = None
+
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _memory(self):
+        """
+        Current and peak traced memory in bytes, (0, 0) when not tracing
+        """
+        if not self.trace_memory or not tracemalloc.is_tracing():
+            return 0, 0
+
+        return tracemalloc.get_traced_memory()
+
+    def begin(self, name, category, **args):
+        """
+        Start a span, returns the record to pass to end()
+        """
+        stack = getattr(self.local, "stack", None)
+
+        if stack is None:
+            stack = self.local.stack = []
+
+        current, peak = self._memory()
+
+        # The peak is reset per span, remember it for the enclosing span
+        if stack:
+            stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+
+        self._reset_peak()
+
+        record = {
+            "name": name,
+            "category": category,
+            "args": args,
+            "thread": threading.get_ident(),
+            "start": time.perf_counter(),
+            "cpu": time.thread_time(),
+            "_memory": current,
+            "_peak": current,
+        }
+        stack.append(record)
+
+        return record
+
+    def end(self, record, error=False):
+        """
+        Finish a span
+        """
+        wall = time.perf_counter() - record["start"]
+        cpu = time.thread_time() - record.pop("cpu")
+        _, peak = self._memory()
+
+        peak = max(record.pop("_peak"), peak)
+        memory = record.pop("_memory")
+
+        stack = self.local.stack
+
+        if record in stack:
+            del stack[stack.index(record) :]
+
+        if stack:
+            stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+
+        record.update(
+            start=record["start"] - self.origin,
+            wall=wall,
+            cpu=cpu,
+            memory=max(0, peak - memory) if self.trace_memory else None,
+            error=bool(error),
+        )
+
+        with self.lock:
+            self.records.append(record)
+
+    def _reset_peak(self):
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def span(self, name, category, **args):
+        """
+        Record a span around a block of code, exceptions mark it as failed
+        """
+        record = self.begin(name, category, **args)
+
+        try:
+            yield record
+
+        except BaseException:
+            self.end(record, error=True)
+            raise
+
+        self.end(record, error=record["args"].pop("error", False))
+
+    def to_chrome_trace(self):
+        """
+        Records as a Chrome trace-event dictionary
+        """
+        pid = os.getpid()
+        events = []
+
+        for record in sorted(self.records, key=lambda record: record["start"]):
+            args = dict(
+                record["args"],
+                cpu_ms=round(record["cpu"] * 1e3, 3),
+                error=record["error"],
+            )
+
+            if record["memory"] is not None:
+                args["memory_peak_delta_kb"] = round(
+                    record["memory"] / 1024, 1
+                )
+
+            events.append(
+                {
+                    "name": record["name"],
+                    "cat": record["category"],
+                    "ph": "X",
+                    "ts": round(record["start"] * 1e6, 1),
+                    "dur": round(record["wall"] * 1e6, 1),
+                    "pid": pid,
+                    "tid": record["thread"],
+                    "args": args,
+                }
+            )
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save(self, file_path):
+        """
+        Save the records as a Chrome trace JSON file
+        """
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+    def summary(self):
+        """
+        Totals per node and activity, the most time consuming first
+        """
+        totals = {}
+
+        for record in self.records:
+            key = (record["category"], record["name"])
+            total = totals.setdefault(
+                key,
+                {
+                    "category": record["category"],
+                    "name": record["name"],
+                    "calls": 0,
+                    "wall": 0,
+                    "max_wall": 0,
+                    "cpu": 0,
+                    "memory": None,
+                    "errors": 0,
+                },
+            )
+
+            total["calls"] += 1
+            total["wall"] += record["wall"]
+            total["max_wall"] = max(total["max_wall"], record["wall"])
+            total["cpu"] += record["cpu"]
+
+            if record["memory"] is not None:
+                total["memory"] = max(total["memory"] or 0, record["memory"])
+
+            total["errors"] += record["error"]
+
+        return sorted(totals.values(), key=lambda total: -total["wall"])
+
+    def format_summary(self, limit=20):
+        """
+        Summary as a text table
+        """
+        rows = [
+            (
+                "Name",
+                "Type",
+                "Calls",
+                "Total (s)",
+                "Mean (ms)",
+                "Max (ms)",
+                "CPU (s)",
+                "Peak mem (KB)",
+                "Errors",
+            )
+        ]
+
+        for total in self.summary()[:limit]:
+            rows.append(
+                (
+                    total["name"][:50],
+                    total["category"],
+                    str(total["calls"]),
+                    "{:.3f}".format(total["wall"]),
+                    "{:.1f}".format(total["wall"] / total["calls"] * 1e3),
+                    "{:.1f}".format(total["max_wall"] * 1e3),
+                    "{:.3f}".format(total["cpu"]),
+                    (
+                        "-"
+                        if total["memory"] is None
+                        else "{:.0f}".format(total["memory"] / 1024)
+                    ),
+                    str(total["errors"]),
+                )
+            )
+
+        widths = [
+            max(len(row[i]) for row in rows) for i in range(len(rows[0]))
+        ]
+
+        return "\n".join(
+            "  ".join(
+                value.ljust(width) if i < 2 else value.rjust(width)
+                for i, (value, width) in enumerate(zip(row, widths))
+            )
+            for row in rows
+        )
+
+
+def span(name, category, **args):
+    """
+    Span on the active profiler, does nothing when not profiling
+    """
+    if active is None:
+        return _NULL_SPAN
+
+    return active.span(name, category, **args)
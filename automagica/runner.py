@@ -0,0 +1,302 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import logging
+import os
+from threading import Event
+
+from automagica.bots import ThreadedBot
+from automagica.config import _
+from automagica.flow import Flow
+from automagica.nodes import IfElseNode, LoopNode, StartNode, SubFlowNode
+
+
+class _Frame:
+    """
+    Entry on the runner stack, remembers where to continue after a loop
+    iteration or a sub-flow has finished
+    """
+
+    def __init__(self, flow, node, iterator=None):
+        self.flow = flow
+        self.node = node
+        self.iterator = iterator
+
+
+class FlowRunner:
+    """
+    Headless Flow runner. Walks the nodes of a Flow iteratively without any
+    GUI, so Flows can run on machines without a display.
+    """
+
+    def __init__(
+        self, flow, bot=None, step_by_step=False, compiled=False, profiler=None
+    ):
+        """
+        Initialize the Flow runner. With compiled=True the Flow runs as a
+        single compiled module (see Flow.compile) instead of node by node.
+        With a profiler (see automagica.profiler) every node execution is
+        recorded, which requires running node by node.
+        """
+        if not bot:
+            bot = ThreadedBot()
+
+        self.flow = flow
+        self.bot = bot
+        self.step_by_step = step_by_step
+        self.compiled = compiled
+        self.profiler = profiler
+        self.step = None
+        self.errors = False
+        self.n_nodes_ran = 0
+        self.logger = logging.getLogger("automagica.flow")
+
+    def run(self, start_node=None):
+        """
+        Run the Flow, returns True if it finished without unhandled errors
+        """
+        if (
+            self.compiled
+            and not start_node
+            and not self.step_by_step
+            and not self.profiler
+        ):
+            return self._run_compiled()
+
+        flow = self.flow
+
+        if start_node:
+            node = flow.get_node_by_uid(start_node)
+        else:
+            node = flow.get_start_nodes()[0]
+
+        stack = []
+
+        while True:
+            if node is None:
+                # End of a branch: resume the enclosing loop or sub-flow
+                if not stack:
+                    break
+
+                frame = stack[-1]
+                flow = frame.flow
+
+                if frame.iterator is not None:
+                    node = frame.node
+                else:
+                    stack.pop()
+                    node = flow.get_node_by_uid(frame.node.next_node)
+
+                continue
+
+            if self.step_by_step:
+                input(_("Press enter to run step: {}").format(node))  # nosec
+
+            self.logger.info(_("Running step: {}").format(node))
+            self.n_nodes_ran += 1
+
+            if self.profiler:
+                self.step = self.profiler.begin(
+                    str(node),
+                    "node",
+                    uid=node.uid,
+                    type=node.__class__.__name__,
+                )
+
+            if isinstance(node, StartNode):
+                next_node = node.next_node
+
+            elif isinstance(node, IfElseNode):
+                result = self._evaluate(node.condition)
+
+                if result is None:
+                    return self._fail()
+
+                next_node = node.next_node if result[0] else node.else_node
+
+            elif isinstance(node, LoopNode):
+                if not (stack and stack[-1].node is node):
+                    iterable = node.iterable or "range({})".format(
+                        node.repeat_n_times
+                    )
+                    result = self._evaluate("iter({})".format(iterable))
+
+                    if result is None:
+                        return self._fail()
+
+                    stack.append(_Frame(flow, node, iterator=result[0]))
+
+                try:
+                    value = next(stack[-1].iterator)
+
+                except StopIteration:
+                    stack.pop()
+                    next_node = node.next_node
+
+                else:
+                    if node.loop_variable:
+                        self.bot.interpreter.locals[node.loop_variable] = value
+
+                    next_node = node.loop_node
+
+            elif isinstance(node, SubFlowNode):
+                try:
+                    subflow = Flow(
+                        node.subflow_path.replace('"', ""), nodes=[]
+                    )
+
+                except Exception:
+                    self.logger.exception(
+                        _("Could not load sub-flow {}").format(
+                            node.subflow_path
+                        )
+                    )
+
+                    if not node.on_exception_node:
+                        return self._fail()
+
+                    next_node = node.on_exception_node
+
+                else:
+                    self._end_step()
+                    stack.append(_Frame(flow, node))
+                    flow = subflow
+                    node = flow.get_start_nodes()[0]
+                    continue
+
+            elif hasattr(node, "get_command"):
+                nodes = self._command_chain(flow, node)
+
+                for other in nodes[1:]:
+                    self.logger.info(_("Running step: {}").format(other))
+
+                failed = self._run_commands(nodes)
+
+                if failed is None:
+                    self.n_nodes_ran += len(nodes) - 1
+                    next_node = nodes[-1].next_node
+
+                elif nodes[failed].on_exception_node:
+                    self.n_nodes_ran += failed
+                    self._end_step(error=True)
+                    next_node = nodes[failed].on_exception_node
+
+                else:
+                    self.n_nodes_ran += failed
+                    return self._fail()
+
+            else:
+                next_node = None
+
+            self._end_step()
+            node = flow.get_node_by_uid(next_node) if next_node else None
+
+        return not self.errors
+
+    def _command_chain(self, flow, node):
+        """
+        The command node and the command nodes directly following it, which
+        run as one batch in the bot. Nodes run one by one when stepping or
+        profiling.
+        """
+        nodes, uids = [node], {node.uid}
+
+        while not self.step_by_step and not self.profiler:
+            node = flow.get_node_by_uid(node.next_node)
+
+            if not hasattr(node, "get_command") or node.uid in uids:
+                break
+
+            nodes.append(node)
+            uids.add(node.uid)
+
+        return nodes
+
+    def _run_commands(self, nodes):
+        """
+        Run the commands of the nodes in the bot, returns the index of the
+        node that failed or None
+        """
+        if len(nodes) == 1:
+            return None if self.bot._run_command(nodes[0].get_command()) else 0
+
+        done, failed = Event(), []
+
+        self.bot.run_many(
+            [node.get_command() for node in nodes],
+            on_done=done.set,
+            on_fail=lambda i: (failed.append(i), done.set()),
+        )
+        done.wait()
+
+        return failed[0] if failed else None
+
+    def _run_compiled(self):
+        """
+        Run the compiled Flow in one go
+        """
+        try:
+            code = self.flow.compile()
+
+        except Exception:
+            self.logger.exception(_("Could not compile Flow."))
+            return self._fail()
+
+        if not self.bot._run_command(code):
+            return self._fail()
+
+        return True
+
+    def _evaluate(self, expression):
+        """
+        Evaluate an expression in the bot, returns a 1-tuple with the result
+        or None if the evaluation failed
+        """
+        if not self.bot._run_command(
+            "AUTOMAGICA_RESULT = ({})".format(expression)
+        ):
+            return None
+
+        return (self.bot.interpreter.locals.pop("AUTOMAGICA_RESULT", None),)
+
+    def _end_step(self, error=False):
+        """
+        Finish the profiler record of the current node, if any
+        """
+        if self.step is not None:
+            self.profiler.end(self.step, error=error)
+            self.step = None
+
+    def _fail(self):
+        """
+        Stop the Flow after an unhandled error
+        """
+        self._end_step(error=True)
+        self.errors = True
+        self.logger.error(_("Flow stopped due to an error."))
+
+        return False
+
+
+def run_flow_file(file_path, step_by_step=False, profiler=None):
+    """
+    Run a Flow file headless, loading the job parameters
+    (input/parameters.py) first if present. Returns True if the Flow
+    finished without unhandled errors.
+    """
+    runner = FlowRunner(
+        Flow(file_path),
+        step_by_step=step_by_step,
+        compiled=True,
+        profiler=profiler,
+    )
+
+    try:
+        # Run parameters
+        if os.path.isfile("input/parameters.py"):
+            with open("input/parameters.py", "r", encoding="utf-8") as f:
+                runner.bot._run_command(f.read())
+
+        return runner.run()
+
+    finally:
+        runner.bot.stop()
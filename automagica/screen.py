@@ -0,0 +1,157 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import threading
+import time
+import weakref
+
+_local = threading.local()
+
+
+def _close(handles):
+    for sct in handles:
+        sct.close()
+
+    handles.clear()
+
+
+class ScreenGrabber:
+    """
+    Grabs (parts of) the primary screen with mss, keeping the mss handle
+    open between grabs. mss handles can not be shared between threads, use
+    get_grabber() for the grabber of the current thread. The handle is
+    closed with close(), when the grabber is used as a context manager or
+    when it is garbage collected (e.g. when its thread ended).
+    """
+
+    def __init__(self, max_age=1):
+        """
+        Open the mss handle, the screen geometry is read again after max_age
+        seconds and after a failed grab (resolution changes, reconnected
+        remote desktop sessions)
+        """
+        self.max_age = max_age
+        self.handles = []
+        self.sct = None
+
+        weakref.finalize(self, _close, self.handles)
+
+        self._open()
+
+    def _open(self):
+        import mss
+
+        _close(self.handles)
+
+        self.sct = mss.mss()
+        self.handles.append(self.sct)
+
+        # Find primary monitor
+        for monitor in self.sct.monitors:
+            if monitor["left"] == 0 and monitor["top"] == 0:
+                break
+
+        self.monitor = monitor
+        self.opened = time.monotonic()
+
+    def _refresh(self):
+        if time.monotonic() - self.opened > self.max_age:
+            self._open()
+
+    @property
+    def size(self):
+        """
+        Width and height of the primary screen in pixels
+        """
+        self._refresh()
+
+        return self.monitor["width"], self.monitor["height"]
+
+    def _grab(self, region=None):
+        """
+        Grab the screen or a region (left, top, right, bottom) of it, the
+        region is clipped to the screen
+        """
+        self._refresh()
+        area = self._area(region)
+
+        try:
+            return self.sct.grab(area)
+
+        except Exception:
+            # The screen geometry may have changed, retry with a new handle
+            self._open()
+
+            return self.sct.grab(self._area(region))
+
+    def _area(self, region):
+        monitor = self.monitor
+
+        if not region:
+            return monitor
+
+        left, top, right, bottom = region
+
+        left = min(max(0, left), monitor["width"])
+        top = min(max(0, top), monitor["height"])
+        right = min(max(left, right), monitor["width"])
+        bottom = min(max(top, bottom), monitor["height"])
+
+        if right <= left or bottom <= top:
+            raise ValueError(
+                "Region {} is outside of the screen".format(tuple(region))
+            )
+
+        return {
+            "left": monitor["left"] + left,
+            "top": monitor["top"] + top,
+            "width": right - left,
+            "height": bottom - top,
+        }
+
+    def grab(self, region=None):
+        """
+        Grab the screen or a region (left, top, right, bottom) of it as an
+        RGB NumPy array (height, width, 3)
+        """
+        import numpy as np
+
+        sct_img = self._grab(region)
+
+        return np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(
+            sct_img.height, sct_img.width, 4
+        )[:, :, 2::-1]
+
+    def grab_image(self, region=None):
+        """
+        Grab the screen or a region (left, top, right, bottom) of it as a
+        Pillow Image object
+        """
+        from PIL import Image
+
+        sct_img = self._grab(region)
+
+        return Image.frombytes(
+            "RGB", sct_img.size, sct_img.bgra, "raw", "BGRX"
+        )
+
+    def close(self):
+        _close(self.handles)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_grabber():
+    """
+    Returns the screen grabber of the current thread, its mss handle is
+    closed when the thread ends
+    """
+    grabber = getattr(_local, "grabber", None)
+
+    if grabber is None:
+        grabber = _local.grabber = ScreenGrabber()
+
+    return grabber
@@ -0,0 +1,151 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import re
+from bisect import bisect_left
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """
+    Lowercase words of a text
+    """
+    return _TOKEN.findall(text.lower())
+
+
+def trigrams(token):
+    """
+    Character trigrams of a token, padded so short tokens have some too
+    """
+    token = " {} ".format(token)
+
+    return {token[i : i + 3] for i in range(len(token) - 2)}
+
+
+class SearchIndex:
+    """
+    Inverted index over the words and word trigrams of documents, for ranked
+    search with prefix, substring and typo-tolerant matching. Documents are
+    given as {key: [(text, weight), ...]}, the first text of each document is
+    also used for prefix completion (see startswith).
+    """
+
+    def __init__(self, documents):
+        """
+        Build the index
+        """
+        self.keys = list(documents)
+        self.order = {key: i for i, key in enumerate(self.keys)}
+
+        self.postings = {}  # token -> {key: weight}
+        self.grams = {}  # trigram -> set of tokens
+
+        for key, fields in documents.items():
+            for text, weight in fields:
+                for token in tokenize(text):
+                    posting = self.postings.setdefault(token, {})
+                    posting[key] = max(posting.get(key, 0), weight)
+
+        for token in self.postings:
+            for gram in trigrams(token):
+                self.grams.setdefault(gram, set()).add(token)
+
+        self.tokens = sorted(self.postings)
+
+        # First texts for prefix completion
+        self.titles = sorted(
+            (fields[0][0].lower(), self.order[key], key)
+            for key, fields in documents.items()
+            if fields
+        )
+
+    def _matching_tokens(self, word):
+        """
+        Indexed tokens matching a query word with the quality of the match:
+        exact, prefix, substring or similar (typos)
+        """
+        matches = {}
+
+        if word in self.postings:
+            matches[word] = 1.0
+
+        i = bisect_left(self.tokens, word)
+
+        while i < len(self.tokens) and self.tokens[i].startswith(word):
+            matches.setdefault(self.tokens[i], 0.8)
+            i += 1
+
+        word_grams = trigrams(word)
+        counts = {}
+
+        for gram in word_grams:
+            for token in self.grams.get(gram, ()):
+                counts[token] = counts.get(token, 0) + 1
+
+        for token, count in counts.items():
+            if token in matches:
+                continue
+
+            if len(word) >= 3 and word in token:
+                matches[token] = 0.6
+                continue
+
+            # Similar tokens by trigram overlap (Dice coefficient)
+            similarity = 2 * count / (len(word_grams) + len(trigrams(token)))
+
+            if similarity >= 0.5:
+                matches[token] = 0.5 * similarity
+
+        return matches
+
+    def search(self, query):
+        """
+        Keys of the documents matching every word of the query, best matches
+        first. An empty query returns all keys.
+        """
+        words = tokenize(query)
+
+        if not words:
+            return list(self.keys)
+
+        scores = None
+
+        for word in words:
+            word_scores = {}
+
+            for token, quality in self._matching_tokens(word).items():
+                for key, weight in self.postings[token].items():
+                    score = quality * weight
+
+                    if score > word_scores.get(key, 0):
+                        word_scores[key] = score
+
+            if scores is None:
+                scores = word_scores
+
+            else:
+                scores = {
+                    key: score + word_scores[key]
+                    for key, score in scores.items()
+                    if key in word_scores
+                }
+
+            if not scores:
+                return []
+
+        return sorted(scores, key=lambda key: (-scores[key], self.order[key]))
+
+    def startswith(self, prefix):
+        """
+        Keys of the documents of which the first text starts with the prefix
+        (case-insensitive), in alphabetical order
+        """
+        prefix = prefix.lower()
+        i = bisect_left(self.titles, (prefix,))
+        keys = []
+
+        while i < len(self.titles) and self.titles[i][0].startswith(prefix):
+            keys.append(self.titles[i][2])
+            i += 1
+
+        return keys
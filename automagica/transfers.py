@@ -0,0 +1,343 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from automagica.httpclient import http_client
+
+CHUNK_SIZE = 1024 * 1024
+
+# Seconds between saves of the download progress
+SAVE_INTERVAL = 1
+
+FILE_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".automagica", "cache", "files"
+)
+
+
+class FileCache:
+    """
+    Content-addressed cache for downloaded job files, files are stored by
+    their SHA-256 checksum
+    """
+
+    def __init__(self, path=FILE_CACHE_PATH, max_size=5 * 1024 ** 3):
+        """
+        Initialize the cache, the least recently used files are removed when
+        the cache grows beyond max_size bytes
+        """
+        self.path = path
+        self.max_size = max_size
+
+    def get_path(self, sha256):
+        return os.path.join(self.path, sha256.lower())
+
+    def get(self, sha256, file_path):
+        """
+        Copy a cached file to file_path, returns False if it is not cached
+        """
+        cached_path = self.get_path(sha256)
+
+        try:
+            shutil.copyfile(cached_path, file_path)
+
+        except FileNotFoundError:
+            return False
+
+        # Mark as recently used
+        os.utime(cached_path)
+
+        return True
+
+    def add(self, sha256, file_path):
+        """
+        Add a verified file to the cache
+        """
+        os.makedirs(self.path, exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        os.close(fd)
+        shutil.copyfile(file_path, temp_path)
+        os.replace(temp_path, self.get_path(sha256))
+
+        self.prune()
+
+    def prune(self):
+        """
+        Remove the least recently used files until the cache fits max_size
+        """
+        entries = []
+
+        for entry in os.scandir(self.path):
+            if entry.is_file() and ".tmp" not in entry.name:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        size = sum(entry[1] for entry in entries)
+
+        for _, file_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            size -= file_size
+
+
+def download_file(url, file_path, sha256=None, cache=None):
+    """
+    Stream a file to disk in chunks. If a SHA-256 checksum is given the
+    download is verified and stored in (or taken from) the cache.
+    """
+    if sha256 and cache and cache.get(sha256, file_path):
+        return file_path
+
+    checksum = hashlib.sha256()
+    r = http_client.get(url, stream=True)
+
+    if r.status_code >= 400:
+        r.response.release_conn()
+        raise Exception(
+            "Could not download {} (HTTP {})".format(url, r.status_code)
+        )
+
+    try:
+        with open(file_path, "wb") as f:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                checksum.update(chunk)
+                f.write(chunk)
+
+        if sha256 and checksum.hexdigest() != sha256.lower():
+            raise ValueError(
+                "Checksum mismatch for {}: expected {}, got {}".format(
+                    url, sha256, checksum.hexdigest()
+                )
+            )
+
+    except:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    if sha256 and cache:
+        cache.add(sha256, file_path)
+
+    return file_path
+
+
+def _load_download_state(state_path, url, validator, size):
+    """
+    Load the progress of an interrupted download, if it can be resumed
+    """
+    try:
+        with open(state_path, "r") as f:
+            state = json.load(f)
+
+    except (OSError, ValueError):
+        return None
+
+    if (
+        validator
+        and state.get("url") == url
+        and state.get("validator") == validator
+        and state.get("size") == size
+    ):
+        return state
+
+
+def download_url(
+    url,
+    file_path,
+    segments=4,
+    min_segment_size=8 * 1024 * 1024,
+    resume=True,
+    headers=None,
+):
+    """
+    Stream a URL to disk through a temporary .part file. Large files on
+    servers that accept byte ranges are fetched in parallel segments, and
+    interrupted downloads continue where they stopped when resume is True.
+    """
+    part_path = file_path + ".part"
+    state_path = part_path + ".json"
+
+    # Ask for the raw bytes, byte ranges refer to them
+    headers = dict(headers or {}, **{"Accept-Encoding": "identity"})
+
+    r = http_client.head(url, headers=headers)
+
+    size, validator, ranges = None, None, False
+
+    if r.status_code < 400:
+        if r.headers.get("Content-Length"):
+            size = int(r.headers["Content-Length"])
+
+        # If-Range only accepts strong validators
+        validator = r.headers.get("ETag")
+
+        if not validator or validator.startswith("W/"):
+            validator = r.headers.get("Last-Modified")
+
+        ranges = r.headers.get("Accept-Ranges") == "bytes"
+
+    state = None
+
+    if resume and os.path.exists(part_path):
+        state = _load_download_state(state_path, url, validator, size)
+
+    if not state:
+        n = 1
+
+        if ranges and size:
+            n = max(1, min(segments, size // min_segment_size))
+
+        bounds = [i * (size or 0) // n for i in range(n + 1)]
+
+        state = {
+            "url": url,
+            "validator": validator,
+            "size": size,
+            "ranges": ranges,
+            "segments": [
+                [bounds[i], bounds[i + 1] - 1 if size else None, 0]
+                for i in range(n)
+            ],
+        }
+
+        with open(part_path, "wb") as f:
+            if size:
+                f.truncate(size)
+
+    lock = Lock()
+
+    def save_state():
+        with open(state_path + ".tmp", "w") as f:
+            json.dump(state, f)
+
+        os.replace(state_path + ".tmp", state_path)
+
+    def save_progress(f, segment, done):
+        """
+        Record the progress of a segment once its bytes are on disk
+        """
+        f.flush()
+        os.fsync(f.fileno())
+
+        with lock:
+            segment[2] = done
+            save_state()
+
+    def download_segment(segment):
+        start, end, done = segment
+
+        if end is not None and start + done > end:
+            return
+
+        segment_headers = dict(headers)
+
+        if done or end is not None and len(state["segments"]) > 1:
+            segment_headers["Range"] = "bytes={}-{}".format(
+                start + done, "" if end is None else end
+            )
+
+            if validator:
+                segment_headers["If-Range"] = validator
+
+        r = http_client.get(url, headers=segment_headers, stream=True)
+
+        try:
+            if r.status_code >= 400:
+                raise Exception(
+                    "Could not download file from {} (HTTP {})".format(
+                        url, r.status_code
+                    )
+                )
+
+            if r.status_code != 206:
+                if len(state["segments"]) > 1:
+                    raise Exception(
+                        "Server ignored the byte range for {}".format(url)
+                    )
+
+                # The server sent the whole file, start over
+                segment[2] = done = 0
+
+            with open(part_path, "r+b") as f:
+                f.seek(start + done)
+
+                if end is None:
+                    f.truncate()
+
+                saved = time.monotonic()
+
+                try:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        done += len(chunk)
+
+                        if time.monotonic() - saved >= SAVE_INTERVAL:
+                            save_progress(f, segment, done)
+                            saved = time.monotonic()
+
+                finally:
+                    # Also keeps the progress of a broken connection
+                    save_progress(f, segment, done)
+
+        finally:
+            r.response.release_conn()
+
+    transfer_all(
+        download_segment,
+        [(segment,) for segment in state["segments"]],
+        max_workers=len(state["segments"]),
+    )
+
+    for start, end, done in state["segments"]:
+        if end is not None and done != end - start + 1:
+            raise Exception("Incomplete download from {}".format(url))
+
+    os.replace(part_path, file_path)
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+    return file_path
+
+
+def upload_file(url, file_path, fields=None, filename=None):
+    """
+    Stream a file from disk as multipart/form-data POST (e.g. to an S3
+    pre-signed URL), the filename defaults to the name of the file
+    """
+    if filename is None:
+        filename = os.path.basename(file_path)
+
+    with open(file_path, "rb") as f:
+        r = http_client.post(url, data=fields, files={"file": (filename, f)})
+
+    if r.status_code >= 400:
+        raise Exception(
+            "Could not upload {} (HTTP {})".format(file_path, r.status_code)
+        )
+
+    return r
+
+
+def transfer_all(function, transfers, max_workers=4):
+    """
+    Run transfers (tuples of arguments for function) in a bounded thread
+    pool, waits for all of them and raises the first error
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(function, *args) for args in transfers]
+
+    return [future.result() for future in futures]
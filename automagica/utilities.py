@@ -1,15 +1,20 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
 
+import atexit
+import importlib
 import inspect
 import logging
 import os
 import pathlib
+import pickle  # nosec
 import platform
 from functools import wraps
+from threading import Event, Lock, Thread
+from time import perf_counter
 from uuid import getnode, uuid4
 
-import psutil
-from automagica.httpclient import http_client
+from automagica.metrics import ACTIVITY_DURATION, ACTIVITY_ERRORS
+from automagica.profiler import span as profiler_span
 
 AUTOMAGICA_ACTIVITIES = []
 
@@ -24,6 +29,9 @@ def activity(func):
     if func not in AUTOMAGICA_ACTIVITIES:
         AUTOMAGICA_ACTIVITIES.append(func)
 
+    # Metrics of the activity, looked up on its first call
+    metrics = []
+
     @wraps(func)
     def wrapper(*args, **kwargs):
         """
@@ -37,13 +45,27 @@ def activity(func):
         logging.info("Automagica (activity): {}".format(name))
         telemetry(func)
 
+        if not metrics:
+            # Same key as the activity index, method names are not unique
+            key = func.__module__ + "." + func.__qualname__
+
+            metrics.append(ACTIVITY_DURATION.labels(key))
+            metrics.append(ACTIVITY_ERRORS.labels(key))
+
+        start = perf_counter()
+
         try:
-            return func(*args, **kwargs)
+            with profiler_span(name, "activity"):
+                return func(*args, **kwargs)
 
         except Exception as e:
+            metrics[1].inc()
             telemetry_exception(func, e)
             raise
 
+        finally:
+            metrics[0].observe(perf_counter() - start)
+
     return wrapper
 
 
@@ -99,6 +121,146 @@ def interpret_path(
     return str(filepath)
 
 
+class TelemetryQueue:
+    """
+    Background telemetry pipeline. Activity calls are counted in memory per
+    activity (and error) and sent in batches by a background thread, so
+    activities never wait for the network. When too many distinct
+    activities are pending, new ones are dropped.
+    """
+
+    def __init__(self, url, interval=60, max_size=1000, timeout=1):
+        """
+        Create the telemetry queue, the background thread starts on first use
+        """
+        self.url = url
+        self.interval = interval
+        self.max_size = max_size
+        self.timeout = timeout
+
+        self.counts = {}
+        self.dropped = 0
+
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+
+    def add(self, name, error=None):
+        """
+        Count a call to an activity, optionally with the error it raised
+        """
+        key = (name, error)
+
+        with self._lock:
+            if key in self.counts:
+                self.counts[key] += 1
+
+            elif len(self.counts) < self.max_size:
+                self.counts[key] = 1
+
+            else:
+                self.dropped += 1
+                return
+
+            if not self._thread:
+                self._thread = Thread(target=self._flush_thread, daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def flush(self):
+        """
+        Send all pending counts, one request per activity (and error)
+        """
+        with self._lock:
+            counts, self.counts = self.counts, {}
+            dropped, self.dropped = self.dropped, 0
+
+        if dropped:
+            logging.debug("Telemetry dropped {} call(s)".format(dropped))
+
+        import urllib3
+
+        from automagica.httpclient import http_client
+
+        for (name, error), count in list(counts.items()):
+            data = {
+                "activity": name,  # Name of the activity
+                "count": count,  # Number of calls since last flush
+                "machine_id": getnode(),  # Unique (anonymous) identifier
+                "os": {
+                    "name": os.name,  # Operating system name
+                    "platform": platform.system(),  # Platform OS
+                    "release": platform.release(),  # Version OS
+                },
+            }
+
+            url = self.url
+
+            if error:
+                # Class name of the error ("ValueError" or "ZeroDivisionError")
+                data["error"] = error
+                url += "errors"
+
+            try:
+                # No retries, the counts are sent again with the next flush
+                _ = http_client.post(
+                    url,
+                    json=data,
+                    timeout=self.timeout,
+                    retries=urllib3.Retry(0),
+                )
+            except Exception:
+                # Portal unreachable, don't keep the bot waiting for the rest
+                logging.debug("Telemetry error")
+                self._restore(counts)
+                return
+
+            del counts[name, error]
+
+    def _restore(self, counts):
+        """
+        Put counts that could not be sent back in the queue
+        """
+        with self._lock:
+            for key, count in counts.items():
+                if key in self.counts:
+                    self.counts[key] += count
+
+                elif len(self.counts) < self.max_size:
+                    self.counts[key] = count
+
+                else:
+                    self.dropped += count
+
+    def stop(self):
+        """
+        Stop the background thread and send what is left
+        """
+        self._stop.set()
+        self.flush()
+
+    def _flush_thread(self):
+        """
+        Background thread flushing the counts periodically
+        """
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+
+TELEMETRY = TelemetryQueue("https://telemetry.automagica.com/")
+
+
+def _telemetry_enabled():
+    """
+    Telemetry is disabled by 'AUTOMAGICA_NO_TELEMETRY' and for bots
+    connected to a custom portal ('AUTOMAGICA_URL')
+    """
+    return not (
+        os.environ.get("AUTOMAGICA_NO_TELEMETRY")
+        or os.environ.get("AUTOMAGICA_URL")
+    )
+
+
 def telemetry(func):
     """
     Automagica Activity Telemetry
@@ -109,30 +271,13 @@ def telemetry(func):
     environment variable 'AUTOMAGICA_NO_TELEMETRY' is set. That way no
     information is being shared with us.
     """
-    if not os.environ.get("AUTOMAGICA_NO_TELEMETRY") and not os.environ.get(
-        "AUTOMAGICA_URL"
-    ):
+    if _telemetry_enabled():
         if func.__doc__:
             name = func.__doc__.split("\n")[0]
         else:
             name = func.__name__
 
-        data = {
-            "activity": name,  # Name of the activity
-            "machine_id": getnode(),  # Unique (anonymous) identifier
-            "os": {
-                "name": os.name,  # Operating system name
-                "platform": platform.system(),  # Platform OS
-                "release": platform.release(),  # Version OS
-            },
-        }
-
-        try:
-            _ = http_client.post(
-                "https://telemetry.automagica.com/", json=data, timeout=1
-            )
-        except Exception:
-            logging.debug("Telemetry error")
+        TELEMETRY.add(name)
 
 
 def telemetry_exception(func, exception):
@@ -145,34 +290,13 @@ def telemetry_exception(func, exception):
     environment variable 'AUTOMAGICA_NO_TELEMETRY' is set. That way no
     information is being shared with us.
     """
-
-    error = exception.__class__.__name__
-
-    if not os.environ.get("AUTOMAGICA_NO_TELEMETRY") and not os.environ.get(
-        "AUTOMAGICA_URL"
-    ):
+    if _telemetry_enabled():
         if func.__doc__:
             name = func.__doc__.split("\n")[0]
         else:
             name = func.__name__
 
-        data = {
-            "activity": name,  # Name of the activity
-            "machine_id": getnode(),  # Unique (anonymous) identifier
-            "os": {
-                "name": os.name,  # Operating system name
-                "platform": platform.system(),  # Platform OS
-                "release": platform.release(),  # Version OS
-            },
-            "error": error,  # Class name of the error ("ValueError" or "ZeroDivisionError")
-        }
-
-        try:
-            _ = http_client.post(
-                "https://telemetry.automagica.com/errors", json=data, timeout=1
-            )
-        except Exception:
-            logging.debug("Telemetry error")
+        TELEMETRY.add(name, error=exception.__class__.__name__)
 
 
 def only_supported_for(*args):
@@ -191,169 +315,205 @@ def only_supported_for(*args):
         )
 
 
-def all_activities():
+# On-disk index with the parsed metadata of all activities
+ACTIVITIES_INDEX_PATH = os.path.join(
+    os.path.expanduser("~"), ".automagica", "cache", "activities.pickle"
+)
+
+_ACTIVITIES_INDEX = None
+_ACTIVITIES_SOURCES = {}
+
+
+def parse_activity(f):
     """
-    Utility function that returns all Automagica registered activities
-    in a list of dicts
+    Parse the docstring and signature of an Automagica activity into a
+    dict with its metadata
     """
+    lines = [line.strip() for line in f.__doc__.split("\n") if line.strip()]
+
+    keywords = []
+    icon = None
+    return_ = None
+    params = {}
+
+    for i, line in enumerate(lines):
+        if line == "Keywords" and not keywords:
+            keywords = [
+                keyword.strip()
+                for keyword in lines[i + 1].split(",")
+                if keyword.strip()
+            ]
 
-    def get_keywords(f):
-        """
-        Get the 'keywords' attribute of an Automagica activity
-        """
-        lines = [
-            line.strip() for line in f.__doc__.split("\n") if line.strip()
-        ]
+        elif line == "Icon" and not icon:
+            icon = lines[i + 1].strip()
 
-        for i, line in enumerate(lines):
-            if line == "Keywords":
-                return [
-                    keyword.strip()
-                    for keyword in lines[i + 1].split(",")
-                    if keyword.strip()
-                ]
+        elif line.startswith(":return:") and not return_:
+            return_ = {"description": line.split(":")[-1].strip()}
 
-        return []
+        elif line.startswith(":parameter "):
+            name = line.split(":")[1].replace("parameter ", "")
+            params.setdefault(name, {})["description"] = line.split(":")[
+                -1
+            ].strip()
 
-    def get_name(f):
-        """
-        Get the name of the Automagica activity
-        """
-        lines = [
-            line.strip() for line in f.__doc__.split("\n") if line.strip()
-        ]
-        return lines[0]
+        elif line.startswith(":type "):
+            name = line.split(":")[1].replace("type ", "")
+            type_ = line.split(":")[-1].strip()
 
-    def get_description(f):
-        """
-        Get the description of the Automagica activity
-        """
-        lines = [
-            line.strip() for line in f.__doc__.split("\n") if line.strip()
-        ]
-        return lines[1]
+            params.setdefault(name, {}).update(
+                {"type": type_.split(",")[0], "optional": "optional" in type_}
+            )
 
-    def get_args(f):
-        """
-        Get the arguments of the Automagica activitiy
-        """
+        elif line.startswith(":options "):
+            name = line.split(":")[1].replace("options ", "")
+            options_unparsed = line[line.index(":", 2) + 2 :]
 
-        signature = inspect.signature(f)
-        params = signature.parameters
-        args = {}
+            params.setdefault(name, {})["options"] = eval(  # nosec
+                options_unparsed
+            )
 
-        for _, val in params.items():
-            arg = {
-                "default": (
-                    val.default if val.default != inspect._empty else ""
-                )
-            }
+        elif line.startswith(":extension "):
+            name = line.split(":")[1].replace("extension ", "")
+            extensions_unparsed = line[line.index(":", 2) + 2 :]
 
-            args[val.name] = arg
+            params.setdefault(name, {})[
+                "extensions"
+            ] = extensions_unparsed.split()
 
-            lines = [
-                line.strip() for line in f.__doc__.split("\n") if line.strip()
-            ]
+    args = {}
 
-            for line in lines:
-                if line.startswith(":parameter "):
-                    name = line.split(":")[1].replace("parameter ", "")
-                    description = line.split(":")[-1].strip()
+    for val in inspect.signature(f).parameters.values():
+        arg = {
+            "default": (val.default if val.default != inspect._empty else "")
+        }
+        arg.update(params.get(val.name, {}))
 
-                    if name == val.name:
-                        arg["description"] = description
+        if not arg.get("type"):
+            if val.name.endswith("path"):
+                arg["type"] = "path"
 
-                if line.startswith(":type "):
-                    name = line.split(":")[1].replace("type ", "")
+        args[val.name] = arg
 
-                    type_ = line.split(":")[-1].strip()
+    # Class name for methods of activity classes
+    class_name = f.__qualname__.split(".")[0]
 
-                    if "optional" in type_:
-                        optional = True
-                    else:
-                        optional = False
+    if class_name == f.__qualname__:
+        class_name = None
 
-                    type_ = type_.split(",")[0]
+    return {
+        "keywords": keywords,
+        "name": lines[0],
+        "description": lines[1],
+        "args": args,
+        "return": return_,
+        "class": class_name,
+        "icon": icon,
+        "key": f.__module__ + "." + f.__qualname__,
+    }
 
-                    if name == val.name:
-                        arg["type"] = type_
-                        arg["optional"] = optional
 
-                if line.startswith(":options "):
-                    name = line.split(":")[1].replace("options ", "")
-                    options_unparsed = line[line.index(":", 2) + 2 :]
-                    options = eval(options_unparsed)  # nosec
+def _activity_sources():
+    """
+    Modification time and size of the modules defining activities
+    """
+    sources = {}
 
-                    if name == val.name:
-                        arg["options"] = options
+    for f in AUTOMAGICA_ACTIVITIES:
+        path = f.__code__.co_filename
 
-                if line.startswith(":extension "):
-                    name = line.split(":")[1].replace("extension ", "")
-                    extensions_unparsed = line[line.index(":", 2) + 2 :]
-                    extensions = extensions_unparsed.split()
+        if os.path.isfile(path) and path not in sources:
+            stat = os.stat(path)
+            sources[path] = (stat.st_mtime_ns, stat.st_size)
 
-                    if name == val.name:
-                        arg["extensions"] = extensions
+    return sources
 
-            if not arg.get("type"):
-                if val.name.endswith("path"):
-                    arg["type"] = "path"
 
-        return args
+def _load_activities_index():
+    """
+    Load the on-disk index (its sources and activities), returns None if
+    missing or outdated
+    """
+    try:
+        with open(ACTIVITIES_INDEX_PATH, "rb") as f:
+            index = pickle.load(f)  # nosec
 
-    def get_return(f):
-        """
-        Get the return variable from the docstring for the Automagica activity
-        """
-        lines = [
-            line.strip() for line in f.__doc__.split("\n") if line.strip()
-        ]
+        for path, (mtime, size) in index["sources"].items():
+            stat = os.stat(path)
 
-        for line in lines:
-            if line.startswith(":return:"):
-                description = line.split(":")[-1].strip()
-                return {"description": description}
+            if (stat.st_mtime_ns, stat.st_size) != (mtime, size):
+                return None
 
-    def get_icon(f):
-        """
-        Get the 'icon' attribute for the Automagica activity
-        """
-        lines = [
-            line.strip() for line in f.__doc__.split("\n") if line.strip()
-        ]
+        return index
 
-        for i, line in enumerate(lines):
-            if line.strip() == "Icon":
-                return lines[i + 1].strip()
+    except Exception:
+        return None
 
-    def get_class(f):
-        """
-        Get the class name for the Automagica activity
-        """
-        name = f.__qualname__
 
-        class_name = f.__qualname__.split(".")[0]
+def activities_index():
+    """
+    Metadata of all registered Automagica activities by key. This is read
+    from an on-disk index, which is rebuilt when an activity module changes
+    or when activities are missing from it.
+    """
+    global _ACTIVITIES_INDEX, _ACTIVITIES_SOURCES
+
+    if _ACTIVITIES_INDEX is None:
+        index = _load_activities_index() or {"sources": {}, "activities": {}}
+        _ACTIVITIES_SOURCES = index["sources"]
+        _ACTIVITIES_INDEX = index["activities"]
+
+    # Missing or outdated index, or activities registered after it was built
+    missing = [
+        f
+        for f in AUTOMAGICA_ACTIVITIES
+        if f.__module__ + "." + f.__qualname__ not in _ACTIVITIES_INDEX
+    ]
 
-        if class_name != name:
-            return class_name
+    if missing:
+        index = dict(_ACTIVITIES_INDEX)
+
+        for f in missing:
+            metadata = parse_activity(f)
+            index[metadata["key"]] = metadata
+
+        # Entries loaded for modules that are not imported now keep their
+        # sources, so changing those modules still invalidates the index
+        sources = dict(_ACTIVITIES_SOURCES)
+        sources.update(_activity_sources())
+
+        _ACTIVITIES_INDEX = index
+        _ACTIVITIES_SOURCES = sources
+
+        try:
+            os.makedirs(os.path.dirname(ACTIVITIES_INDEX_PATH), exist_ok=True)
+
+            with open(ACTIVITIES_INDEX_PATH, "wb") as f:
+                pickle.dump({"sources": sources, "activities": index}, f)
+
+        except Exception:
+            logging.debug("Could not write activities index")
+
+    return _ACTIVITIES_INDEX
+
+
+def all_activities():
+    """
+    Utility function that returns all Automagica registered activities
+    in a list of dicts
+    """
+    # Import the activities that are loaded on first use
+    module = importlib.import_module("automagica.activities")
+
+    for name in module._LAZY_ACTIVITIES:
+        getattr(module, name)
+
+    index = activities_index()
 
     activities = {}
 
     for f in AUTOMAGICA_ACTIVITIES:
-        activity = {
-            "keywords": get_keywords(f),
-            "name": get_name(f),
-            "description": get_description(f),
-            "args": get_args(f),
-            "return": get_return(f),
-            "class": get_class(f),
-            "icon": get_icon(f), 
-            "key": f.__module__ + "." + f.__qualname__,
-            'function': f
-        }
-
         key = f.__module__ + "." + f.__qualname__
-        activities[key] = activity
+        activities[key] = dict(index[key], function=f)
 
     return activities
 
@@ -362,6 +522,8 @@ def find_automagica_processes():
     """
     Find process ids (pids) for Automagica processes
     """
+    import psutil
+
     pids = []
 
     # Walk over all processes
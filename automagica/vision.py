@@ -0,0 +1,868 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+VISION_PATH = os.path.join(os.path.expanduser("~"), ".automagica", "vision")
+
+# Template scales to search, covers moderate DPI and zoom differences
+SCALES = (0.8, 0.9, 1.0, 1.1, 1.25)
+
+# Downscaling of the frames compared to notice screen changes
+THUMBNAIL_FACTOR = 4
+
+
+def _load_local_config():
+    config_path = os.path.join(os.path.expanduser("~"), "automagica.json")
+
+    try:
+        with open(config_path) as json_file:
+            return json.load(json_file)
+
+    except (OSError, ValueError):
+        return {}
+
+
+def save_element(automagica_id, screenshot, target, anchors=None, path=None):
+    """
+    Store the target and anchor templates of an element recorded with the
+    Automagica Wand, so it can be detected locally
+    """
+    element_path = os.path.join(path or VISION_PATH, automagica_id)
+    os.makedirs(element_path, exist_ok=True)
+
+    anchors = [list(anchor) for anchor in anchors or []]
+
+    screenshot.crop(tuple(target)).save(
+        os.path.join(element_path, "target.png")
+    )
+
+    for i, anchor in enumerate(anchors):
+        screenshot.crop(tuple(anchor)).save(
+            os.path.join(element_path, "anchor_{}.png".format(i))
+        )
+
+    with open(os.path.join(element_path, "element.json"), "w") as f:
+        json.dump(
+            {
+                "target": list(target),
+                "anchors": anchors,
+                "screen_size": list(screenshot.size),
+            },
+            f,
+        )
+
+
+class Element:
+    """
+    Templates of a recorded element
+    """
+
+    def __init__(self, automagica_id, path=None):
+        """
+        Load the element templates from disk
+        """
+        from PIL import Image
+
+        element_path = os.path.join(path or VISION_PATH, automagica_id)
+
+        with open(os.path.join(element_path, "element.json")) as f:
+            data = json.load(f)
+
+        self.automagica_id = automagica_id
+        self.box = data["target"]
+        self.target = _to_array(
+            Image.open(os.path.join(element_path, "target.png"))
+        )
+        self.anchors = [
+            (
+                box,
+                _to_array(
+                    Image.open(
+                        os.path.join(element_path, "anchor_{}.png".format(i))
+                    )
+                ),
+            )
+            for i, box in enumerate(data["anchors"])
+        ]
+
+
+def _to_array(image):
+    """
+    Convert a Pillow image or an RGB NumPy array (see ScreenGrabber.grab)
+    to a grayscale NumPy array
+    """
+    import numpy as np
+
+    if isinstance(image, np.ndarray):
+        if image.ndim == 3:
+            # ITU-R 601-2 luma, as Pillow's "L" conversion
+            return image[:, :, :3] @ np.array((0.299, 0.587, 0.114))
+
+        return image.astype(np.float64)
+
+    return np.asarray(image.convert("L"), dtype=np.float64)
+
+
+def _to_image(screenshot):
+    """
+    Pillow image of a screenshot given as an image or an RGB NumPy array
+    """
+    import numpy as np
+    from PIL import Image
+
+    if isinstance(screenshot, np.ndarray):
+        return Image.fromarray(np.ascontiguousarray(screenshot))
+
+    return screenshot
+
+
+def _size(screenshot):
+    """
+    Width and height of a screenshot given as an image or a NumPy array
+    """
+    if hasattr(screenshot, "shape"):
+        return screenshot.shape[1], screenshot.shape[0]
+
+    return screenshot.size
+
+
+def _resize(array, scale):
+    """
+    Resize a grayscale array, box filter when shrinking
+    """
+    import numpy as np
+    from PIL import Image
+
+    if scale == 1:
+        return array
+
+    height, width = array.shape
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    image = Image.fromarray(array.astype(np.float32), mode="F")
+    image = image.resize(size, Image.BOX if scale < 1 else Image.BILINEAR)
+
+    return np.asarray(image, dtype=np.float64)
+
+
+def _fast_length(n):
+    """
+    Smallest length >= n with only 2, 3 and 5 as prime factors, the FFT is
+    much faster for those
+    """
+    while True:
+        m = n
+
+        for prime in (2, 3, 5):
+            while m % prime == 0:
+                m //= prime
+
+        if m == 1:
+            return n
+
+        n += 1
+
+
+class PreparedImage:
+    """
+    Grayscale image with the integral images and spectra needed to match
+    several templates against it
+    """
+
+    def __init__(self, array):
+        import numpy as np
+
+        self.array = array
+        self.shape = array.shape
+        self.integral = np.pad(array, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+        self.integral_squared = (
+            np.pad(array * array, ((1, 0), (1, 0))).cumsum(0).cumsum(1)
+        )
+        self.spectra = {}
+
+    def spectrum(self, shape):
+        import numpy as np
+
+        if shape not in self.spectra:
+            self.spectra[shape] = np.fft.rfft2(self.array, shape)
+
+        return self.spectra[shape]
+
+
+def match_template(image, template, fft_shape=None):
+    """
+    Normalized cross-correlation of a template over all positions where it
+    fits in the image (an array or PreparedImage). Returns an array of
+    scores between -1 and 1, a score of 1 is a perfect match.
+    """
+    import numpy as np
+
+    if not isinstance(image, PreparedImage):
+        image = PreparedImage(image)
+
+    image_height, image_width = image.shape
+    height, width = template.shape
+
+    if height > image_height or width > image_width:
+        return np.zeros((0, 0))
+
+    template = template - template.mean()
+    template_norm = np.sqrt((template * template).sum())
+
+    # Cross-correlation through the FFT
+    shape = fft_shape or (
+        _fast_length(image_height + height - 1),
+        _fast_length(image_width + width - 1),
+    )
+    correlation = np.fft.irfft2(
+        image.spectrum(shape) * np.fft.rfft2(template[::-1, ::-1], shape),
+        shape,
+    )[height - 1 : image_height, width - 1 : image_width]
+
+    # Sums over every template-sized window through the integral images
+    def window_sums(integral):
+        return (
+            integral[height:, width:]
+            - integral[:-height, width:]
+            - integral[height:, :-width]
+            + integral[:-height, :-width]
+        )
+
+    sums = window_sums(image.integral)
+    variance = window_sums(image.integral_squared) - sums * sums / (
+        height * width
+    )
+    denominator = np.sqrt(np.maximum(variance, 0)) * template_norm
+
+    scores = np.zeros_like(correlation)
+    mask = denominator > 1e-6 * max(template_norm, 1)
+    scores[mask] = correlation[mask] / denominator[mask]
+
+    return scores
+
+
+def _peaks(scores, n, min_score, radius):
+    """
+    Positions (y, x) of the n best scores that are at least radius apart
+    """
+    import numpy as np
+
+    scores = scores.copy()
+    peaks = []
+
+    for _ in range(n):
+        if not scores.size:
+            break
+
+        y, x = np.unravel_index(np.argmax(scores), scores.shape)
+
+        if scores[y, x] < min_score:
+            break
+
+        peaks.append((y, x))
+        scores[
+            max(0, y - radius[0]) : y + radius[0] + 1,
+            max(0, x - radius[1]) : x + radius[1] + 1,
+        ] = -np.inf
+
+    return peaks
+
+
+def find_template(screen, template, scales=SCALES, threshold=0.9, n=5):
+    """
+    Find a template on the screen (both grayscale arrays) at several
+    scales. The search runs on a downscaled screen first and refines the
+    best candidates at full resolution. Returns a list of
+    (score, scale, (left, top, right, bottom)), best match first.
+    """
+    import numpy as np
+
+    # Coarse level: shrink so the template is still at least ~8 pixels
+    factor = max(1, min(4, min(template.shape) // 8))
+    coarse_screen = PreparedImage(_resize(screen, 1 / factor))
+
+    # One FFT size for all scales, so the screen spectrum is reused
+    fft_shape = tuple(
+        _fast_length(
+            coarse_screen.shape[i]
+            + int(template.shape[i] * max(scales) / factor)
+            + 1
+        )
+        for i in (0, 1)
+    )
+
+    candidates = []
+
+    for scale in scales:
+        coarse_template = _resize(template, scale / factor)
+
+        if min(coarse_template.shape) < 3:
+            continue
+
+        scores = match_template(coarse_screen, coarse_template, fft_shape)
+        radius = tuple(size // 2 for size in coarse_template.shape)
+
+        for y, x in _peaks(scores, n, threshold - 0.2, radius):
+            candidates.append((scores[y, x], scale, x * factor, y * factor))
+
+    # Fine level: full resolution search around the best candidates
+    results = []
+    margin = 2 * factor
+
+    for _, scale, x, y in sorted(candidates, reverse=True)[:n]:
+        fine_template = _resize(template, scale)
+        height, width = fine_template.shape
+
+        left, top = max(0, x - margin), max(0, y - margin)
+        window = screen[
+            top : y + height + margin + 1, left : x + width + margin + 1
+        ]
+
+        scores = match_template(window, fine_template)
+
+        if not scores.size:
+            continue
+
+        dy, dx = np.unravel_index(np.argmax(scores), scores.shape)
+
+        if scores[dy, dx] >= threshold:
+            box = (
+                int(left + dx),
+                int(top + dy),
+                int(left + dx + width),
+                int(top + dy + height),
+            )
+
+            # Skip duplicates of a better match
+            if not any(
+                abs(box[0] - other[0]) < width / 2
+                and abs(box[1] - other[1]) < height / 2
+                for _, _, other in results
+            ):
+                results.append((float(scores[dy, dx]), scale, box))
+
+    return sorted(results, reverse=True)
+
+
+class VisionBackend:
+    """
+    Detects recorded elements (automagica_id) on a screenshot
+    """
+
+    def detect(self, automagica_id, screenshot, detect_target=True):
+        """
+        Returns the location (left, top, right, bottom) of the element
+        """
+        raise NotImplementedError
+
+    def detects_locally(self, automagica_id):
+        """
+        Returns True if the element is detected on this machine, so it is
+        cheap to detect it often
+        """
+        return False
+
+
+class PortalBackend(VisionBackend):
+    """
+    Detection by the Automagica Portal API
+    """
+
+    def detect(self, automagica_id, screenshot, detect_target=True):
+        from automagica.httpclient import http_client
+        from io import BytesIO
+        import base64
+
+        # Convert to base64
+        buffered = BytesIO()
+        _to_image(screenshot).save(buffered, format="PNG")
+        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+        local_data = _load_local_config()
+
+        data = {
+            "bot_secret": str(local_data.get("bot_secret")),
+            "automagica_id": automagica_id,
+            "image_base64": image_base64,  # Screenshot of the example screen
+            "detect_target": detect_target,
+        }
+
+        portal_url = local_data.get("portal_url")
+
+        if not portal_url:
+            portal_url = "https://portal.automagica.com"
+
+        url = portal_url + "/api/wand/detect"
+
+        r = http_client.post(url, json=data)
+
+        try:
+            data = r.json()
+
+        except Exception:
+            raise Exception(
+                "An unknown error occurred accessing the Automagica Portal API. Please try again later."
+            )
+
+        if data.get("error"):
+            raise Exception(data["error"])
+
+        return data["location"]
+
+
+class LocalBackend(VisionBackend):
+    """
+    Detection by matching the element templates stored by the Automagica
+    Wand against the screen, without any network round-trip
+    """
+
+    def __init__(self, path=None, scales=SCALES, threshold=0.9):
+        """
+        Initialize the backend
+        """
+        self.path = path or VISION_PATH
+        self.scales = scales
+        self.threshold = threshold
+        self.elements = {}
+
+    def has_element(self, automagica_id):
+        """
+        Returns True if templates are stored for the element
+        """
+        return os.path.isfile(
+            os.path.join(self.path, automagica_id, "element.json")
+        )
+
+    def detects_locally(self, automagica_id):
+        return True
+
+    def get_element(self, automagica_id):
+        if automagica_id not in self.elements:
+            if not self.has_element(automagica_id):
+                raise Exception(
+                    "No local templates for element {}, record it again with the Automagica Wand.".format(
+                        automagica_id
+                    )
+                )
+
+            self.elements[automagica_id] = Element(automagica_id, self.path)
+
+        return self.elements[automagica_id]
+
+    def detect(self, automagica_id, screenshot, detect_target=True):
+        element = self.get_element(automagica_id)
+        screen = _to_array(screenshot)
+
+        candidates = find_template(
+            screen, element.target, self.scales, self.threshold
+        )
+
+        if not candidates:
+            raise Exception(
+                "Element {} was not found on the screen".format(automagica_id)
+            )
+
+        # Use the anchors to pick between similar looking candidates
+        if element.anchors and len(candidates) > 1:
+            candidates.sort(
+                key=lambda candidate: candidate[0]
+                + self._anchors_score(element, screen, *candidate[1:]),
+                reverse=True,
+            )
+
+        return list(candidates[0][2])
+
+    def _anchors_score(self, element, screen, scale, box):
+        """
+        Sum of the anchor match scores around their expected positions
+        relative to a target candidate
+        """
+        import numpy as np
+
+        score = 0
+
+        for anchor_box, anchor in element.anchors:
+            anchor = _resize(anchor, scale)
+            height, width = anchor.shape
+
+            # Expected position of the anchor
+            x = box[0] + round((anchor_box[0] - element.box[0]) * scale)
+            y = box[1] + round((anchor_box[1] - element.box[1]) * scale)
+            margin = max(height, width) // 2 + 10
+
+            left, top = max(0, x - margin), max(0, y - margin)
+            window = screen[
+                top : y + height + margin, left : x + width + margin
+            ]
+
+            scores = match_template(window, anchor)
+
+            if scores.size:
+                score += max(0, float(np.max(scores)))
+
+        return score
+
+
+class AutoBackend(VisionBackend):
+    """
+    Detects locally when the Wand stored templates for the element and falls
+    back to the Automagica Portal otherwise, or when the element was not
+    found locally
+    """
+
+    def detects_locally(self, automagica_id):
+        return get_vision_backend_by_name("local").has_element(automagica_id)
+
+    def detect(self, automagica_id, screenshot, detect_target=True):
+        local = get_vision_backend_by_name("local")
+
+        if local.has_element(automagica_id):
+            try:
+                return local.detect(automagica_id, screenshot, detect_target)
+
+            except Exception:
+                logging.debug(
+                    "Local detection of {} failed, using the Portal".format(
+                        automagica_id
+                    ),
+                    exc_info=True,
+                )
+
+        return get_vision_backend_by_name("portal").detect(
+            automagica_id, screenshot, detect_target
+        )
+
+
+VISION_BACKENDS = {
+    "auto": AutoBackend,
+    "local": LocalBackend,
+    "portal": PortalBackend,
+}
+
+_BACKENDS = {}
+
+
+def get_vision_backend():
+    """
+    Returns the vision backend to use, set with the AUTOMAGICA_VISION_BACKEND
+    environment variable or "vision_backend" in automagica.json (default:
+    "auto")
+    """
+    name = os.environ.get("AUTOMAGICA_VISION_BACKEND") or (
+        _load_local_config().get("vision_backend", "auto")
+    )
+
+    return get_vision_backend_by_name(name)
+
+
+def get_vision_backend_by_name(name):
+    """
+    Returns the (shared) instance of a registered vision backend
+    """
+    if name not in VISION_BACKENDS:
+        raise Exception(
+            "Unknown vision backend {}, use one of: {}".format(
+                name, ", ".join(sorted(VISION_BACKENDS))
+            )
+        )
+
+    if name not in _BACKENDS:
+        _BACKENDS[name] = VISION_BACKENDS[name]()
+
+    return _BACKENDS[name]
+
+
+def _crop(screenshot, box):
+    """
+    Grayscale Pillow image of a box on a screenshot
+    """
+    import numpy as np
+    from PIL import Image
+
+    if hasattr(screenshot, "crop"):
+        return screenshot.crop(tuple(box)).convert("L")
+
+    left, top, right, bottom = box
+
+    return Image.fromarray(
+        np.rint(_to_array(screenshot[top:bottom, left:right])).astype(np.uint8)
+    )
+
+
+def region_hash(screenshot, box, hash_size=16):
+    """
+    Perceptual (difference) hash of a region of a screenshot, as an integer
+    """
+    import numpy as np
+
+    pixels = np.asarray(
+        _crop(screenshot, box).resize((hash_size + 1, hash_size)),
+        dtype=np.int16,
+    )
+    bits = np.packbits(pixels[:, 1:] > pixels[:, :-1])
+
+    return int.from_bytes(bits.tobytes(), "big")
+
+
+def _pixels_digest(screenshot, box):
+    """
+    Digest of the exact (grayscale) pixels of a box on a screenshot
+    """
+    return hashlib.blake2b(_crop(screenshot, box).tobytes()).digest()
+
+
+class DetectionCache:
+    """
+    Remembers where elements were detected, together with the pixels of the
+    element and a perceptual hash of the screen around it. As long as the
+    element is exactly the same and the region around it looks the same, the
+    element is assumed to still be there.
+    """
+
+    def __init__(self, max_size=128, ttl=60, margin=20):
+        """
+        Initialize the cache, entries expire after ttl seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.margin = margin
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def _region(self, screenshot, location):
+        """
+        Box around a location with a margin, None if it is off the screen
+        """
+        left, top, right, bottom = location
+        width, height = _size(screenshot)
+
+        if left < 0 or top < 0 or right > width or bottom > height:
+            return None
+
+        return (
+            max(0, left - self.margin),
+            max(0, top - self.margin),
+            min(width, right + self.margin),
+            min(height, bottom + self.margin),
+        )
+
+    def get(self, key, screenshot):
+        """
+        Returns the cached location if the element and the region around it
+        did not change
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None:
+                return None
+
+            location, size, box, hash_, digest, created = entry
+
+            if time.monotonic() - created > self.ttl:
+                del self.entries[key]
+                return None
+
+            self.entries.move_to_end(key)
+
+        if _size(screenshot) != size:
+            return None
+
+        # Near-identical hashes are not enough, fe. a button with another
+        # label at the same place is a different element
+        if _pixels_digest(screenshot, location) != digest:
+            return None
+
+        if region_hash(screenshot, box) != hash_:
+            return None
+
+        return list(location)
+
+    def add(self, key, screenshot, location):
+        """
+        Store a detected location
+        """
+        box = self._region(screenshot, location)
+
+        if box is None:
+            return
+
+        hash_ = region_hash(screenshot, box)
+        digest = _pixels_digest(screenshot, location)
+
+        with self.lock:
+            self.entries[key] = (
+                list(location),
+                _size(screenshot),
+                box,
+                hash_,
+                digest,
+                time.monotonic(),
+            )
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+detection_cache = DetectionCache()
+
+
+def detect_element(automagica_id, screenshot, detect_target=True):
+    """
+    Returns the location of an element on a screenshot. Locations of recent
+    detections are reused when the screen around them did not change.
+    """
+    key = (automagica_id, detect_target)
+    location = detection_cache.get(key, screenshot)
+
+    if location is None:
+        location = get_vision_backend().detect(
+            automagica_id, screenshot, detect_target=detect_target
+        )
+        detection_cache.add(key, screenshot, location)
+
+    return location
+
+
+def _thumbnail(screenshot, factor=THUMBNAIL_FACTOR):
+    """
+    Cheap low resolution grayscale version of a screenshot (an image or an
+    RGB NumPy array) to compare frames
+    """
+    import numpy as np
+
+    if isinstance(screenshot, np.ndarray):
+        height = screenshot.shape[0] // factor * factor
+        width = screenshot.shape[1] // factor * factor
+
+        # Block averages of the green channel, which carries most of the
+        # brightness
+        return (
+            screenshot[:height, :width, 1]
+            .reshape(height // factor, factor, width // factor, factor)
+            .mean(axis=(1, 3))
+            .astype(np.int16)
+        )
+
+    return np.asarray(screenshot.convert("L").reduce(factor), dtype=np.int16)
+
+
+def wait_element(
+    automagica_id,
+    vanish=False,
+    timeout=30,
+    grab=None,
+    interval=0.02,
+    max_backoff=1,
+    remote_interval=5,
+):
+    """
+    Wait for an element to appear (or vanish). Frames of the screen are
+    compared and the element is only detected again when the screen changed,
+    around the element when waiting for it to vanish. While the screen keeps
+    changing, detections back off exponentially up to max_backoff seconds.
+    Elements detected by the Automagica Portal are detected at most every
+    remote_interval seconds. Returns the location of the element if it
+    appeared.
+    """
+    import numpy as np
+
+    if grab is None:
+        from automagica.screen import get_grabber
+
+        grab = get_grabber().grab
+
+    # The detection cache is not used, waits are exactly about the element
+    # (dis)appearing while the screen around it may look the same
+    backend = get_vision_backend()
+    factor = THUMBNAIL_FACTOR
+    deadline = time.monotonic() + timeout
+    reference = None  # Thumbnail of the last frame the element was detected on
+    region = None  # Part of the thumbnail to compare
+    backoff = 0
+    next_detection = 0
+
+    # Remote detections are slow and shared, e.g. a clock on the screen
+    # should not cause a request every second
+    min_interval = (
+        0 if backend.detects_locally(automagica_id) else remote_interval
+    )
+
+    while True:
+        frame = grab()
+        thumbnail = _thumbnail(frame, factor)
+        now = time.monotonic()
+
+        if reference is None or reference.shape != thumbnail.shape:
+            changed = True
+
+        else:
+            a, b = reference, thumbnail
+
+            if region:
+                a, b = (
+                    x[region[1] : region[3], region[0] : region[2]]
+                    for x in (a, b)
+                )
+
+            changed = bool(np.any(np.abs(a - b) > 8))
+
+        if not changed:
+            backoff = 0
+
+        elif now >= next_detection:
+            reference = thumbnail
+
+            try:
+                location = backend.detect(automagica_id, frame)
+
+            except Exception:
+                logging.debug(
+                    "Element {} not detected".format(automagica_id),
+                    exc_info=True,
+                )
+                location = None
+
+            if location and not vanish:
+                return location
+
+            if not location and vanish:
+                return None
+
+            if vanish:
+                region = [
+                    max(0, location[0] // factor - 2),
+                    max(0, location[1] // factor - 2),
+                    location[2] // factor + 3,
+                    location[3] // factor + 3,
+                ]
+
+            backoff = min(max_backoff, max(0.1, backoff * 2))
+            next_detection = now + max(backoff, min_interval)
+
+        if now >= deadline:
+            raise TimeoutError(
+                "Element did not {} within {} seconds".format(
+                    "disappear" if vanish else "appear", timeout
+                )
+            )
+
+        # No need to look at the screen before the next remote detection
+        if min_interval:
+            time.sleep(
+                max(interval, min(next_detection, deadline) - time.monotonic())
+            )
+
+        else:
+            time.sleep(interval)
@@ -0,0 +1,323 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import sys
+import tempfile
+
+from automagica.metrics import WorkerMetrics
+
+# Modules imported by every worker before it accepts jobs
+PRELOAD_MODULES = (
+    "automagica.activities",
+    "automagica.browser",
+    "automagica.gui.apps",
+    "automagica.runner",
+)
+
+
+def _preload(modules):
+    """
+    Import the modules (and their lazy attributes) once per worker
+    """
+    for name in modules:
+        try:
+            module = importlib.import_module(name)
+
+            for attr in getattr(module, "__all__", ()):
+                getattr(module, attr)
+
+        except Exception:
+            logging.getLogger("automagica.workers").exception(
+                "Could not preload {}".format(name)
+            )
+
+
+def _run_job(job, config):
+    """
+    Run a job in the worker, returns the exit code
+    """
+    from automagica.gui.apps import LabApp, ScriptApp
+    from automagica.runner import run_flow_file
+
+    try:
+        if job["kind"] == "notebook":
+            LabApp(config=config).run(job["file_path"])
+
+        elif job["kind"] == "script":
+            ScriptApp(config=config).run(job["file_path"])
+
+        elif job["kind"] == "flow":
+            return 0 if run_flow_file(job["file_path"]) else 1
+
+        else:
+            raise ValueError("Unknown job kind {}".format(job["kind"]))
+
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+
+        # sys.exit("message")
+        config.logger.error(e.code)
+        return 1
+
+    except Exception:
+        config.logger.exception("Job failed")
+        return 1
+
+    return 0
+
+
+def _run_isolated(job, config):
+    """
+    Run a job with its own working directory, import path and environment,
+    writing its console output (file descriptor 1) to the job's output path
+    """
+    cwd = os.getcwd()
+    path = list(sys.path)
+    modules = set(sys.modules)
+    environ = dict(os.environ)
+
+    sys.stdout.flush()
+    stdout_fd = os.dup(1)
+
+    with open(job["output_path"], "wb") as f:
+        os.dup2(f.fileno(), 1)
+
+    try:
+        os.chdir(job["cwd"])
+        sys.path.insert(0, job["cwd"])
+
+        return _run_job(job, config)
+
+    finally:
+        sys.stdout.flush()
+        os.dup2(stdout_fd, 1)
+        os.close(stdout_fd)
+
+        os.chdir(cwd)
+        sys.path[:] = path
+        os.environ.clear()
+        os.environ.update(environ)
+
+        # Forget modules the job imported from its own folder
+        job_path = os.path.join(os.path.realpath(job["cwd"]), "")
+
+        for name in set(sys.modules) - modules:
+            module_path = getattr(sys.modules[name], "__file__", None)
+
+            if module_path and os.path.realpath(module_path).startswith(
+                job_path
+            ):
+                del sys.modules[name]
+
+
+def _worker_main(connection, preload, max_jobs, max_memory):
+    """
+    Worker process: preload modules, then run jobs received over the pipe
+    until it is asked to stop or has to be recycled
+    """
+    import psutil
+
+    from automagica.config import Config
+
+    # Bots started with pythonw have no console to inherit
+    try:
+        os.fstat(1)
+    except OSError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+
+    if sys.stdout is None:
+        sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+
+    _preload(preload)
+
+    config = Config()
+    process = psutil.Process()
+    metrics = WorkerMetrics()
+    n_jobs = 0
+
+    while True:
+        try:
+            job = connection.recv()
+        except EOFError:
+            break
+
+        if job is None:
+            break
+
+        returncode = _run_isolated(job, config)
+        n_jobs += 1
+
+        recycle = n_jobs >= max_jobs or (
+            max_memory and process.memory_info().rss > max_memory
+        )
+
+        connection.send((returncode, recycle, metrics.take()))
+
+        if recycle:
+            break
+
+
+class Worker:
+    """
+    Pre-started Python process that runs jobs sent over a pipe
+    """
+
+    def __init__(self, context, preload, max_jobs, max_memory):
+        """
+        Start the worker process
+        """
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_connection, preload, max_jobs, max_memory),
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+    def run(self, job, timeout=None):
+        """
+        Run a job, returns the exit code, whether the worker has to be
+        replaced and the increase of its metrics (see WorkerMetrics). The
+        worker is stopped if the job does not finish within timeout seconds.
+        """
+        try:
+            self.connection.send(job)
+
+            if not self.connection.poll(timeout):
+                logging.getLogger("automagica.workers").error(
+                    "Job did not finish within {} seconds".format(timeout)
+                )
+                self.process.terminate()
+                self.process.join()
+                return self.process.exitcode, True, None
+
+            return self.connection.recv()
+
+        except (EOFError, OSError):
+            # The worker exited during the job, e.g. os._exit() in a script
+            self.process.join()
+            return self.process.exitcode, True, None
+
+    def stop(self, timeout=5):
+        """
+        Stop the worker process
+        """
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+
+        self.process.join(timeout)
+
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+        self.connection.close()
+
+
+class WorkerPool:
+    """
+    Pool of warm worker processes for running notebooks, scripts and Flows.
+    Workers import the activities once and run many jobs, each with fresh
+    globals and its own working directory. A worker is replaced after
+    max_jobs jobs, when its memory use exceeds max_memory bytes or when a
+    job runs longer than timeout seconds.
+    """
+
+    def __init__(
+        self,
+        size=1,
+        max_jobs=25,
+        max_memory=512 * 1024 * 1024,
+        preload=PRELOAD_MODULES,
+        timeout=None,
+    ):
+        """
+        Initialize the pool, workers are started by start() or the first job
+        """
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.preload = preload
+        self.timeout = timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = queue.Queue()
+        self.metrics = WorkerMetrics()
+        self.started = False
+
+    def _spawn(self):
+        return Worker(
+            self.context, self.preload, self.max_jobs, self.max_memory
+        )
+
+    def start(self):
+        """
+        Start the worker processes
+        """
+        if not self.started:
+            self.started = True
+
+            for _ in range(self.size):
+                self.workers.put(self._spawn())
+
+    def run(self, kind, file_path, cwd):
+        """
+        Run a job ("notebook", "script" or "flow") in a worker, returns the
+        console output and the exit code
+        """
+        self.start()
+
+        fd, output_path = tempfile.mkstemp(prefix="automagica-", suffix=".txt")
+        os.close(fd)
+
+        job = {
+            "kind": kind,
+            "file_path": str(file_path),
+            "cwd": str(cwd),
+            "output_path": output_path,
+        }
+
+        worker = self.workers.get()
+        recycle = True
+
+        try:
+            returncode, recycle, metrics = worker.run(job, self.timeout)
+
+            # Activity metrics of the job, collected in the worker
+            if metrics:
+                self.metrics.merge(metrics)
+
+        finally:
+            if recycle or not worker.process.is_alive():
+                worker.stop()
+                worker = self._spawn()
+
+            self.workers.put(worker)
+
+        with open(output_path, "rb") as f:
+            output = f.read().decode("utf-8", "replace")
+
+        os.remove(output_path)
+
+        return output, returncode
+
+    def stop(self):
+        """
+        Stop all idle worker processes
+        """
+        while True:
+            try:
+                worker = self.workers.get_nowait()
+            except queue.Empty:
+                break
+
+            worker.stop()
+
+        self.started = False
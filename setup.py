@@ -77,6 +77,7 @@ setup(
         "Pillow==7.2.0",  # PIL License (permissive),
         "pysnmp==4.4.12",  # BSD 2-Clause "Simplified" License
         "pandas==1.1.1",  # BSD 3-Clause
+        "numpy==1.19.1",  # BSD 3-Clause
         "mss==5.1.0",  # MIT License
         "mouse==0.7.1",  # MIT License
         "keyboard==0.13.5",  # MIT License
@@ -0,0 +1,81 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Thread
+from urllib.parse import parse_qs, urlparse
+
+
+class StandInPortal:
+    """
+    Local stand-in for the Automagica Portal job and alive API. With
+    long_poll=False it behaves like a Portal that answers job requests
+    right away.
+    """
+
+    def __init__(self, long_poll=True):
+        self.long_poll = long_poll
+        self.jobs = []
+        self.requests = []
+        self.fail = 0
+        self.condition = Condition()
+
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                portal.requests.append(("GET", url.path))
+
+                if portal.fail:
+                    portal.fail -= 1
+                    return self.respond(500, {"error": "Unavailable"})
+
+                if url.path != "/api/job/next":
+                    return self.respond(404, {})
+
+                wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+
+                if not portal.long_poll:
+                    wait = 0
+
+                with portal.condition:
+                    portal.condition.wait_for(lambda: portal.jobs, wait)
+                    job = portal.jobs.pop(0) if portal.jobs else {}
+
+                self.respond(200, job)
+
+            def do_POST(self):
+                portal.requests.append(("POST", self.path))
+                self.respond(200, {})
+
+            def respond(self, status, data):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        with self.condition:
+            self.condition.notify_all()
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add_job(self, job):
+        """Queue a job, waiting long-poll requests are answered right away"""
+        with self.condition:
+            self.jobs.append(dict(job, queued_at=time.monotonic()))
+            self.condition.notify_all()
@@ -1,4 +1,5 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
+
 import pytest
 
 from automagica.gui.apps import BotApp
@@ -33,3 +34,45 @@ def test_config_window(bot_app):
     window.destroy()
 
     assert True
+
+
+def test_job_slots():
+    """Jobs without the exclusive desktop flag run in parallel"""
+    import time
+    from threading import BoundedSemaphore, Lock, Thread
+    from types import SimpleNamespace
+
+    running = {True: 0, False: 0}
+    peaks = {True: 0, False: 0}
+    lock = Lock()
+
+    def run_job(job, headers):
+        exclusive = job.get("exclusive_desktop", True)
+
+        with lock:
+            running[exclusive] += 1
+            peaks[exclusive] = max(peaks[exclusive], running[exclusive])
+
+        time.sleep(0.2)
+
+        with lock:
+            running[exclusive] -= 1
+
+    bot_app = SimpleNamespace(
+        job_slots=BoundedSemaphore(4), desktop_lock=Lock(), _run_job=run_job
+    )
+
+    threads = []
+
+    for i, exclusive in enumerate((True, True, False, False)):
+        bot_app.job_slots.acquire()
+
+        job = {"job_id": str(i), "exclusive_desktop": exclusive}
+        thread = Thread(target=BotApp._job_thread, args=(bot_app, job, {}))
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    assert peaks == {True: 1, False: 2}
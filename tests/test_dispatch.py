@@ -0,0 +1,104 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+import time
+from threading import Thread
+
+import pytest
+
+from tests.portal import StandInPortal
+
+
+@pytest.fixture
+def portal():
+    """Stand-in Portal with long-polling"""
+    portal = StandInPortal()
+    portal.start()
+
+    yield portal
+
+    portal.stop()
+
+
+def test_long_poll_pickup(portal):
+    """Jobs are picked up as soon as they are queued"""
+    from automagica.dispatch import DispatchClient
+
+    client = DispatchClient(portal.url, "secret", wait=10)
+    jobs = []
+
+    thread = Thread(target=lambda: jobs.append(client.next_job()))
+    thread.start()
+
+    time.sleep(0.5)
+    portal.add_job({"job_id": "1"})
+    thread.join()
+
+    latency = time.monotonic() - jobs[0]["queued_at"]
+
+    assert jobs[0]["job_id"] == "1"
+    assert latency < 1
+    assert portal.requests == [("GET", "/api/job/next")]
+
+
+def test_heartbeat_piggyback(portal):
+    """Long-poll requests replace the separate alive requests"""
+    from automagica.dispatch import DispatchClient
+
+    client = DispatchClient(portal.url, "secret", wait=1)
+
+    # Before the first long-poll the bot still reports alive
+    assert client.heartbeat()
+
+    assert client.next_job() is None
+    assert client.long_polling
+    assert not client.heartbeat()
+
+    assert portal.requests == [
+        ("POST", "/api/bot/alive"),
+        ("GET", "/api/job/next"),
+    ]
+
+
+def test_without_long_poll():
+    """Portals answering right away are polled and receive heartbeats"""
+    from automagica.dispatch import DispatchClient
+
+    portal = StandInPortal(long_poll=False)
+    portal.start()
+
+    try:
+        client = DispatchClient(portal.url, "secret", wait=10)
+
+        assert client.next_job() is None
+        assert not client.long_polling
+        assert client.heartbeat()
+
+    finally:
+        portal.stop()
+
+
+def test_backoff(portal):
+    """Failed requests back off exponentially with jitter"""
+    from automagica.dispatch import DispatchClient
+
+    client = DispatchClient(
+        portal.url, "secret", wait=1, min_backoff=1, max_backoff=8
+    )
+    portal.fail = 5
+
+    delays = []
+
+    for _ in range(5):
+        with pytest.raises(Exception):
+            client.next_job()
+
+        delays.append(client.backoff())
+
+    for i, delay in enumerate(delays):
+        assert 0 <= delay <= min(8, 2 ** i)
+
+    assert client.failures == 5
+
+    portal.add_job({"job_id": "2"})
+
+    assert client.next_job()["job_id"] == "2"
+    assert client.failures == 0
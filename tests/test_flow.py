@@ -1,4 +1,7 @@
 """Copyright 2020 Oakwood Technologies BVBA"""
+import os
+import time
+
 import pytest
 
 from automagica.utilities import all_activities
@@ -118,3 +121,651 @@ def test_all_activities_flow(flow_designer_window, tmp_path):
         window.destroy()
 
     assert True
+
+
+def test_headless_flow_runner():
+    """Test running a Flow with loops without any GUI"""
+    from automagica.flow import Flow
+    from automagica.runner import FlowRunner
+
+    flow = Flow(nodes=[])
+    flow.from_dict(
+        {
+            "name": "Headless",
+            "nodes": [
+                {"type": "StartNode", "uid": "strt", "next_node": "init"},
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "init",
+                    "code": "total = 0",
+                    "next_node": "loop",
+                },
+                {
+                    "type": "LoopNode",
+                    "uid": "loop",
+                    "iterable": "range(1000)",
+                    "loop_variable": "i",
+                    "loop_node": "body",
+                    "next_node": "done",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "body",
+                    "code": "total += i",
+                },
+                {
+                    "type": "IfElseNode",
+                    "uid": "done",
+                    "condition": "total == sum(range(1000))",
+                    "else_node": "fail",
+                },
+                {"type": "PythonCodeNode", "uid": "fail", "code": "1 / 0"},
+            ],
+        }
+    )
+
+    runner = FlowRunner(flow)
+
+    try:
+        assert runner.run()
+        assert runner.bot.interpreter.locals["total"] == sum(range(1000))
+    finally:
+        runner.bot.stop()
+
+
+def test_flow_runner_batches():
+    """Test running consecutive command nodes as one batch in the bot"""
+    from automagica.flow import Flow
+    from automagica.runner import FlowRunner
+
+    flow = Flow(nodes=[])
+    flow.from_dict(
+        {
+            "name": "Batches",
+            "nodes": [
+                {"type": "StartNode", "uid": "strt", "next_node": "a"},
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "a",
+                    "code": "steps = ['a']",
+                    "next_node": "b",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "b",
+                    "code": "1 / 0",
+                    "next_node": "c",
+                    "on_exception_node": "d",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "c",
+                    "code": "steps.append('c')",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "d",
+                    "code": "steps.append('d')",
+                    "next_node": "e",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "e",
+                    "code": "steps.append('e')",
+                },
+            ],
+        }
+    )
+
+    runner = FlowRunner(flow)
+    batches = []
+    run_many = runner.bot.run_many
+
+    def count_batches(commands, **kwargs):
+        batches.append(len(commands))
+        run_many(commands, **kwargs)
+
+    runner.bot.run_many = count_batches
+
+    try:
+        assert runner.run()
+        assert runner.bot.interpreter.locals["steps"] == ["a", "d", "e"]
+        assert batches == [3, 2]
+        assert runner.n_nodes_ran == 5
+    finally:
+        runner.bot.stop()
+
+
+def test_flow_node_index():
+    """Test the uid and predecessor indices of a Flow"""
+    from automagica.flow import Flow
+
+    flow = Flow()
+    start = flow.get_start_nodes()[0]
+
+    first = flow.add_node("PythonCode")
+    second = flow.add_node("PythonCode")
+
+    assert flow.get_node_by_uid(second.uid) is second
+    assert flow.get_predecessors(first.uid) == [start]
+    assert flow.get_predecessors(second.uid) == [first]
+
+    flow.connect(first, "on_exception_node", start.uid)
+
+    assert flow.get_predecessors(start.uid) == [first]
+
+    flow.remove_node(first)
+
+    assert flow.get_node_by_uid(first.uid) is None
+    assert start.next_node is None
+    assert flow.get_predecessors(second.uid) == []
+    assert flow.get_predecessors(start.uid) == []
+
+    flow.connect(start, "next_node", second.uid)
+
+    assert flow.get_predecessors(second.uid) == [start]
+
+
+def test_compiled_flow(tmp_path, monkeypatch):
+    """Test compiling a Flow and re-using the cached code object"""
+    from automagica import flow as flow_module
+    from automagica.flow import Flow
+    from automagica.runner import FlowRunner
+
+    cache_path = tmp_path / "cache"
+    monkeypatch.setattr(flow_module, "FLOW_CACHE_PATH", str(cache_path))
+
+    flow = Flow()
+    node = flow.add_node("PythonCode")
+    node.code = "result = [i * 2 for i in range(3)]"
+
+    file_path = tmp_path / "flow.json"
+    flow.save(str(file_path))
+
+    code = Flow(str(file_path)).compile()
+
+    assert len(list(cache_path.glob("*.pyc"))) == 1
+    assert not (tmp_path / "flow.pyc").exists()
+    assert Flow(str(file_path)).compile() == code
+
+    # Any change to the Flow file compiles it again
+    node.code = "result = [i * 3 for i in range(3)]"
+    flow.save(str(file_path))
+
+    monkeypatch.setattr(flow_module, "FLOW_CACHE_SIZE", 1)
+
+    assert Flow(str(file_path)).compile() != code
+    assert len(list(cache_path.glob("*.pyc"))) == 1
+
+    # The same Flow in another job folder re-uses the cached code object
+    job_path = tmp_path / "job"
+    job_path.mkdir()
+    (job_path / "flow.json").write_bytes(file_path.read_bytes())
+
+    monkeypatch.setattr(
+        flow_module,
+        "compile",
+        lambda *args: pytest.fail("Not cached"),
+        raising=False,
+    )
+
+    runner = FlowRunner(Flow(str(job_path / "flow.json")), compiled=True)
+
+    try:
+        assert runner.run()
+        assert runner.bot.interpreter.locals["result"] == [0, 3, 6]
+    finally:
+        runner.bot.stop()
+
+
+def test_compiled_flow_import_error():
+    """Test handling a failing activity import in a compiled Flow"""
+    from automagica.flow import Flow
+    from automagica.runner import FlowRunner
+
+    flow = Flow(nodes=[])
+    flow.from_dict(
+        {
+            "name": "Import error",
+            "nodes": [
+                {"type": "StartNode", "uid": "strt", "next_node": "init"},
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "init",
+                    "code": "steps = ['init']",
+                    "next_node": "acti",
+                },
+                {
+                    "type": "ActivityNode",
+                    "uid": "acti",
+                    "activity": "automagica.missing.activity",
+                    "label": "Missing activity",
+                    "next_node": "done",
+                    "on_exception_node": "fail",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "done",
+                    "code": "steps.append('done')",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "fail",
+                    "code": "steps.append('fail')",
+                },
+            ],
+        }
+    )
+
+    runner = FlowRunner(flow, compiled=True)
+
+    try:
+        assert runner.run()
+        assert runner.bot.interpreter.locals["steps"] == ["init", "fail"]
+    finally:
+        runner.bot.stop()
+
+
+def test_bot_dispatch_overhead():
+    """Per-step overhead of the bot for a linear Flow of 10k nodes"""
+    from threading import Event
+
+    from automagica.bots import ThreadedBot
+
+    n = 10000
+    commands = ["x += 1"] * n
+    bot = ThreadedBot()
+
+    try:
+        # One node at a time, the next node is sent when the previous is done
+        bot.interpreter.locals["x"] = 0
+        done = Event()
+
+        start = time.perf_counter()
+
+        for command in commands:
+            done.clear()
+            bot.run(command, on_done=done.set)
+            done.wait()
+
+        one_by_one = (time.perf_counter() - start) / n
+
+        assert bot.interpreter.locals["x"] == n
+
+        # All nodes in one round-trip
+        bot.interpreter.locals["x"] = 0
+        done.clear()
+
+        start = time.perf_counter()
+        bot.run_many(commands, on_done=done.set)
+        done.wait()
+
+        batched = (time.perf_counter() - start) / n
+
+        assert bot.interpreter.locals["x"] == n
+
+        assert one_by_one < 0.005
+        assert batched < one_by_one
+
+        # Batches stop at the first failing command
+        failed = []
+        done.clear()
+        bot.run_many(
+            ["x = 0", "1 / 0", "x = 1"],
+            on_done=done.set,
+            on_fail=lambda i: (failed.append(i), done.set()),
+        )
+        done.wait()
+
+        assert failed == [1]
+        assert bot.interpreter.locals["x"] == 0
+
+    finally:
+        bot.stop()
+
+    bot.thread.join(1)
+
+    assert not bot.thread.is_alive()
+
+
+def test_process_bot():
+    """Commands run in a child process that can be stopped when it hangs"""
+    import logging
+    from threading import Event, Thread
+
+    from automagica.bots import ProcessBot, RemoteObject
+
+    records = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            records.append(record.getMessage())
+
+    handler = Handler()
+    logger = logging.getLogger("automagica.bot")
+    logger.addHandler(handler)
+
+    bot = ProcessBot(timeout=2)
+
+    try:
+        assert bot._run_command("import os\nx = [1, 2]\nprint(os.getpid())")
+        assert str(os.getpid()) not in records
+        assert any(record.isdigit() for record in records)
+
+        locals_ = bot.interpreter.locals
+
+        assert locals_["x"] == [1, 2]
+        assert "x" in locals_
+        assert "os" not in dict(locals_.items())
+
+        locals_["y"] = 3
+        assert bot._run_command("z = x + [y]")
+        assert locals_.pop("z") == [1, 2, 3]
+        assert locals_.get("z") is None
+
+        assert bot._run_command("f = open(os.devnull)")
+        assert isinstance(locals_["f"], RemoteObject)
+
+        assert not bot._run_command("1 / 0")
+        assert any("ZeroDivisionError" in record for record in records)
+
+        # A hung step is stopped and the bot keeps working
+        old_channel = bot.channel
+        start = time.perf_counter()
+        assert not bot._run_command("import time\ntime.sleep(60)")
+        assert time.perf_counter() - start < 10
+        assert locals_.get("x") is None
+
+        # The reader of the stopped process does not fail new requests
+        results = []
+        thread = Thread(
+            target=lambda: results.append(
+                bot._run_command("import time\ntime.sleep(0.5)")
+            )
+        )
+        thread.start()
+        time.sleep(0.1)
+        bot._read(*old_channel)
+        thread.join()
+        assert results == [True]
+
+        done = Event()
+        bot.run("x = 1", on_done=done.set)
+        assert done.wait(10)
+        assert locals_["x"] == 1
+
+        bot.reset()
+        assert "x" not in locals_
+
+    finally:
+        bot.stop()
+        logger.removeHandler(handler)
+
+    assert not bot.process.is_alive()
+
+
+def test_bot_output_streaming():
+    """Output is streamed per bot thread while commands run"""
+    import logging
+    from threading import Event, Thread
+
+    from automagica.bots import ThreadedBot
+
+    first, second = ThreadedBot(), ThreadedBot()
+    records = []
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            if not record.getMessage().startswith(">>>"):
+                records.append(
+                    (record.thread, record.getMessage(), time.time())
+                )
+
+    handler = Handler()
+    logging.getLogger("automagica.bot").addHandler(handler)
+
+    try:
+        done = Event()
+        code = (
+            "import time\n"
+            "for i in range(5):\n"
+            "    print('{}', i)\n"
+            "    time.sleep(0.05)"
+        )
+
+        first.run(code.format("first"), on_done=done.set)
+        second.run(code.format("second"), on_done=second.stop)
+
+        # Threads that are not running a command keep printing to stdout
+        thread = Thread(target=print, args=("unrouted",))
+        thread.start()
+        thread.join()
+
+        assert done.wait(10)
+        finished = time.time()
+
+        second.thread.join(10)
+
+    finally:
+        first.stop()
+        logging.getLogger("automagica.bot").removeHandler(handler)
+
+    for bot, name in [(first, "first"), (second, "second")]:
+        assert [
+            message
+            for thread, message, _ in records
+            if thread == bot.thread.ident
+        ] == ["{} {}".format(name, i) for i in range(5)]
+
+    assert len(records) == 10
+
+    # The first lines were logged before the command finished
+    assert min(t for _, _, t in records) < finished - 0.1
+
+
+def test_bot_output_log_handler():
+    """Output of log handlers writing to the routed streams is not routed"""
+    import logging
+    import sys
+    from threading import Event
+
+    from automagica.bots import ThreadedBot
+
+    bot = ThreadedBot()
+    records = []
+    done = Event()
+
+    class Handler(logging.Handler):
+        def emit(self, record):
+            if not record.getMessage().startswith(">>>"):
+                records.append((record.levelname, record.getMessage()))
+
+    handler = Handler()
+    stream_handler = None
+    logger = logging.getLogger("automagica.bot")
+    logger.addHandler(handler)
+
+    try:
+        # Installs the multiplexed sys.stdout and sys.stderr
+        bot.run("pass", on_done=done.set)
+        assert done.wait(10)
+
+        # Like logging.basicConfig() in a command
+        stream_handler = logging.StreamHandler(sys.stderr)
+        logger.addHandler(stream_handler)
+
+        done.clear()
+        bot.run("print('hello')", on_done=done.set)
+        assert done.wait(10)
+
+    finally:
+        bot.stop()
+        logger.removeHandler(handler)
+        logger.removeHandler(stream_handler)
+
+    assert records == [("INFO", "hello")]
+
+
+def test_flow_profiler(tmp_path):
+    """Test profiling the nodes and activities of a Flow"""
+    import json
+    import tracemalloc
+
+    from automagica.flow import Flow
+    from automagica.profiler import Profiler
+    from automagica.runner import FlowRunner
+    from automagica.utilities import activity
+
+    @activity
+    def allocate(size):
+        """Allocate
+
+        Allocate a list
+        """
+        return [0] * size
+
+    flow = Flow(nodes=[])
+    flow.from_dict(
+        {
+            "name": "Profiled",
+            "nodes": [
+                {"type": "StartNode", "uid": "strt", "next_node": "loop"},
+                {
+                    "type": "LoopNode",
+                    "uid": "loop",
+                    "iterable": "range(3)",
+                    "loop_node": "body",
+                    "next_node": "fail",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "body",
+                    "label": "Allocate",
+                    "code": "data = allocate(1000000)",
+                },
+                {
+                    "type": "PythonCodeNode",
+                    "uid": "fail",
+                    "label": "Fail",
+                    "code": "1 / 0",
+                    "on_exception_node": "last",
+                },
+                {"type": "PythonCodeNode", "uid": "last", "code": "pass"},
+            ],
+        }
+    )
+
+    profiler = Profiler()
+    runner = FlowRunner(flow, compiled=True, profiler=profiler)
+    runner.bot.interpreter.locals["allocate"] = allocate
+
+    profiler.start()
+
+    try:
+        assert runner.run()
+    finally:
+        profiler.stop()
+        runner.bot.stop()
+
+    totals = {
+        (total["category"], total["name"]): total
+        for total in profiler.summary()
+    }
+
+    assert totals["node", "Allocate"]["calls"] == 3
+    assert totals["activity", "Allocate"]["calls"] == 3
+
+    if hasattr(tracemalloc, "reset_peak"):
+        assert totals["activity", "Allocate"]["memory"] >= 8000000
+        assert totals["node", "Allocate"]["memory"] >= 8000000
+    else:
+        assert totals["node", "Allocate"]["memory"] is None
+    assert totals["node", "Fail"]["errors"] == 1
+    assert totals["node", "Allocate"]["errors"] == 0
+
+    # Activities are recorded within their node
+    nodes = [r for r in profiler.records if r["name"] == "Allocate"]
+
+    for record in nodes:
+        if record["category"] == "activity":
+            assert any(
+                node["category"] == "node"
+                and node["start"] <= record["start"]
+                and record["start"] + record["wall"]
+                <= node["start"] + node["wall"]
+                for node in nodes
+            )
+
+    assert "Allocate" in profiler.format_summary()
+
+    profiler.save(str(tmp_path / "trace.json"))
+
+    with open(str(tmp_path / "trace.json")) as f:
+        events = json.load(f)["traceEvents"]
+
+    assert len(events) == len(profiler.records)
+    assert all(event["ph"] == "X" for event in events)
+    assert any(event["args"]["error"] for event in events)
+
+
+def test_headless_flow_exit(tmp_path):
+    """Headless runs exit normally, so atexit handlers still run"""
+    import subprocess  # nosec
+    import sys
+
+    from automagica.flow import Flow
+
+    marker = tmp_path / "atexit.txt"
+
+    flow = Flow()
+    node = flow.add_node("PythonCode")
+    node.code = "import atexit\natexit.register(open({!r}, 'w').close)".format(
+        str(marker)
+    )
+    flow.save(str(tmp_path / "flow.json"))
+
+    process = subprocess.run(  # nosec
+        [
+            sys.executable,
+            "-c",
+            "from automagica.cli import cli; cli()",
+            "flow",
+            "run",
+            str(tmp_path / "flow.json"),
+            "--headless",
+        ],
+        cwd=str(tmp_path),
+        env=dict(
+            os.environ,
+            AUTOMAGICA_NO_TELEMETRY="1",
+            PYTHONPATH=os.path.dirname(os.path.dirname(__file__)),
+        ),
+        timeout=60,
+    )
+
+    assert process.returncode == 0
+    assert marker.exists()
+
+
+def test_profiler_without_reset_peak(monkeypatch):
+    """Peak memory is left out where tracemalloc can not reset the peak"""
+    import tracemalloc
+
+    from automagica.profiler import Profiler
+
+    monkeypatch.delattr(tracemalloc, "reset_peak", raising=False)
+
+    profiler = Profiler()
+    profiler.start()
+
+    try:
+        with profiler.span("Allocate", "activity"):
+            _ = [0] * 1000000
+    finally:
+        profiler.stop()
+
+    assert profiler.records[0]["memory"] is None
+    assert "memory_peak_delta_kb" not in (
+        profiler.to_chrome_trace()["traceEvents"][0]["args"]
+    )
+    assert " - " in profiler.format_summary()
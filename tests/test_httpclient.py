@@ -0,0 +1,200 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+import gzip
+import hashlib
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+import pytest
+
+from automagica.httpclient import AsyncHTTPClient, HTTPClient
+
+# 1 MB that does not compress well, so it is streamed in several chunks
+CONTENT = b"".join(
+    hashlib.sha256(str(i).encode()).digest() for i in range(32768)
+)
+
+
+@pytest.fixture
+def server():
+    """Local test server with flaky, gzip, slow and echo endpoints"""
+    state = {"flaky": 2, "requests": 0, "active": 0, "max_active": 0}
+    lock = Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            with lock:
+                state["requests"] += 1
+                state["active"] += 1
+                state["max_active"] = max(state["max_active"], state["active"])
+
+            try:
+                if self.path == "/flaky" and state["flaky"]:
+                    state["flaky"] -= 1
+                    return self.respond(503, b"Unavailable")
+
+                if self.path == "/slow":
+                    time.sleep(0.1)
+
+                body = CONTENT
+                headers = {}
+
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = gzip.compress(body)
+                    headers["Content-Encoding"] = "gzip"
+
+                self.respond(200, body, headers)
+
+            finally:
+                with lock:
+                    state["active"] -= 1
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+
+            self.respond(200, body)
+
+        def respond(self, status, body, headers=None):
+            self.send_response(status)
+
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    yield "http://127.0.0.1:{}".format(server.server_port), state
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_retry(server):
+    """Idempotent requests are retried on unavailable servers"""
+    url, state = server
+
+    client = HTTPClient(retries=3, backoff_factor=0)
+    r = client.get(url + "/flaky")
+
+    assert r.status_code == 200
+    assert state["requests"] == 3
+
+    state["flaky"] = 2
+    r = HTTPClient(retries=0).get(url + "/flaky")
+
+    assert r.status_code == 503
+
+
+def test_streaming_gzip(server):
+    """Responses are decompressed and can be streamed in chunks"""
+    url, _ = server
+
+    client = HTTPClient()
+    r = client.get(url + "/", stream=True)
+
+    chunks = list(r.iter_content(64 * 1024))
+
+    assert len(chunks) > 1
+    assert b"".join(chunks) == CONTENT
+
+    data = {"text": "Automagica " * 1000}
+    r = client.post(url + "/", json=data, compress=True)
+
+    assert json.loads(r.content) == data
+
+
+def test_host_limits(server):
+    """Connections to a host can be capped"""
+    url, state = server
+
+    client = HTTPClient(host_limits={"127.0.0.1": 1})
+
+    threads = [
+        Thread(target=client.get, args=(url + "/slow",)) for _ in range(4)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert state["max_active"] == 1
+
+
+def test_async_client(server):
+    """The asyncio client exposes the same API"""
+    import asyncio
+
+    url, state = server
+
+    async def main():
+        client = AsyncHTTPClient()
+
+        responses = await asyncio.gather(
+            *(client.get(url + "/slow") for _ in range(3))
+        )
+
+        chunks = []
+
+        async for chunk in (
+            await client.get(url + "/", stream=True)
+        ).iter_content():
+            chunks.append(chunk)
+
+        data = {"text": "Automagica"}
+        r = await client.post(url + "/", json=data)
+
+        assert await r.json() == data
+        assert await r.text() == json.dumps(data)
+        assert await r.content() == json.dumps(data).encode()
+
+        return responses, b"".join(chunks)
+
+    responses, content = asyncio.run(main())
+
+    assert [r.status_code for r in responses] == [200] * 3
+    assert content == CONTENT
+    assert state["max_active"] > 1
+
+
+def test_multipart_rewind(tmp_path):
+    """Multipart bodies can be rewound by urllib3 to send them again"""
+    from urllib3.util.request import rewind_body, set_file_position
+
+    from automagica.httpclient import MultipartBody
+
+    file_path = tmp_path / "file.bin"
+    file_path.write_bytes(CONTENT)
+
+    with open(str(file_path), "rb") as f:
+        body = MultipartBody([("key", "value"), ("file", ("file.bin", f))])
+
+        position = set_file_position(body, None)
+        first = body.read(100) + body.read(300000) + body.read()
+
+        assert len(first) == body.length
+        assert first.index(CONTENT) > first.index(b'name="key"')
+        assert body.read() == b""
+
+        rewind_body(body, position)
+
+        assert body.read() == first
+
+        body.seek(-10, 2)
+
+        assert body.tell() == body.length - 10
+        assert body.read() == first[-10:]
@@ -0,0 +1,156 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+from threading import Thread
+from urllib.request import urlopen
+
+import pytest
+
+from automagica.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    WorkerMetrics,
+    start_metrics_server,
+)
+
+
+def test_metrics_exposition():
+    """Test the Prometheus text format of counters, gauges and histograms"""
+    registry = Registry()
+
+    jobs = Counter("jobs_total", "Jobs.", registry=registry)
+    running = Gauge("running", "Running.", registry=registry)
+    duration = Histogram(
+        "duration_seconds",
+        "Duration.",
+        labels=("activity",),
+        buckets=(0.1, 1),
+        registry=registry,
+    )
+    stats = Gauge("stats", "Stats.", labels=("host",), registry=registry)
+
+    jobs.inc()
+    jobs.inc(2)
+    running.inc()
+    running.dec()
+    duration.labels("click").observe(0.05)
+    duration.labels("click").observe(0.1)
+    duration.labels("click").observe(5)
+    stats.set_function(lambda: {("portal:443",): 3})
+
+    text = registry.expose()
+
+    assert "# TYPE jobs_total counter\njobs_total 3\n" in text
+    assert "running 0\n" in text
+    assert 'duration_seconds_bucket{activity="click",le="0.1"} 2\n' in text
+    assert 'duration_seconds_bucket{activity="click",le="1"} 2\n' in text
+    assert 'duration_seconds_bucket{activity="click",le="+Inf"} 3\n' in text
+    assert 'duration_seconds_sum{activity="click"} 5.15\n' in text
+    assert 'duration_seconds_count{activity="click"} 3\n' in text
+    assert 'stats{host="portal:443"} 3\n' in text
+
+    with pytest.raises(ValueError):
+        duration.labels()
+
+
+def test_metrics_threads():
+    """Test counting from many threads without locks"""
+    counter = Counter("calls_total", "Calls.", registry=False)
+
+    def count():
+        for _ in range(10000):
+            counter.inc()
+
+    threads = [Thread(target=count) for _ in range(8)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert counter.export() == {(): [80000]}
+
+
+def test_metrics_finished_threads():
+    """Test the values of finished threads are kept without their shards"""
+    histogram = Histogram(
+        "duration_seconds", "Duration.", buckets=(1,), registry=False
+    )
+
+    for _ in range(100):
+        thread = Thread(target=histogram.observe, args=(0.5,))
+        thread.start()
+        thread.join()
+
+    histogram.observe(2)
+
+    assert len(histogram._default.shards) == 1
+    assert histogram.export() == {(): [100, 1, 52.0]}
+
+
+def test_activity_metrics():
+    """Test the metrics collected by the activity decorator"""
+    from automagica.metrics import ACTIVITY_DURATION, ACTIVITY_ERRORS
+    from automagica.utilities import activity
+
+    @activity
+    def divide(a, b):
+        """Divide
+
+        Divide two numbers
+        """
+        return a / b
+
+    divide(1, 2)
+
+    with pytest.raises(ZeroDivisionError):
+        divide(1, 0)
+
+    key = ("{}.{}".format(divide.__module__, divide.__qualname__),)
+
+    assert key[0].endswith("test_activity_metrics.<locals>.divide")
+    assert ACTIVITY_DURATION.export()[key][-2] == 0  # +Inf bucket
+    assert sum(ACTIVITY_DURATION.export()[key][:-1]) == 2
+    assert ACTIVITY_ERRORS.export()[key] == [1]
+
+
+def test_worker_metrics():
+    """Test merging the metrics of a worker process into the bot's"""
+    worker = Histogram("worker", "Worker.", labels=("a",), registry=False)
+    bot = Histogram("bot", "Bot.", labels=("a",), registry=False)
+
+    metrics = WorkerMetrics((worker,))
+
+    worker.labels("x").observe(1)
+    WorkerMetrics((bot,)).merge(metrics.take())
+
+    worker.labels("x").observe(2)
+    worker.labels("y").observe(3)
+    increase = metrics.take()
+
+    assert set(increase[0]) == {("x",), ("y",)}
+
+    WorkerMetrics((bot,)).merge(increase)
+
+    assert bot.export() == worker.export()
+    assert metrics.take() == [{}]
+
+
+def test_metrics_server():
+    """Test serving the metrics over HTTP"""
+    registry = Registry()
+    Counter("served_total", "Served.", registry=registry).inc()
+
+    server = start_metrics_server(0, registry=registry)
+
+    try:
+        with urlopen(  # nosec
+            "http://127.0.0.1:{}/metrics".format(server.server_port)
+        ) as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert b"served_total 1\n" in response.read()
+
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,175 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import os
+import stat
+import sys
+
+import pytest
+
+TSV = "\n".join(
+    "\t".join(str(field) for field in row)
+    for row in [
+        "level page_num block_num par_num line_num word_num "
+        "left top width height conf text".split(),
+        [1, 1, 0, 0, 0, 0, 0, 0, 400, 200, -1, ""],
+        [4, 1, 1, 1, 1, 0, 20, 10, 150, 20, -1, ""],
+        [5, 1, 1, 1, 1, 1, 20, 10, 50, 20, 96, "OCR"],
+        [5, 1, 1, 1, 1, 2, 80, 12, 90, 18, 95, "Example"],
+        [5, 1, 1, 1, 2, 1, 20, 50, 40, 20, 91, "Submit"],
+        [5, 1, 1, 1, 2, 2, 70, 50, 10, 20, 30, " "],
+    ]
+)
+
+
+@pytest.fixture
+def tesseract(tmp_path):
+    """Stand-in tesseract command printing TSV output"""
+    script = tmp_path / "tesseract.py"
+    script.write_text(
+        "import sys\n"
+        "sys.stdin.buffer.read()\n"
+        "with open({!r}, 'a') as f:\n"
+        "    f.write(' '.join(sys.argv[1:]) + '\\n')\n"
+        "print({!r})\n".format(str(tmp_path / "calls"), TSV)
+    )
+
+    if os.name == "nt":
+        command = tmp_path / "tesseract.bat"
+        command.write_text('@"{}" "{}" %*'.format(sys.executable, script))
+
+    else:
+        command = tmp_path / "tesseract"
+        command.write_text(
+            '#!/bin/sh\nexec "{}" "{}" "$@"\n'.format(sys.executable, script)
+        )
+        command.chmod(command.stat().st_mode | stat.S_IEXEC)
+
+    return str(command), tmp_path / "calls"
+
+
+def test_tesseract_backend(tesseract):
+    """Words and lines are recognized locally"""
+    from PIL import Image
+
+    from automagica.ocr import TesseractBackend
+
+    command, calls = tesseract
+    backend = TesseractBackend(command=command, language="eng")
+
+    result = backend.recognize(Image.new("RGB", (400, 200), "white"))
+
+    assert result["text"] == "OCR Example\nSubmit"
+    assert result["locations"] == [
+        {"text": "OCR", "x": 20, "y": 10, "w": 50, "h": 20},
+        {"text": "OCR Example", "x": 20, "y": 10, "w": 150, "h": 20},
+        {"text": "Example", "x": 80, "y": 12, "w": 90, "h": 18},
+        {"text": "Submit", "x": 20, "y": 50, "w": 40, "h": 20},
+    ]
+    assert calls.read_text() == "stdin stdout -l eng tsv\n"
+
+
+def test_recognition_cache(tesseract):
+    """Unchanged images are only recognized once, regions are offset"""
+    from PIL import Image, ImageDraw
+
+    from automagica import ocr
+
+    command, calls = tesseract
+    backend = ocr.TesseractBackend(command=command)
+    ocr.recognition_cache.clear()
+
+    screen = Image.new("RGB", (800, 600), "white")
+
+    for _ in range(3):
+        result = ocr.recognize(screen, backend=backend)
+
+    assert len(calls.read_text().splitlines()) == 1
+
+    result = ocr.recognize(
+        screen, region=(100, 200, 500, 400), backend=backend
+    )
+
+    assert len(calls.read_text().splitlines()) == 2
+    assert result["locations"][0] == {
+        "text": "OCR",
+        "x": 120,
+        "y": 210,
+        "w": 50,
+        "h": 20,
+    }
+
+    ImageDraw.Draw(screen).point((10, 10), fill="black")
+    ocr.recognize(screen, backend=backend)
+
+    assert len(calls.read_text().splitlines()) == 3
+
+
+def test_recognize_region():
+    """Only the region, clipped to the image, is recognized"""
+    from PIL import Image
+
+    from automagica import ocr
+
+    class Recording(ocr.OCRBackend):
+        sizes = []
+
+        def recognize(self, image):
+            self.sizes.append(image.size)
+            return ocr.TesseractBackend.parse(TSV)
+
+    backend = Recording()
+    ocr.recognition_cache.clear()
+
+    screen = Image.new("RGB", (800, 600), "white")
+    result = ocr.recognize(
+        screen, region=(700, -50, 900, 100), backend=backend
+    )
+
+    assert backend.sizes == [(100, 100)]
+    assert result["locations"][0]["x"] == 720
+    assert result["locations"][0]["y"] == 10
+
+    with pytest.raises(ValueError):
+        ocr.recognize(screen, region=(800, 0, 900, 100), backend=backend)
+
+
+def test_ocr_session():
+    """Words on an unchanged screen are looked up without new recognitions"""
+    from PIL import Image, ImageDraw
+
+    from automagica import ocr
+
+    class Counting(ocr.OCRBackend):
+        calls = 0
+
+        def recognize(self, image):
+            self.calls += 1
+            return ocr.TesseractBackend.parse(TSV)
+
+    backend = Counting()
+    ocr.recognition_cache.clear()
+
+    screen = {"frame": Image.new("RGB", (800, 600), "white")}
+    session = ocr.OCRSession(grab=lambda: screen["frame"], backend=backend)
+
+    assert session.find("ocr example")[0]["w"] == 150
+    assert session.find("SUBMIT")[0]["x"] == 20
+    assert session.find("Submt") == []
+    assert session.find("Submt", similarity=0.8)[0]["text"] == "Submit"
+    assert backend.calls == 1
+
+    # A small change elsewhere keeps the session
+    frame = screen["frame"].copy()
+    ImageDraw.Draw(frame).rectangle((600, 400, 620, 420), fill="black")
+    screen["frame"] = frame
+
+    assert session.find("Example")
+    assert backend.calls == 1
+
+    # A change where the text was recognizes the screen again
+    frame = frame.copy()
+    ImageDraw.Draw(frame).rectangle((20, 50, 60, 70), fill="black")
+    screen["frame"] = frame
+
+    assert session.find("Submit")
+    assert backend.calls == 2
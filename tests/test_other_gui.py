@@ -36,3 +36,29 @@ def test_keybind_window():
     window.destroy()
 
     assert True
+
+
+def test_autocomplete_dropdown():
+    """Test completing and editing an autocomplete dropdown"""
+    from types import SimpleNamespace
+
+    from automagica.gui.inputs import AutocompleteDropdown
+
+    pytest.automagica_tk.update()
+
+    dropdown = AutocompleteDropdown(
+        pytest.automagica_tk, values=["Banana", "apple", "Apricot"]
+    )
+
+    dropdown.insert(0, "ap")
+    dropdown.on_key_release(SimpleNamespace(keysym="p"))
+
+    assert dropdown.get() == "apple"
+
+    # Editing keys use the index method of the Combobox
+    for keysym in ("Right", "Left", "BackSpace"):
+        dropdown.on_key_release(SimpleNamespace(keysym=keysym))
+
+    assert dropdown.get().startswith("ap")
+
+    dropdown.destroy()
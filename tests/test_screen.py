@@ -0,0 +1,142 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+from threading import Thread
+
+import pytest
+
+
+class FakeScreenShot:
+    """Stands in for mss screenshots of a screen with a horizontal gradient"""
+
+    def __init__(self, monitor):
+        self.width, self.height = monitor["width"], monitor["height"]
+        self.size = (self.width, self.height)
+        self.raw = bytearray(
+            value
+            for _ in range(self.height)
+            for x in range(monitor["left"], monitor["left"] + self.width)
+            for value in (x % 256, 0, 255, 255)  # BGRA
+        )
+        self.bgra = bytes(self.raw)
+
+
+@pytest.fixture
+def fake_mss(monkeypatch):
+    """Screens of 320x200 pixels, counting the opened mss handles"""
+    import threading
+
+    import mss
+
+    from automagica import screen
+
+    handles = []
+
+    class FakeMSS:
+        size = {"width": 320, "height": 200}
+
+        def __init__(self):
+            self.closed = False
+            self.monitors = [dict(self.size, left=0, top=0)] * 2
+            handles.append(self)
+
+        def grab(self, monitor):
+            if monitor["left"] + monitor["width"] > self.size["width"]:
+                raise Exception("Outside of the screen")
+
+            return FakeScreenShot(monitor)
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(mss, "mss", FakeMSS)
+    monkeypatch.setattr(screen, "_local", threading.local())
+
+    return handles
+
+
+def test_grabber(fake_mss):
+    """Grabs reuse the thread's mss handle and can be limited to a region"""
+    from automagica.screen import get_grabber
+
+    grabber = get_grabber()
+
+    assert grabber.size == (320, 200)
+
+    frame = grabber.grab()
+
+    assert frame.shape == (200, 320, 3)
+    assert list(frame[0, 10]) == [255, 0, 10]  # RGB
+
+    frame = grabber.grab((100, 50, 140, 60))
+
+    assert frame.shape == (10, 40, 3)
+    assert frame[0, 0, 2] == 100
+
+    image = grabber.grab_image((100, 50, 140, 60))
+
+    assert image.size == (40, 10)
+    assert image.getpixel((0, 0)) == (255, 0, 100)
+
+    assert get_grabber() is grabber
+    assert len(fake_mss) == 1
+
+    # Other threads have their own grabber
+    grabbers = []
+    thread = Thread(target=lambda: grabbers.append(get_grabber()))
+    thread.start()
+    thread.join()
+
+    assert grabbers[0] is not grabber
+    assert len(fake_mss) == 2
+
+
+def test_grabber_region(fake_mss):
+    """Regions are clipped to the screen"""
+    from automagica.screen import get_grabber
+
+    grabber = get_grabber()
+
+    assert grabber.grab((300, 190, 400, 300)).shape == (10, 20, 3)
+    assert grabber.grab((-10, -10, 5, 5)).shape == (5, 5, 3)
+
+    with pytest.raises(ValueError):
+        grabber.grab((400, 0, 500, 10))
+
+
+def test_grabber_geometry(fake_mss):
+    """The screen geometry is read again after it changed"""
+    from automagica.screen import ScreenGrabber
+
+    grabber = ScreenGrabber()
+    type(fake_mss[0]).size = {"width": 160, "height": 100}
+
+    # The failing grab opens a new handle with the new geometry
+    assert grabber.grab().shape == (100, 160, 3)
+    assert grabber.size == (160, 100)
+    assert len(fake_mss) == 2
+    assert fake_mss[0].closed
+
+    # Without errors the geometry is read again after max_age seconds
+    grabber = ScreenGrabber(max_age=0)
+    type(fake_mss[0]).size = {"width": 320, "height": 200}
+
+    assert grabber.size == (320, 200)
+
+
+def test_grabber_close(fake_mss):
+    """The mss handle of a thread is closed when the thread ends"""
+    import gc
+
+    from automagica.screen import ScreenGrabber, get_grabber
+
+    thread = Thread(target=lambda: get_grabber().grab())
+    thread.start()
+    thread.join()
+    gc.collect()
+
+    assert len(fake_mss) == 1
+    assert fake_mss[0].closed
+
+    with ScreenGrabber() as grabber:
+        grabber.grab()
+
+    assert fake_mss[1].closed
@@ -0,0 +1,234 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import pytest
+
+CONTENT = bytes(range(256)) * 8192  # 2 MB
+
+
+@pytest.fixture
+def file_server():
+    """Local stand-in for the file storage, serves CONTENT and records
+    uploads"""
+    requests = {"GET": 0, "POST": []}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests["GET"] += 1
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(CONTENT)))
+            self.end_headers()
+            self.wfile.write(CONTENT)
+
+        def do_POST(self):
+            length = int(self.headers["Content-Length"])
+            requests["POST"].append(
+                (self.headers["Content-Type"], self.rfile.read(length))
+            )
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    yield "http://127.0.0.1:{}/".format(server.server_port), requests
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_file_cache(file_server, tmp_path):
+    """Downloads are verified and served from the cache afterwards"""
+    from automagica.transfers import FileCache, download_file, transfer_all
+
+    url, requests = file_server
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    cache = FileCache(str(tmp_path / "cache"))
+
+    transfer_all(
+        download_file,
+        [
+            (url + str(i), str(tmp_path / "{}.bin".format(i)), sha256, cache)
+            for i in range(3)
+        ],
+    )
+
+    for i in range(3):
+        assert (tmp_path / "{}.bin".format(i)).read_bytes() == CONTENT
+
+    assert (tmp_path / "cache" / sha256).read_bytes() == CONTENT
+
+    n_downloads = requests["GET"]
+
+    download_file(url, str(tmp_path / "cached.bin"), sha256, cache)
+
+    assert requests["GET"] == n_downloads
+    assert (tmp_path / "cached.bin").read_bytes() == CONTENT
+
+
+def test_download_file_checksum(file_server, tmp_path):
+    """Corrupt downloads are rejected and removed"""
+    from automagica.transfers import FileCache, download_file
+
+    url, _ = file_server
+    cache = FileCache(str(tmp_path / "cache"))
+
+    with pytest.raises(ValueError):
+        download_file(url, str(tmp_path / "file.bin"), "0" * 64, cache)
+
+    assert not (tmp_path / "file.bin").exists()
+    assert not (tmp_path / "cache").exists()
+
+
+def test_upload_file(file_server, tmp_path):
+    """Uploads stream the form fields followed by the file"""
+    from automagica.transfers import upload_file
+
+    url, requests = file_server
+
+    file_path = tmp_path / "output.bin"
+    file_path.write_bytes(CONTENT)
+
+    upload_file(url, str(file_path), {"key": "output.bin"}, "output.bin")
+
+    content_type, body = requests["POST"][0]
+    boundary = content_type.split("boundary=")[1].encode()
+
+    assert body.startswith(b"--" + boundary)
+    assert body.endswith(b"--" + boundary + b"--\r\n")
+    assert body.index(b'name="key"') < body.index(b'name="file"')
+    assert CONTENT + b"\r\n--" + boundary + b"--" in body
+
+    # The filename defaults to the name of the file, without its folder
+    upload_file(url, str(file_path))
+
+    content_type, body = requests["POST"][1]
+
+    assert b'filename="output.bin"' in body
+    assert str(tmp_path).encode() not in body
+
+
+@pytest.fixture
+def range_server():
+    """Local stand-in for a file server with byte range support. Requests
+    are recorded, the first GET can be cut off to simulate a broken
+    connection."""
+    state = {"requests": [], "cut_off": None}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(CONTENT)))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", '"automagica"')
+            self.end_headers()
+
+        def do_GET(self):
+            byte_range = self.headers.get("Range")
+            state["requests"].append(byte_range)
+
+            start, end = 0, len(CONTENT) - 1
+
+            if byte_range:
+                first, last = byte_range.split("=")[1].split("-")
+                start, end = int(first), int(last or end)
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range",
+                    "bytes {}-{}/{}".format(start, end, len(CONTENT)),
+                )
+
+            else:
+                self.send_response(200)
+
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+
+            body = CONTENT[start : end + 1]
+
+            if state["cut_off"]:
+                body, state["cut_off"] = body[: state["cut_off"]], None
+                self.wfile.write(body)
+                self.close_connection = True
+                return
+
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    yield "http://127.0.0.1:{}/".format(server.server_port), state
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_url_segments(range_server, tmp_path):
+    """Large files are fetched in parallel byte ranges"""
+    from automagica.transfers import download_url
+
+    url, state = range_server
+    file_path = str(tmp_path / "file.bin")
+
+    download_url(url, file_path, segments=4, min_segment_size=256 * 1024)
+
+    with open(file_path, "rb") as f:
+        assert f.read() == CONTENT
+
+    assert sorted(state["requests"]) == [
+        "bytes=0-524287",
+        "bytes=1048576-1572863",
+        "bytes=1572864-2097151",
+        "bytes=524288-1048575",
+    ]
+    assert not (tmp_path / "file.bin.part").exists()
+
+
+def test_download_url_resume(range_server, tmp_path):
+    """Interrupted downloads continue where they stopped"""
+    from automagica.transfers import download_url
+
+    url, state = range_server
+    file_path = str(tmp_path / "file.bin")
+
+    state["cut_off"] = 1024 * 1024
+
+    with pytest.raises(Exception):
+        download_url(url, file_path)
+
+    assert (tmp_path / "file.bin.part").exists()
+
+    download_url(url, file_path)
+
+    with open(file_path, "rb") as f:
+        assert f.read() == CONTENT
+
+    assert state["requests"][0] is None
+    assert state["requests"][1] == "bytes=1048576-2097151"
+
+
+def test_download_files_from_urls(range_server, tmp_path):
+    """Activity downloading several URLs at once"""
+    from automagica.activities import download_files_from_urls
+
+    url, state = range_server
+    urls = [url + "{}.bin".format(i) for i in range(3)]
+
+    paths = download_files_from_urls(urls, output_folder=str(tmp_path))
+
+    assert paths == [str(tmp_path / "{}.bin".format(i)) for i in range(3)]
+
+    for path in paths:
+        with open(path, "rb") as f:
+            assert f.read() == CONTENT
@@ -0,0 +1,363 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import json
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+import pytest
+
+
+@pytest.fixture
+def stub_server():
+    """Local stand-in for the telemetry endpoint, records POST bodies"""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            requests.append((self.path, json.loads(self.rfile.read(length))))
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(("127.0.0.1", 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    yield "http://127.0.0.1:{}/".format(server.server_port), requests
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_telemetry_overhead(stub_server, monkeypatch):
+    """Activity calls are counted in memory and sent in one batch"""
+    from automagica import utilities
+
+    url, requests = stub_server
+
+    monkeypatch.delenv("AUTOMAGICA_NO_TELEMETRY", raising=False)
+    monkeypatch.delenv("AUTOMAGICA_URL", raising=False)
+    monkeypatch.setattr(
+        utilities, "TELEMETRY", utilities.TelemetryQueue(url, interval=60)
+    )
+
+    def benchmark_activity():
+        """Benchmark activity"""
+        return None
+
+    def failing_activity():
+        """Failing activity"""
+        raise ValueError
+
+    wrapped = utilities.activity(benchmark_activity)
+    failing = utilities.activity(failing_activity)
+
+    try:
+        n = 1000
+        start = time.perf_counter()
+
+        for _ in range(n):
+            wrapped()
+
+        per_call = (time.perf_counter() - start) / n
+
+        with pytest.raises(ValueError):
+            failing()
+
+    finally:
+        utilities.AUTOMAGICA_ACTIVITIES.remove(benchmark_activity)
+        utilities.AUTOMAGICA_ACTIVITIES.remove(failing_activity)
+
+    # No network round-trip per call
+    assert per_call < 0.001
+    assert requests == []
+
+    utilities.TELEMETRY.stop()
+
+    counts = {
+        (path, data["activity"], data.get("error")): data["count"]
+        for path, data in requests
+    }
+
+    assert counts[("/", "Benchmark activity", None)] == n
+    assert counts[("/", "Failing activity", None)] == 1
+    assert counts[("/errors", "Failing activity", "ValueError")] == 1
+
+
+def test_telemetry_overflow():
+    """Pending telemetry is bounded, new activities are dropped"""
+    from automagica.utilities import TelemetryQueue
+
+    queue = TelemetryQueue("http://127.0.0.1:9/", max_size=2)
+
+    for name in ("a", "b", "c", "a"):
+        queue.add(name)
+
+    assert queue.counts == {("a", None): 2, ("b", None): 1}
+    assert queue.dropped == 1
+
+    # Nothing to send at exit
+    queue.counts.clear()
+
+
+def test_telemetry_unreachable(monkeypatch):
+    """Counts that could not be sent are kept for the next flush"""
+    from automagica import httpclient
+    from automagica.utilities import TelemetryQueue
+
+    posts = []
+
+    def post(url, **kwargs):
+        posts.append(kwargs["retries"].total)
+        raise OSError("Unreachable")
+
+    monkeypatch.setattr(httpclient.http_client, "post", post)
+
+    queue = TelemetryQueue("http://127.0.0.1:9/")
+
+    for name in ("a", "b", "a"):
+        queue.add(name)
+
+    queue.flush()
+
+    # One attempt without retries, nothing is lost
+    assert posts == [0]
+    assert queue.counts == {("a", None): 2, ("b", None): 1}
+
+    queue.add("a")
+    queue.flush()
+
+    assert queue.counts == {("a", None): 3, ("b", None): 1}
+
+    # Nothing to send at exit
+    queue.counts.clear()
+
+
+def test_activities_index(tmp_path, monkeypatch):
+    """The activities index is cached on disk and rebuilt on changes"""
+    import importlib.util
+    import os
+
+    from automagica import utilities
+
+    index_path = str(tmp_path / "activities.pickle")
+
+    monkeypatch.setattr(utilities, "ACTIVITIES_INDEX_PATH", index_path)
+    monkeypatch.setattr(utilities, "_ACTIVITIES_INDEX", None)
+    monkeypatch.setattr(utilities, "_ACTIVITIES_SOURCES", {})
+
+    activities = utilities.all_activities()
+
+    assert os.path.isfile(index_path)
+    assert (
+        utilities._load_activities_index()["activities"]
+        == utilities.activities_index()
+    )
+
+    for key, activity in activities.items():
+        assert activity == dict(
+            utilities.parse_activity(activity["function"]),
+            function=activity["function"],
+        )
+
+    def load_activities(name):
+        """Import a module defining an activity"""
+        module_path = str(tmp_path / "{}_activities.py".format(name))
+
+        with open(module_path, "w") as f:
+            f.write(
+                "from automagica.utilities import activity\n\n\n"
+                "@activity\n"
+                "def {}():\n"
+                '    """Extra\n\n    Extra activity\n    """\n'.format(name)
+            )
+
+        spec = importlib.util.spec_from_file_location(
+            "{}_activities".format(name), module_path
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        return module_path, getattr(module, name).__wrapped__
+
+    # Activities registered later are added to the index
+    extra_path, extra = load_activities("extra")
+
+    try:
+        assert "extra_activities.extra" in utilities.activities_index()
+        assert (
+            "extra_activities.extra"
+            in utilities._load_activities_index()["activities"]
+        )
+
+    finally:
+        utilities.AUTOMAGICA_ACTIVITIES.remove(extra)
+
+    # Another process without the extra activities rebuilds the index for
+    # its own, the extra activities and their source are kept
+    monkeypatch.setattr(utilities, "_ACTIVITIES_INDEX", None)
+    other_path, other = load_activities("other")
+
+    try:
+        index = utilities.activities_index()
+
+        assert "extra_activities.extra" in index
+        assert "other_activities.other" in index
+
+        # Changing an activity module invalidates the index
+        stat = os.stat(extra_path)
+        os.utime(extra_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        assert utilities._load_activities_index() is None
+
+    finally:
+        utilities.AUTOMAGICA_ACTIVITIES.remove(other)
+
+
+def test_cli_import_time():
+    """Importing the CLI does not load the activities or heavy packages"""
+    import subprocess
+    import sys
+
+    # -X importtime lists every module imported on stderr as
+    # "import time: self [us] | cumulative | imported package"
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import automagica.cli"],
+        check=True,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    ).stderr.splitlines()
+
+    cumulative = {
+        line.rsplit("|", 1)[-1].strip(): int(line.split("|")[1])
+        for line in output
+        if line.startswith("import time:") and "[us]" not in line
+    }
+    packages = {module.split(".")[0] for module in cumulative}
+
+    assert "automagica.activities" not in cumulative
+
+    for package in ("tkinter", "PIL", "numpy", "selenium"):
+        assert package not in packages
+
+    # About 50 ms, a single heavy package (fe. selenium) exceeds the budget
+    assert cumulative["automagica.cli"] < 0.25 * 1000 ** 2
+
+
+def test_activities_all():
+    """A wildcard import gets a proxy for lazily imported activities"""
+    import subprocess
+    import sys
+
+    from automagica import activities
+
+    assert "Chrome" not in activities.__all__
+
+    code = (
+        "import sys\n"
+        "from automagica import *\n"
+        "assert 'selenium' not in sys.modules\n"
+        "assert 'print_console' in dir()\n"
+        "print(Chrome)\n"
+        "Chrome.get\n"
+        "assert 'selenium' in sys.modules\n"
+    )
+
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+
+    assert output == "<lazy activity Chrome>\n"
+
+
+def test_icon_recolor(tmp_path):
+    """Icons are recolored on first use and cached on disk"""
+    import os
+
+    from PIL import Image
+
+    from automagica.config import IconGraph
+
+    icons = IconGraph(color="#2196f3", cache_path=str(tmp_path))
+
+    img = icons.icon("play-solid.png")
+
+    original = Image.open(os.path.join(icons.icons_path, "play-solid.png"))
+    original, img = original.convert("RGBA"), img.convert("RGBA")
+
+    for x in range(original.size[0]):
+        for y in range(original.size[1]):
+            r, g, b, a = original.getpixel((x, y))
+
+            if r == g == b == 0:
+                assert img.getpixel((x, y)) == (33, 150, 243, a)
+            else:
+                assert img.getpixel((x, y)) == (r, g, b, a)
+
+    assert os.listdir(str(tmp_path)) == ["play-solid.png"]
+
+    cached = icons.icon("play-solid.png")
+
+    assert cached.convert("RGBA").tobytes() == img.tobytes()
+
+
+def test_activity_search():
+    """Activities are found by ranked, typo-tolerant search"""
+    from automagica.search import SearchIndex
+    from automagica.utilities import all_activities
+
+    activities = all_activities()
+
+    index = SearchIndex(
+        {
+            key: [
+                (activity["name"], 3),
+                (activity.get("class") or "", 2),
+                (" ".join(activity["keywords"]), 2),
+                (activity["description"], 1),
+            ]
+            for key, activity in activities.items()
+        }
+    )
+
+    # Every prefix typed so far finds activities
+    for query in ["e", "em", "ema", "emai", "email", "send email"]:
+        results = index.search(query)
+        assert results
+
+    names = [activities[key]["name"] for key in results]
+
+    assert names[0].startswith("Send e")
+    assert len(index.search("")) == len(activities)
+
+    # Typos and partial words
+    names = [activities[key]["name"] for key in index.search("scrensht")]
+    assert "Screenshot" in names
+
+    names = [activities[key]["name"] for key in index.search("xcel")]
+    assert any("Excel" in name for name in names)
+
+
+def test_search_startswith():
+    """Values are completed by prefix in alphabetical order"""
+    from automagica.search import SearchIndex
+
+    values = ["Banana", "apple", "Apricot", "avocado", "cherry"]
+    index = SearchIndex({value: [(value, 1)] for value in values})
+
+    assert index.startswith("a") == ["apple", "Apricot", "avocado"]
+    assert index.startswith("AP") == ["apple", "Apricot"]
+    assert index.startswith("") == [
+        "apple",
+        "Apricot",
+        "avocado",
+        "Banana",
+        "cherry",
+    ]
+    assert index.startswith("x") == []
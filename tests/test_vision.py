@@ -0,0 +1,260 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+
+import logging
+import time
+
+import pytest
+
+
+def draw_screen(buttons, size=(1280, 800)):
+    """Synthetic screenshot of a form with labelled buttons"""
+    from PIL import Image, ImageDraw
+
+    screen = Image.new("RGB", size, (240, 240, 240))
+    draw = ImageDraw.Draw(screen)
+
+    for i in range(0, size[1], 40):
+        draw.line((0, i, size[0], i), fill=(225, 225, 225))
+
+    for (x, y), label in buttons:
+        draw.rectangle((x, y, x + 90, y + 30), fill=(33, 150, 243))
+        draw.rectangle((x + 4, y + 4, x + 86, y + 26), outline=(9, 39, 64))
+        draw.text((x + 12, y + 9), label, fill=(255, 255, 255))
+
+    return screen
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """Local vision backend with a recorded 'Submit' button"""
+    from automagica.vision import LocalBackend, save_element
+
+    screen = draw_screen(
+        [((100, 100), "Name"), ((400, 300), "Submit"), ((700, 500), "Exit")]
+    )
+
+    save_element(
+        "submit",
+        screen,
+        target=(400, 300, 491, 331),
+        anchors=[(100, 100, 191, 131)],
+        path=str(tmp_path),
+    )
+
+    return LocalBackend(path=str(tmp_path))
+
+
+def test_local_detection(backend):
+    """Elements are found at their new location without the Portal"""
+    screen = draw_screen(
+        [((150, 120), "Name"), ((820, 640), "Submit"), ((300, 400), "Exit")]
+    )
+
+    backend.detect("submit", screen)  # Load the templates
+
+    start = time.perf_counter()
+    location = backend.detect("submit", screen)
+    duration = time.perf_counter() - start
+
+    assert location == [820, 640, 911, 671]
+    assert duration < 1
+
+
+def test_local_detection_scaled(backend):
+    """Elements are found on a screen with a different scaling"""
+    from PIL import Image
+
+    screen = draw_screen([((100, 100), "Name"), ((400, 300), "Submit")])
+    screen = screen.resize((1600, 1000), Image.BILINEAR)
+
+    left, top, right, bottom = backend.detect("submit", screen)
+
+    assert abs(left - 500) <= 2 and abs(top - 375) <= 2
+    assert abs(right - 614) <= 3 and abs(bottom - 414) <= 3
+
+
+def test_local_detection_anchors(backend):
+    """Anchors pick the right one of several identical elements"""
+    screen = draw_screen(
+        [
+            ((50, 600), "Submit"),
+            ((200, 200), "Name"),
+            ((500, 400), "Submit"),
+            ((1000, 100), "Submit"),
+        ]
+    )
+
+    assert backend.detect("submit", screen) == [500, 400, 591, 431]
+
+
+def test_local_detection_missing(backend):
+    """Missing elements raise an exception"""
+    screen = draw_screen([((100, 100), "Name"), ((700, 500), "Exit")])
+
+    with pytest.raises(Exception):
+        backend.detect("submit", screen)
+
+    with pytest.raises(Exception):
+        backend.detect("unknown", screen)
+
+
+def test_auto_backend_fallback(backend, monkeypatch, caplog):
+    """The auto backend falls back to the Portal if detection fails locally"""
+    from automagica import vision
+
+    class Portal(vision.VisionBackend):
+        def detect(self, automagica_id, screenshot, detect_target=True):
+            return "portal"
+
+    monkeypatch.setattr(
+        vision, "_BACKENDS", {"local": backend, "portal": Portal()}
+    )
+    auto = vision.AutoBackend()
+
+    screen = draw_screen([((820, 640), "Submit")])
+    assert auto.detect("submit", screen) == [820, 640, 911, 671]
+
+    screen = draw_screen([((700, 500), "Exit")])
+
+    with caplog.at_level(logging.DEBUG):
+        assert auto.detect("submit", screen) == "portal"
+
+    assert "Local detection of submit failed" in caplog.text
+    assert auto.detect("unknown", screen) == "portal"
+
+
+def test_detection_cache(backend, monkeypatch):
+    """Detections are reused while the screen around the element is the same"""
+    from automagica import vision
+
+    detections = []
+
+    class Counting(vision.VisionBackend):
+        def detect(self, automagica_id, screenshot, detect_target=True):
+            detections.append(automagica_id)
+            return backend.detect(automagica_id, screenshot, detect_target)
+
+    monkeypatch.setattr(vision, "get_vision_backend", Counting)
+    monkeypatch.setattr(vision, "detection_cache", vision.DetectionCache())
+
+    screen = draw_screen([((150, 120), "Name"), ((820, 640), "Submit")])
+
+    for _ in range(3):
+        location = vision.detect_element("submit", screen)
+
+    assert location == [820, 640, 911, 671]
+    assert len(detections) == 1
+
+    # Changes elsewhere on the screen keep the cached location
+    screen = draw_screen([((300, 300), "Exit"), ((820, 640), "Submit")])
+    assert vision.detect_element("submit", screen) == [820, 640, 911, 671]
+    assert len(detections) == 1
+
+    # Another element at the same place is detected again
+    screen = draw_screen([((300, 300), "Exit"), ((820, 640), "Cancel")])
+    with pytest.raises(Exception):
+        vision.detect_element("submit", screen)
+    assert len(detections) == 2
+
+    # The element moved, so it is detected again
+    screen = draw_screen([((150, 120), "Name"), ((400, 200), "Submit")])
+    assert vision.detect_element("submit", screen) == [400, 200, 491, 231]
+    assert len(detections) == 3
+
+    # Expired entries are detected again
+    vision.detection_cache.ttl = 0
+    time.sleep(0.01)
+    vision.detect_element("submit", screen)
+    assert len(detections) == 4
+
+
+def test_wait_element(backend, monkeypatch):
+    """Waits return shortly after the screen changed"""
+    from threading import Timer
+
+    import numpy as np
+
+    from automagica import vision
+
+    detections = []
+
+    class Counting(vision.VisionBackend):
+        def detect(self, automagica_id, screenshot, detect_target=True):
+            detections.append(automagica_id)
+            return backend.detect(automagica_id, screenshot, detect_target)
+
+        def detects_locally(self, automagica_id):
+            return True
+
+    monkeypatch.setattr(vision, "get_vision_backend", Counting)
+    monkeypatch.setattr(vision, "detection_cache", vision.DetectionCache())
+
+    # Frames as grabbed by the ScreenGrabber
+    empty = np.asarray(draw_screen([((150, 120), "Name")]))
+    form = np.asarray(
+        draw_screen([((150, 120), "Name"), ((820, 640), "Submit")])
+    )
+    screen = {"frame": empty}
+
+    def show(frame):
+        screen["frame"] = frame
+        screen["shown"] = time.monotonic()
+
+    Timer(0.5, show, args=(form,)).start()
+    location = vision.wait_element("submit", grab=lambda: screen["frame"])
+    latency = time.monotonic() - screen["shown"]
+
+    assert location == [820, 640, 911, 671]
+    assert latency < 0.1 + 0.1  # Detection itself takes tens of ms
+    assert len(detections) == 2  # Once at the start, once after the change
+
+    Timer(0.5, show, args=(empty,)).start()
+    assert (
+        vision.wait_element(
+            "submit", vanish=True, grab=lambda: screen["frame"]
+        )
+        is None
+    )
+
+    with pytest.raises(TimeoutError):
+        vision.wait_element("submit", timeout=0.3, grab=lambda: empty)
+
+    # Cached detections are not trusted while waiting
+    vision.detection_cache.add(("submit", True), empty, [150, 120, 241, 151])
+
+    with pytest.raises(TimeoutError):
+        vision.wait_element("submit", timeout=0.3, grab=lambda: empty)
+
+
+def test_wait_element_remote(monkeypatch):
+    """A changing screen does not flood remote backends with detections"""
+    import numpy as np
+
+    from automagica import vision
+
+    detections = []
+
+    class Remote(vision.VisionBackend):
+        def detect(self, automagica_id, screenshot, detect_target=True):
+            detections.append(automagica_id)
+            raise Exception("Not found")
+
+    monkeypatch.setattr(vision, "get_vision_backend", Remote)
+
+    frames = []
+
+    def grab():
+        # A clock ticking in the corner
+        frame = np.zeros((200, 320, 3), dtype=np.uint8)
+        frame[:10, :10] = len(frames) % 2 * 255
+        frames.append(frame)
+
+        return frame
+
+    with pytest.raises(TimeoutError):
+        vision.wait_element(
+            "submit", timeout=1, grab=grab, remote_interval=0.25
+        )
+
+    assert 3 <= len(detections) <= 5
+    assert len(frames) <= 6
@@ -0,0 +1,153 @@
+"""Copyright 2020 Oakwood Technologies BVBA"""
+import pytest
+
+from automagica.workers import WorkerPool
+
+
+@pytest.fixture
+def worker_pool():
+    """Worker pool without preloaded modules to keep the tests fast"""
+    pool = WorkerPool(max_jobs=3, preload=())
+
+    yield pool
+
+    pool.stop()
+
+
+def write_job(path, name, code):
+    """Create a job folder with a script"""
+    job_path = path / name
+    job_path.mkdir()
+
+    (job_path / "helper.py").write_text("VALUE = {!r}\n".format(name))
+    (job_path / "script.py").write_text(code)
+
+    return job_path
+
+
+def read_value(output, key):
+    """Read a "key: value" line printed by a job"""
+    for line in output.splitlines():
+        if line.startswith(key + ": "):
+            return line[len(key) + 2 :]
+
+
+def test_worker_pool_isolation(worker_pool, tmp_path):
+    """Jobs reuse a warm worker but get fresh globals and their own folder"""
+    code = (
+        "import os, helper\n"
+        "print('pid:', os.getpid())\n"
+        "print('cwd:', os.getcwd())\n"
+        "print('helper:', helper.VALUE)\n"
+        "print('leak:', 'LEAK' in globals())\n"
+        "LEAK = True\n"
+    )
+
+    outputs = []
+
+    for name in ("first", "second"):
+        job_path = write_job(tmp_path, name, code)
+        output, returncode = worker_pool.run(
+            "script", job_path / "script.py", job_path
+        )
+
+        assert returncode == 0
+        assert read_value(output, "cwd") == str(job_path)
+        assert read_value(output, "helper") == name
+        assert read_value(output, "leak") == "False"
+
+        outputs.append(output)
+
+    # Both jobs ran in the same warm process
+    assert read_value(outputs[0], "pid") == read_value(outputs[1], "pid")
+
+
+def test_worker_pool_failures(worker_pool, tmp_path):
+    """Failing jobs report their exit code and the worker is replaced"""
+    failing = write_job(tmp_path, "failing", "raise ValueError('Oops')")
+    exiting = write_job(tmp_path, "exiting", "import os\nos._exit(3)")
+    message = write_job(tmp_path, "message", "import sys\nsys.exit('Bye')")
+    working = write_job(tmp_path, "working", "print('Hello world')")
+
+    output, returncode = worker_pool.run(
+        "script", failing / "script.py", failing
+    )
+
+    assert returncode == 1
+    assert "ValueError: Oops" in output
+
+    _, returncode = worker_pool.run("script", exiting / "script.py", exiting)
+
+    assert returncode == 3
+
+    output, returncode = worker_pool.run(
+        "script", message / "script.py", message
+    )
+
+    assert returncode == 1
+    assert "Bye" in output
+
+    output, returncode = worker_pool.run(
+        "script", working / "script.py", working
+    )
+
+    assert returncode == 0
+    assert "Hello world" in output
+
+
+def test_worker_pool_recycle(worker_pool, tmp_path):
+    """Workers are recycled after max_jobs jobs"""
+    job_path = write_job(
+        tmp_path, "job", "import os\nprint('pid:', os.getpid())"
+    )
+
+    pids = set()
+
+    for _ in range(4):
+        output, _ = worker_pool.run("script", job_path / "script.py", job_path)
+        pids.add(read_value(output, "pid"))
+
+    assert len(pids) == 2
+
+
+def test_worker_pool_timeout(tmp_path):
+    """Workers running a job for too long are stopped and replaced"""
+    pool = WorkerPool(preload=(), timeout=1)
+
+    hanging = write_job(
+        tmp_path, "hanging", "import time\nprint('started')\ntime.sleep(60)"
+    )
+    working = write_job(tmp_path, "working", "print('Hello world')")
+
+    try:
+        output, returncode = pool.run("script", hanging / "script.py", hanging)
+
+        assert returncode != 0
+
+        output, returncode = pool.run("script", working / "script.py", working)
+
+        assert returncode == 0
+        assert "Hello world" in output
+
+    finally:
+        pool.stop()
+
+
+def test_worker_pool_flow(worker_pool, tmp_path):
+    """Flows run headless in the worker with the job parameters"""
+    from automagica.flow import Flow
+
+    (tmp_path / "input").mkdir()
+    (tmp_path / "input" / "parameters.py").write_text("name = 'world'")
+
+    flow = Flow()
+    node = flow.add_node("PythonCode")
+    node.code = "print('Hello ' + name)"
+    flow.save(str(tmp_path / "input" / "flow.json"))
+
+    output, returncode = worker_pool.run(
+        "flow", tmp_path / "input" / "flow.json", tmp_path
+    )
+
+    assert returncode == 0
+    assert "Hello world" in output